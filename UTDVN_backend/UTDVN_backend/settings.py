@@ -51,6 +51,7 @@ MIDDLEWARE = [
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
+    'UTDVN_database.middleware.RequestTimingMiddleware',
 ]
 
 ROOT_URLCONF = 'UTDVN_backend.urls'
@@ -121,6 +122,118 @@ else:
         },
     }
 
+# Options of UTDVN_database.solr.connection.SolrConnection and its pooled HTTP session
+HAYSTACK_CONNECTIONS['default'].update({
+    # Number of keep-alive connections kept open to Solr
+    'POOL_SIZE': 20,
+    # Seconds to wait for Solr to accept a connection
+    'CONNECT_TIMEOUT': 3,
+    # Seconds to wait for Solr to send a response
+    'TIMEOUT': 10,
+    # Number of times a search or schema request is retried when Solr does not accept the connection (read timeouts are not retried)
+    'MAX_RETRIES': 2,
+    # Number of connections kept open to Solr by the async views of each event loop
+    'ASYNC_POOL_SIZE': 200,
+    # Fetch the cores on first use instead of when the connection is created
+    'LAZY': True,
+    # Seconds after which the cores are refetched in the background
+    'CORES_REFRESH_INTERVAL': 60,
+    # Number of queued documents of a core inserted at once in bulk mode, e.g. by crawls
+    # (SolrConnection.QUEUE_THRESHOLD otherwise)
+    'BULK_QUEUE_THRESHOLD': 500,
+    # Approximate size in bytes of the queued documents of a core inserted at once
+    'QUEUE_MAX_BYTES': 5 * 1024 * 1024,
+    # Seconds to wait before inserting the queued documents of a core again after it failed, doubled after each failure
+    'RETRY_INTERVAL': 1,
+    # Maximum number of documents queued for a core while Solr fails to insert them, beyond which the oldest are dropped
+    # (SolrPipeline dumps them to SOLR_PIPELINE_FAILED_PATH)
+    'MAX_QUEUED': 5000,
+    # Milliseconds within which Solr commits documents inserted in bulk mode, soft commits each batch if None
+    'BULK_COMMIT_WITHIN': 10000,
+    # Number of most recent queries of each core the QTime, time and size percentiles of /api/stats are computed over,
+    # None to not record them
+    'QUERY_STATS_WINDOW': 1024,
+})
+
+# Allows pointing the backend at another Solr instance, e.g. a local stub used by benchmarks
+if 'SOLR_URL' in os.environ:
+    HAYSTACK_CONNECTIONS['default']['URL'] = os.environ['SOLR_URL']
+
+# Search
+# Maximum number of Solr cores queried concurrently across all search requests
+SEARCH_MAX_WORKERS = 16
+# Number of seconds a search request waits for the Solr cores to respond
+SEARCH_CORE_TIMEOUT = 10
+# Maximum number of search responses cached in memory by each process (0 disables the cache)
+SEARCH_CACHE_SIZE = 1024
+# Number of seconds a search response stays cached, even if the index did not change
+SEARCH_CACHE_TTL = 600
+# Number of seconds after which the schema of a core is fetched again, to flatten the fields it added since
+SCHEMA_REFRESH_INTERVAL = 300
+# Maximum number of return fields memoized by each process for the types and return parameters of requests (0 disables the memo)
+RETURN_FIELDS_CACHE_SIZE = 1024
+# Maximum number of flatten plans memoized by each process for the return fields of each core (0 disables the memo)
+FLATTEN_PLANS_CACHE_SIZE = 256
+# Minimum number of seconds between two checks of the index versions of the Solr cores
+SEARCH_CACHE_VERSION_CHECK_INTERVAL = 5
+# Query parser used for searches: 'standard' builds a query string boosting each field,
+# 'edismax' sends the fields and boosts below as edismax parameters so that Solr has less to parse
+SEARCH_QUERY_MODE = 'standard'
+# Fields searched in each core and their boosts
+SEARCH_FIELD_BOOSTS = {
+    'thesis': {
+        'id': 1,
+        'title': 10,
+        'author': 5,
+        'description': 8,
+        'advisor': 5,
+        'publisher': 4,
+        'keywords': 6,
+    },
+}
+# Fields also searched in each core when the query is a number
+SEARCH_NUMERIC_FIELD_BOOSTS = {
+    'thesis': {
+        'yearpub': 1,
+    },
+}
+# Fields boosted in edismax mode when the words of a multi-word query appear close together in them
+SEARCH_PHRASE_FIELD_BOOSTS = {
+    'thesis': {
+        'title': 20,
+        'description': 8,
+    },
+}
+# Maximum number of sanitized query strings memoized by each process (0 disables the memo)
+SANITIZE_CACHE_SIZE = 4096
+# Load the NLP models used to sanitize queries in the background when the WSGI or ASGI application (or runserver) starts
+SANITIZE_WARM_UP = True
+# Maximum number of rows of a streamed search (stream=true)
+SEARCH_STREAM_MAX_ROWS = 10000
+# Number of documents fetched from Solr at once by a streamed search
+SEARCH_STREAM_CHUNK_ROWS = 100
+# Number of bytes of highlighting a streamed search keeps in memory before spooling it to disk
+SEARCH_STREAM_SPOOL_SIZE = 256 * 1024
+# Maximum number of ids in a single /api/document request
+DOCUMENT_MAX_IDS = 100
+# JSON lines file the slow searches and a sample of all searches are logged to, e.g. logs/slow_queries.jsonl.
+# Searches are not logged unless it is set
+SLOW_QUERY_LOG_PATH = os.environ.get('SLOW_QUERY_LOG_PATH') or None
+# Number of seconds above which a search is logged, None to only log the sampled searches
+SLOW_QUERY_THRESHOLD = 1.0
+# Fraction of all searches logged whatever their time, to capture traffic that can be replayed
+SLOW_QUERY_SAMPLE_RATE = 0.01
+# Size in bytes at which the slow query log is rotated
+SLOW_QUERY_LOG_MAX_BYTES = 10 * 1024 * 1024
+# Number of rotated slow query logs kept
+SLOW_QUERY_LOG_BACKUP_COUNT = 5
+# Serve the cores, search and document endpoints with async views (only useful when served through ASGI)
+ASYNC_VIEWS = os.environ.get('ASYNC_VIEWS', '') == '1'
+# Time the phases of search and document requests, sent in a Server-Timing header and served by /api/metrics
+REQUEST_TIMING = True
+# Upper bounds in seconds of the buckets of the histograms of phase durations served by /api/metrics
+REQUEST_TIMING_BUCKETS = [0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10]
+
 CORS_ORIGIN_WHITELIST = (
     'http://localhost:8080',
 )
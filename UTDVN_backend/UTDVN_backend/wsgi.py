@@ -14,3 +14,6 @@ from django.core.wsgi import get_wsgi_application
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'UTDVN_backend.settings')
 
 application = get_wsgi_application()
+
+from UTDVN_database.apps import start_query_warm_up
+start_query_warm_up()
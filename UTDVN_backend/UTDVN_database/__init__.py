@@ -0,0 +1 @@
+default_app_config = 'UTDVN_database.apps.UtdvnDatabaseConfig'
@@ -1,5 +1,29 @@
+import logging
+import threading
 from django.apps import AppConfig
 
+logger = logging.getLogger(__name__)
+
 
 class UtdvnDatabaseConfig(AppConfig):
     name = 'UTDVN_database'
+
+
+def start_query_warm_up():
+    """
+    Starts loading the NLP models used to sanitize queries on a background thread if SANITIZE_WARM_UP is set,
+    so that neither startup nor the first searches wait for them.
+    Called by the WSGI and ASGI applications, which runserver also loads, so that management commands,
+    tests and crawlers setting up Django do not load the models.
+    """
+    from UTDVN_backend.settings import SANITIZE_WARM_UP
+    if SANITIZE_WARM_UP:
+        threading.Thread(target=_warm_up_query, name='query-warm-up', daemon=True).start()
+
+def _warm_up_query():
+    from .solr import query
+    try:
+        query.warm_up()
+    except LookupError as le:
+        # Raised by nltk when its data is not downloaded, in which case searches will fail the same way
+        logger.warning('Could not warm up query sanitization: %s', le)
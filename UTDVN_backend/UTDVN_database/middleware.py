@@ -0,0 +1,83 @@
+import asyncio
+import time
+from django.core.exceptions import MiddlewareNotUsed
+from .solr import timing
+from UTDVN_backend.settings import REQUEST_TIMING
+
+class RequestTimingMiddleware(object):
+    """
+    Times the phases of the search and document views, when REQUEST_TIMING is set.
+
+    The phases are recorded by the views with solr.timing.phase, along with a 'total' phase covering the whole request
+    from this middleware on.
+    They are sent in the Server-Timing header of the response and added to solr.timing.PHASE_HISTOGRAMS,
+    which /api/metrics serves. For a streamed search, only the phases before the response starts are timed.
+    When REQUEST_TIMING is not set, Django leaves the middleware out and recording a phase is a no-op.
+
+    The middleware supports both sync and async requests, so that Django does not run the async views
+    served through ASGI in a thread, one request at a time.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    # The names of the timed views, by function name
+    TIMED_VIEWS = {
+        'search': 'search',
+        'async_search': 'search',
+        'document': 'document',
+        'async_document': 'document',
+    }
+
+    def __init__(self, get_response):
+        if not REQUEST_TIMING:
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        if asyncio.iscoroutinefunction(get_response):
+            # Makes Django await this middleware, as MiddlewareMixin does
+            self._is_coroutine = asyncio.coroutines._is_coroutine
+
+    def __call__(self, request):
+        if asyncio.iscoroutinefunction(self.get_response):
+            return self.__acall__(request)
+
+        token = self._start(request)
+        try:
+            response = self.get_response(request)
+        finally:
+            request.timer.deactivate(token)
+        return self._finish(request, response)
+
+    async def __acall__(self, request):
+        """
+        Async version of __call__, used when the middleware is called by the ASGI handler.
+        """
+        token = self._start(request)
+        try:
+            response = await self.get_response(request)
+        finally:
+            request.timer.deactivate(token)
+        return self._finish(request, response)
+
+    def _start(self, request):
+        # The view is only known once the URL is resolved, so the timer is named in _finish
+        request.timer = timing.RequestTimer(None)
+        request.timer_start = time.perf_counter()
+        return request.timer.activate()
+
+    def _finish(self, request, response):
+        """
+        Adds the Server-Timing header to the response of a timed view and records its phases.
+        The view is looked up from the URL match rather than in process_view, which Django would run
+        in a thread for async requests.
+        """
+        match = getattr(request, 'resolver_match', None)
+        view = self.TIMED_VIEWS.get(match.func.__name__) if match is not None else None
+        if view is None or match.func.__module__ != 'UTDVN_database.views':
+            return response
+
+        request.timer.view = view
+        request.timer.add('total', time.perf_counter() - request.timer_start)
+        response['Server-Timing'] = request.timer.server_timing()
+        timing.PHASE_HISTOGRAMS.observe_timer(request.timer)
+        return response
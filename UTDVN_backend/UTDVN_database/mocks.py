@@ -1,25 +1,26 @@
-import json
-
 class MockSolr(object):
     def __init__(self):
         pass
     
-    def add(self, docs, commit=True):
+    def add(self, docs, commit=True, **kwargs):
         return docs
+    
+    def commit(self, **kwargs):
+        return 'committed'
 
 class MockAdmin(object):
-    def __init__(self, cores):
+    def __init__(self, cores, versions=None):
         self.cores = cores
+        self.versions = versions if versions is not None else {}
     
-    def status(self):
-        status_reponse = {
-            "status": {}
-        }
-        
+    def core_status(self):
+        status = {}
         for core in self.cores:
-            status_reponse["status"][core] = core
-            
-        return json.dumps(status_reponse)
+            status[core] = {
+                "name": core,
+                "index": {"version": self.versions.get(core, 1)}
+            }
+        return status
     
 class MockResponse(object):
     def __init__(self, content):
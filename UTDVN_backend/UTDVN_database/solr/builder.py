@@ -1,5 +1,7 @@
 from . import models
 from .query import Query
+from UTDVN_backend.settings import SEARCH_QUERY_MODE, SEARCH_FIELD_BOOSTS, SEARCH_NUMERIC_FIELD_BOOSTS, \
+    SEARCH_PHRASE_FIELD_BOOSTS
 
 def build_cores(cores, solr_cores):
     """
@@ -19,55 +21,102 @@ def build_cores(cores, solr_cores):
         
     return core_list
 
-def build_return_fields(fields, types):
+def build_cursor_marks(cursor, cores):
+    """
+    Builds the cursor mark of each core to search from the 'cursor' parameter of a search request.
+    The parameter is either a single mark used for every core, like '*' to start paging,
+    or the 'nextCursor' of the previous response, which lists the mark of each core as 'core:mark,...'.
+    Raises an exception if any core has no mark.
+    """
+    if ':' not in cursor:
+        return {core: cursor for core in cores}
+    
+    marks = {}
+    for core_mark in cursor.split(','):
+        core, _, mark = core_mark.partition(':')
+        marks[core] = mark
+    missing_core_list = [core for core in cores if marks.get(core, '') == '']
+    if len(missing_core_list) > 0:
+        raise ValueError('No cursor mark for type(s): ' + ','.join(missing_core_list))
+    
+    return {core: marks[core] for core in cores}
+
+def build_return_fields(fields, types, valid_fields=None):
     """
     Builds a string listing the fields to return based on types.
+    The fields that can be returned are valid_fields, all of them by default,
+    or the fields of the models of the types if it is not given.
     Raises an exception if any field is not available.
+    -------
+    See SchemaRegistry.build_return_fields, which takes the valid fields from the Solr schemas
+    and memoizes the result.
     """
     if types == ['test']:
         return fields
     
     return_fields = ','.join([field for field in models.SolrDocument.doc.keys() if field != 'type'])
     field_list = fields.split(',')
-    valid_field_list = models.get_models_fields(types)
+    valid_field_list = valid_fields if valid_fields is not None else models.get_models_fields(types)
     if len(valid_field_list) == 0:
         raise ValueError('Invalid type(s) requested: ' + ','.join(types))
     
     if fields == '':
         return ','.join(valid_field_list)
     
-    invalid_field_list = [field for field in field_list if field not in valid_field_list]
+    valid_field_set = frozenset(valid_field_list)
+    invalid_field_list = [field for field in field_list if field not in valid_field_set]
     if len(invalid_field_list) > 0:
         raise ValueError('Invalid return field(s) requested: ' + ','.join(invalid_field_list))
         
     return return_fields + ',' + ','.join(field_list)
 
-def build_search_query(core, query_str, base_kwargs):
+def build_search_query(core, query_str, base_kwargs, mode=None):
     """
+    Parameters
+    ----------
+    core : string
+        The name of the Solr core.
+    query_str : string
+        The query string.
+    base_kwargs : dict
+        Keyword arguments of SolrConnection.query to build upon.
+    mode : string, optional
+        'standard' to search the fields of the core with a query string boosting each field,
+        or 'edismax' to send the fields and their boosts as parameters of the edismax query parser instead.
+        The default is SEARCH_QUERY_MODE.
+
     Builds a search query and parameters to return the best results from the given core.
+    Fields and boosts of each core are defined in SEARCH_FIELD_BOOSTS.
+    When base_kwargs has a 'cursor_mark', the sort is given an 'id asc' tiebreak to page with a cursor.
     -------
-    See https://lucene.apache.org/solr/guide/8_4/the-standard-query-parser.html for more details.
+    See https://lucene.apache.org/solr/guide/8_4/the-standard-query-parser.html
+    and https://lucene.apache.org/solr/guide/8_4/the-extended-dismax-query-parser.html for more details.
     """
+    if mode is None:
+        mode = SEARCH_QUERY_MODE
+    if mode not in ['standard', 'edismax']:
+        raise ValueError('Invalid query mode: ' + mode)
+    
     kwargs = base_kwargs.copy()
     if ' ' in query_str:
         query = Query(query_str, as_phrase=True, sanitize=True).fuzz(0)
     else:
         query = Query(query_str, as_phrase=False, escape=(query_str!='*'))
             
-    if core == 'thesis':
-        fields = {
-            'id': 1,
-            'title': 10,
-            'author': 5,
-            'description': 8,
-            'advisor': 5,
-            'publisher': 4,
-            'keywords': 6,
-        }
+    if core in SEARCH_FIELD_BOOSTS:
+        fields = SEARCH_FIELD_BOOSTS[core]
         if query_str.isdigit():
-            fields['yearpub'] = 1
-            
-        query = query.for_fields(fields)
+            fields = dict(fields, **SEARCH_NUMERIC_FIELD_BOOSTS.get(core, {}))
+        
+        if mode == 'edismax':
+            if query_str == '*':
+                query = Query('*:*', as_phrase=False)
+            kwargs['def_type'] = 'edismax'
+            kwargs['query_fields'] = _boosts_param(fields)
+            if ' ' in query_str:
+                kwargs['phrase_fields'] = _boosts_param(SEARCH_PHRASE_FIELD_BOOSTS.get(core, {}))
+        else:
+            query = query.for_fields(fields)
         kwargs['default_field'] = 'title'
         kwargs['highlight_fields'] = 'title,description'
         
@@ -77,9 +126,31 @@ def build_search_query(core, query_str, base_kwargs):
     else:
         #'test' core
         query = Query(query_str, as_phrase=False)
+    
+    if kwargs.get('cursor_mark', '') != '':
+        kwargs['sort'] = _with_id_tiebreak(kwargs.get('sort', ''))
         
     return (str(query), kwargs)
 
+def _with_id_tiebreak(sort):
+    """
+    Appends 'id asc' to a sort that does not include the 'id' field yet,
+    as Solr requires the unique key to be sorted on to page with a cursor.
+    An empty sort becomes 'score desc, id asc', the order Solr would use by default.
+    """
+    sort_fields = [clause.split()[0] for clause in sort.split(',') if clause.strip() != '']
+    if 'id' in sort_fields:
+        return sort
+    if sort_fields == []:
+        return 'score desc, id asc'
+    return sort + ', id asc'
+
+def _boosts_param(fields):
+    """
+    Formats a dictionary of field names and boost factors as an edismax 'qf' or 'pf' parameter.
+    """
+    return ' '.join('%s^%s' % (field, boost) for field, boost in fields.items())
+
 def build_document_query(doc_id, base_kwargs):
     """
     Builds a search query and parameters to find the document with the given doc_id
@@ -114,4 +185,25 @@ def flatten_doc(doc, return_fields, exceptions=None):
             continue
         else:
             doc[field] = doc[field][0] if len(doc[field]) == 1 else doc[field]
-    return doc
\ No newline at end of file
+    return doc
+
+def flatten_docs(docs, plan):
+    """
+    Parameters
+    ----------
+    docs : list
+        The documents in the Solr response.
+    plan : tuple
+        The names of the fields to flatten, from SchemaRegistry.flatten_plan.
+
+    Flattens the single-item lists of the fields of the plan in every document, in place.
+    Unlike flatten_doc, the fields are not split from the return fields again for every document
+    and fields Solr returns as single values or that are returned as lists are not in the plan.
+    Returns the documents.
+    """
+    for doc in docs:
+        for field in plan:
+            value = doc.get(field)
+            if type(value) is list and len(value) == 1:
+                doc[field] = value[0]
+    return docs
\ No newline at end of file
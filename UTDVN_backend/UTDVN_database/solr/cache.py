@@ -0,0 +1,207 @@
+import threading
+import time
+import requests
+from collections import OrderedDict
+
+class LRUCache(object):
+    """
+    Parameters
+    ----------
+    maxsize : int
+        The maximum number of entries. The cache stores nothing if it is 0.
+    ttl : float, optional
+        Number of seconds after which an entry expires. Entries never expire by default.
+
+    A thread-safe least-recently-used cache that counts hits, misses, evictions and expirations.
+    """
+
+    def __init__(self, maxsize, ttl=None):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    def __len__(self):
+        return len(self.entries)
+
+    def get(self, key, default=None):
+        """
+        Returns the value cached for key and marks it as most recently used,
+        or returns default if key is not cached or has expired.
+        """
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return default
+
+            value, expires_at = entry
+            if expires_at is not None and expires_at <= time.monotonic():
+                del self.entries[key]
+                self.expirations += 1
+                self.misses += 1
+                return default
+
+            self.entries.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def set(self, key, value):
+        """
+        Caches value for key, evicting the least recently used entry if the cache is full.
+        """
+        if self.maxsize <= 0:
+            return
+
+        expires_at = time.monotonic() + self.ttl if self.ttl is not None else None
+        with self.lock:
+            self.entries[key] = (value, expires_at)
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.maxsize:
+                self.entries.popitem(last=False)
+                self.evictions += 1
+
+    def clear(self):
+        """
+        Removes all entries without resetting the counters.
+        """
+        with self.lock:
+            self.entries.clear()
+
+    def stats(self):
+        """
+        Returns a dictionary of the size of the cache and its counters.
+        """
+        with self.lock:
+            return {
+                'size': len(self.entries),
+                'maxsize': self.maxsize,
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'expirations': self.expirations,
+            }
+
+class SearchCache(object):
+    """
+    Parameters
+    ----------
+    solr_connection : SolrConnection
+        The connection whose index changes invalidate the cache.
+    maxsize : int
+        The maximum number of cached responses. Caching is disabled if it is 0.
+    ttl : float, optional
+        Number of seconds a response is cached for. Responses never expire by default.
+    version_check_interval : float, optional
+        Minimum number of seconds between two requests to Solr for the index versions of the cores.
+
+    Caches search responses until the Solr index changes.
+    The whole cache is invalidated when the connection commits documents or optimizes a core,
+    or when the index version of a core reported by Solr changes (e.g. after the crawler ran in another process).
+    Index versions are checked on a background thread, so requests never wait for Solr to report them.
+    -------
+    Example Usage:
+        key = SearchCache.make_key(request.GET)
+        response = cache.get(key)
+        if response is None:
+            generation = cache.generation
+            response = ...
+            cache.set(key, response, generation)
+    """
+
+    # The request parameters that affect a search response.
+    PARAMS = ['types', 'q', 'sort', 'start', 'rows', 'return', 'cursor', 'raw']
+
+    def __init__(self, solr_connection, maxsize, ttl=None, version_check_interval=5):
+        self.solr_connection = solr_connection
+        self.cache = LRUCache(maxsize, ttl)
+        self.version_check_interval = version_check_interval
+        self.index_versions = None
+        self.next_version_check = 0
+        self.version_lock = threading.Lock()
+        # Incremented on each invalidation so that responses computed from an older index are not cached.
+        self.generation = 0
+        self.invalidations = 0
+        self.generation_lock = threading.Lock()
+        solr_connection.add_change_listener(self.invalidate)
+
+    @classmethod
+    def make_key(cls, params):
+        """
+        Returns a hashable key for the search parameters in the given QueryDict or dictionary.
+        Parameters that do not affect the response are ignored and whitespace in 'sort' is normalized.
+        Other values are kept as is since they are validated as is.
+        """
+        key = []
+        for param in cls.PARAMS:
+            value = params.get(param, '')
+            if param == 'sort':
+                value = ','.join(' '.join(part.split()) for part in value.split(','))
+            key.append(value)
+        return tuple(key)
+
+    def get(self, key):
+        """
+        Returns the response cached for key or None.
+        """
+        if self.cache.maxsize <= 0:
+            return None
+
+        self._check_index_versions()
+        return self.cache.get(key)
+
+    def set(self, key, response, generation):
+        """
+        Caches the response for key unless the cache was invalidated since generation was read.
+        """
+        # Checked and cached under the lock, so that an invalidation cannot clear the cache in between
+        with self.generation_lock:
+            if generation == self.generation:
+                self.cache.set(key, response)
+
+    def invalidate(self, core_name=None):
+        """
+        Removes all cached responses.
+        """
+        with self.generation_lock:
+            self.generation += 1
+            self.invalidations += 1
+        self.cache.clear()
+
+    def stats(self):
+        """
+        Returns a dictionary of the size of the cache and its counters.
+        """
+        stats = self.cache.stats()
+        stats['invalidations'] = self.invalidations
+        return stats
+
+    def _check_index_versions(self):
+        """
+        Starts checking the index versions of the cores on a background thread,
+        once every version_check_interval seconds and unless a check is already running.
+        """
+        if time.monotonic() < self.next_version_check or not self.version_lock.acquire(blocking=False):
+            return
+
+        self.next_version_check = time.monotonic() + self.version_check_interval
+        threading.Thread(target=self._check_and_release, name='solr-index-versions', daemon=True).start()
+
+    def _check_and_release(self):
+        """
+        Invalidates the cache if the index version of any core changed since the last check.
+        If Solr cannot be reached, cached responses keep being served.
+        """
+        try:
+            index_versions = self.solr_connection.fetch_index_versions()
+            if self.index_versions is not None and index_versions != self.index_versions:
+                self.invalidate()
+            self.index_versions = index_versions
+        except (requests.exceptions.RequestException, ValueError, KeyError):
+            pass
+        finally:
+            self.version_lock.release()
@@ -1,35 +1,263 @@
+import aiohttp
+import asyncio
 import pysolr
 import json
+import logging
 import requests
+import threading
+import time
+import weakref
+import yarl
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+from .stats import QueryStats
+
+logger = logging.getLogger(__name__)
 
 class SolrConnection(object):
     
-    # The maximum number of documents held in a core's insert queue before automatically inserted.
+    # The default maximum number of documents held in a core's insert queue before automatically inserted.
     QUEUE_THRESHOLD = 100
+    # The default number of seconds add_document waits before inserting a queue again after it failed,
+    # doubled after each failure in a row up to MAX_RETRY_INTERVAL.
+    RETRY_INTERVAL = 1
+    MAX_RETRY_INTERVAL = 60
+    # The number of seconds for which the cores are not fetched again after fetching them on first use failed.
+    LOAD_RETRY_INTERVAL = 5
     
-    def __init__(self, url):
+    def __init__(self, url, pool_size=10, connect_timeout=3, read_timeout=10, max_retries=2, async_pool_size=100,
+                 lazy=False, refresh_interval=None, queue_threshold=None, queue_max_bytes=None, 
+                 bulk_commit_within=None, query_stats_window=None, retry_interval=None, max_queued=None,
+                 bulk_queue_threshold=None):
         """
         Creates a SolrConnection from the given base Solr url of the form 
         'http://solrhostname:solrport/solr'.
+        All requests to Solr share one session keeping up to pool_size connections alive.
+        Idempotent requests (searches, schema fetches) are retried up to max_retries times
+        when Solr does not accept the connection, while updates and requests that timed out
+        reading the response are never retried.
+        Asynchronous queries use a separate aiohttp session for each event loop with up to
+        async_pool_size concurrent connections.
+        If lazy is True, the cores are fetched from Solr on first use instead of here, and if that fails,
+        uses within the next LOAD_RETRY_INTERVAL seconds raise the same error without asking Solr again.
+        If refresh_interval is set, the cores are refetched in the background once they are
+        older than refresh_interval seconds, and the last known cores are kept if that fails.
+        Queued documents are inserted once a core's queue holds queue_threshold documents
+        (QUEUE_THRESHOLD by default) or, if queue_max_bytes is set, about that many bytes of JSON.
+        In bulk mode, bulk_queue_threshold documents are inserted at once instead if it is set.
+        Documents that failed to be inserted stay queued, and add_document waits retry_interval seconds
+        (RETRY_INTERVAL by default), doubled after each failure in a row, before inserting them again.
+        If max_queued is set, a core's queue holds at most that many documents: the oldest ones are
+        passed to the overflow listeners instead (see add_overflow_listener), or dropped if there are none.
+        In bulk mode, inserted documents are committed by Solr within bulk_commit_within milliseconds,
+        or soft committed right away if it is not set, and hard committed once when the run finishes.
+        If query_stats_window is set, the QTime, time and response size of queries are recorded in query_stats,
+        which computes the percentiles of each core over its last query_stats_window queries.
         """
         self.url = url
-        self.solr = pysolr.Solr(url, timeout=10)
-        self.admin = pysolr.SolrCoreAdmin(url + '/admin/cores')  
-        self.cores = {}
+        self.timeout = (connect_timeout, read_timeout)
+        self.session = self._create_session(pool_size, max_retries)
+        self.async_pool_size = async_pool_size
+        # aiohttp session of each event loop, dropped with the loop
+        self.async_sessions = weakref.WeakKeyDictionary()
+        self.solr = self._create_client(url)
         self.queues = {}
+        self.queue_bytes = {}
+        self.queue_threshold = queue_threshold if queue_threshold is not None else self.QUEUE_THRESHOLD
+        self.queue_max_bytes = queue_max_bytes
+        self.bulk_queue_threshold = bulk_queue_threshold
+        self.retry_interval = retry_interval if retry_interval is not None else self.RETRY_INTERVAL
+        self.max_queued = max_queued
+        # (time before which add_document does not insert the queue, last interval) by core, after failures
+        self.retries = {}
+        self.overflow_listeners = []
+        self.bulk = False
+        self.bulk_commit_within = bulk_commit_within
+        self.bulk_cores = set()
+        self.change_listeners = []
+        self.refresh_interval = refresh_interval
+        self._cores = None
+        self._next_refresh = 0
+        # Error of the last failed fetch on first use, raised again until _next_refresh
+        self._load_error = None
+        self._load_lock = threading.Lock()
+        self._refresh_lock = threading.Lock()
+        self.query_stats = QueryStats(query_stats_window) if query_stats_window else None
 
-        for core_name in self.fetch_core_names():
-            self.cores[core_name] = pysolr.Solr(self.url + '/' + core_name)
-            self.queues[core_name] = list()
+        if not lazy:
+            self.refresh_cores()
+    
+    @classmethod
+    def from_config(cls, config):
+        """
+        Creates a SolrConnection from a connection defined in HAYSTACK_CONNECTIONS.
+        """
+        return cls(
+            config['URL'],
+            pool_size=config.get('POOL_SIZE', 10),
+            connect_timeout=config.get('CONNECT_TIMEOUT', 3),
+            read_timeout=config.get('TIMEOUT', 10),
+            max_retries=config.get('MAX_RETRIES', 2),
+            async_pool_size=config.get('ASYNC_POOL_SIZE', 100),
+            lazy=config.get('LAZY', False),
+            refresh_interval=config.get('CORES_REFRESH_INTERVAL'),
+            queue_threshold=config.get('QUEUE_THRESHOLD'),
+            queue_max_bytes=config.get('QUEUE_MAX_BYTES'),
+            bulk_commit_within=config.get('BULK_COMMIT_WITHIN'),
+            query_stats_window=config.get('QUERY_STATS_WINDOW'),
+            retry_interval=config.get('RETRY_INTERVAL'),
+            max_queued=config.get('MAX_QUEUED'),
+            bulk_queue_threshold=config.get('BULK_QUEUE_THRESHOLD'))
+    
+    @property
+    def cores(self):
+        """
+        A dictionary mapping the name of each core to its pysolr client.
+        The cores are fetched from Solr on first use, which raises if Solr cannot be reached,
+        and keeps raising for LOAD_RETRY_INTERVAL seconds so that requests do not each wait for Solr.
+        Afterwards, they are refreshed in the background every refresh_interval seconds if it is set.
+        """
+        cores = self._cores
+        if cores is None:
+            with self._load_lock:
+                if self._cores is None:
+                    self._load_cores()
+            return self._cores
+        
+        if self.refresh_interval is not None and time.monotonic() >= self._next_refresh:
+            self._refresh_in_background()
+        return cores
+    
+    def _load_cores(self):
+        """
+        Fetches the cores on first use, or raises the error of the last attempt if it failed
+        less than LOAD_RETRY_INTERVAL seconds ago. Must be called with _load_lock held.
+        """
+        if self._load_error is not None and time.monotonic() < self._next_refresh:
+            raise self._load_error.with_traceback(None)
+        try:
+            self.refresh_cores()
+        except (requests.exceptions.RequestException, ValueError, KeyError) as e:
+            self._load_error = e
+            self._next_refresh = time.monotonic() + self.LOAD_RETRY_INTERVAL
+            raise
+        self._load_error = None
+    
+    def refresh_cores(self):
+        """
+        Fetches the core names from Solr and replaces the known cores by them.
+        Clients and insert queues of cores that are still there are kept.
+        Returns the list of core names.
+        """
+        core_names = self.fetch_core_names()
+        old_cores = self._cores if self._cores is not None else {}
+        new_cores = {}
+        for core_name in core_names:
+            if core_name in old_cores:
+                new_cores[core_name] = old_cores[core_name]
+            else:
+                new_cores[core_name] = self._create_client(self.url + '/' + core_name)
+            self.queues.setdefault(core_name, list())
+        
+        self._cores = new_cores
+        self._next_refresh = time.monotonic() + (self.refresh_interval or 0)
+        return core_names
+    
+    def _refresh_in_background(self):
+        """
+        Starts refreshing the cores on a background thread unless a refresh is already running.
+        """
+        if not self._refresh_lock.acquire(blocking=False):
+            return
+        
+        # Postponed so that a failing Solr is not asked again on every access
+        self._next_refresh = time.monotonic() + self.refresh_interval
+        threading.Thread(target=self._refresh_and_release, name='solr-cores-refresh', daemon=True).start()
+    
+    def _refresh_and_release(self):
+        """
+        Refreshes the cores, keeping the last known ones if Solr cannot be reached.
+        """
+        try:
+            self.refresh_cores()
+        except (requests.exceptions.RequestException, ValueError, KeyError):
+            pass
+        finally:
+            self._refresh_lock.release()
+    
+    def _create_session(self, pool_size, max_retries):
+        """
+        Returns a session pooling keep-alive connections to Solr.
+        Requests are only retried when Solr does not accept the connection, not after a read timeout,
+        so that a slow Solr is not queried again after its caller gave up.
+        Retry only retries idempotent methods by default, so updates sent with POST are never repeated.
+        """
+        retry = Retry(total=max_retries, connect=max_retries, read=0, status=0, backoff_factor=0.1)
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size, max_retries=retry)
+        session = requests.Session()
+        session.mount('http://', adapter)
+        session.mount('https://', adapter)
+        return session
+    
+    def _create_client(self, url):
+        """
+        Returns a pysolr client for the given url that sends its requests through the shared session.
+        """
+        client = pysolr.Solr(url, timeout=self.timeout)
+        client.session = self.session
+        return client
 
     def fetch_core_names(self):
         """
         Makes a request to Solr and returns an array of strings 
         where each string is the name of a core in the response from Solr.
         """
-        status_response = self.admin.status()
-        status = json.loads(status_response)
-        return [core_name for core_name in status['status']]
+        return [core_name for core_name in self.fetch_core_status()]
+
+    def fetch_core_status(self):
+        """
+        Makes a request to the CoreAdmin API of Solr through the pooled session, with its timeouts,
+        and returns a dictionary mapping each core name to its status.
+        -------
+        See https://lucene.apache.org/solr/guide/8_4/coreadmin-api.html for more details.
+        """
+        response = self._get_url('%s/admin/cores' % self.url, {'action': 'STATUS', 'wt': 'json'})
+        return response['status']
+
+    def fetch_index_versions(self):
+        """
+        Makes a request to Solr and returns a dictionary mapping each core name to the version of its index,
+        which changes every time a commit makes changes to the index visible.
+        """
+        status = self.fetch_core_status()
+        return {core_name: status[core_name]['index']['version'] for core_name in status}
+
+    def add_change_listener(self, listener):
+        """
+        Registers a function called with the core name after documents are committed to a core
+        or after a core is optimized through this connection.
+        """
+        self.change_listeners.append(listener)
+
+    def _notify_change(self, core_name):
+        """
+        Calls all registered change listeners with the given core name.
+        """
+        for listener in self.change_listeners:
+            listener(core_name)
+
+    def add_overflow_listener(self, listener):
+        """
+        Registers a function called with the core name and the list of documents removed from its queue
+        when it holds more than max_queued documents, e.g. to save them somewhere else.
+        """
+        self.overflow_listeners.append(listener)
+
+    def has_cores(self):
+        """
+        Returns whether the cores were fetched from Solr, so that get_core_names does not wait for it.
+        """
+        return self._cores is not None
 
     def get_core_names(self):
         """
@@ -46,8 +274,69 @@ class SolrConnection(object):
         Makes a request to the given url relative to the base url with the given parameters and
         returns the JSON response.
         """
-        response = requests.get(url, params=pysolr.safe_urlencode(params))
-        return response.json()
+        return self._get_url_sized(url, params)[0]
+
+    def _get_url_sized(self, url, params):
+        """
+        Same as _get_url, but returns the JSON response and its size in bytes.
+        """
+        response = self.session.get(url, params=pysolr.safe_urlencode(params), timeout=self.timeout)
+        return (response.json(), len(response.content))
+
+    async def _aget_url(self, url, params):
+        """
+        Asynchronous version of _get_url using the aiohttp session of the running event loop.
+        """
+        return (await self._aget_url_sized(url, params))[0]
+
+    async def _aget_url_sized(self, url, params):
+        """
+        Asynchronous version of _get_url_sized.
+        """
+        session = self._get_async_session()
+        full_url = yarl.URL('%s?%s' % (url, pysolr.safe_urlencode(params)), encoded=True)
+        async with session.get(full_url) as response:
+            body = await response.read()
+            return (json.loads(body), len(body))
+
+    def _get_url_raw(self, url, params):
+        """
+        Same as _get_url, but returns the HTTP status and the undecoded body of the response.
+        """
+        response = self.session.get(url, params=pysolr.safe_urlencode(params), timeout=self.timeout)
+        return (response.status_code, response.content)
+
+    async def _aget_url_raw(self, url, params):
+        """
+        Asynchronous version of _get_url_raw.
+        """
+        session = self._get_async_session()
+        full_url = yarl.URL('%s?%s' % (url, pysolr.safe_urlencode(params)), encoded=True)
+        async with session.get(full_url) as response:
+            return (response.status, await response.read())
+    
+    def _get_async_session(self):
+        """
+        Returns the aiohttp session pooling connections to Solr for the running event loop.
+        aiohttp sessions cannot be shared between event loops, so each loop gets its own session,
+        which is kept until it is closed by aclose or the loop is garbage collected.
+        """
+        loop = asyncio.get_running_loop()
+        session = self.async_sessions.get(loop)
+        if session is None or session.closed:
+            connector = aiohttp.TCPConnector(limit=self.async_pool_size)
+            timeout = aiohttp.ClientTimeout(sock_connect=self.timeout[0], sock_read=self.timeout[1])
+            session = self.async_sessions[loop] = aiohttp.ClientSession(connector=connector, timeout=timeout)
+        return session
+
+    async def aclose(self):
+        """
+        Closes the aiohttp session of the running event loop, if any.
+        Must be awaited before the event loop is closed, e.g. at the end of asyncio.run.
+        """
+        session = self.async_sessions.pop(asyncio.get_running_loop(), None)
+        if session is not None:
+            await session.close()
 
     def fetch_schema(self, core_name):
         """
@@ -57,31 +346,86 @@ class SolrConnection(object):
         response = self._get_url('%s/%s/schema' % (self.url, core_name), {})
         return response['schema']
 
-    def add_documents(self, core_name, documents, commit=True):
+    def add_documents(self, core_name, documents, commit=True, soft_commit=False, commit_within=None):
         """
         Adds list of documents into the solr core and
         returns Solr response.
+        The documents are hard committed if commit is True, soft committed if soft_commit is True,
+        or committed by Solr within commit_within milliseconds if it is set.
         """
         self._validate_core(core_name)
         print('Adding %d documents into core %s' % (len(documents), core_name))
-        return self.cores[core_name].add(documents, commit=commit)
+        add_kwargs = {'commit': commit}
+        if soft_commit:
+            add_kwargs['softCommit'] = True
+        if commit_within is not None:
+            # pysolr writes it as an XML attribute, which must be a string
+            add_kwargs['commitWithin'] = str(commit_within)
+        response = self.cores[core_name].add(documents, **add_kwargs)
+        if commit or soft_commit:
+            self._notify_change(core_name)
+        return response
+    
+    def post_documents(self, core_name, documents, commit=False):
+        """
+        Adds list of documents into the solr core through its JSON update handler and
+        returns Solr response.
+        Unlike add_documents, which sends the XML messages built by pysolr, the request body
+        is a single JSON dump, which is far cheaper to build for large batches.
+        The documents are hard committed if commit is True.
+        Raises pysolr.SolrError if Solr rejects the update.
+        """
+        self._validate_core(core_name)
+        logger.info('Posting %d documents into core %s', len(documents), core_name)
+        response = self.session.post(
+            '%s/%s/update' % (self.url, core_name), 
+            params={'commit': 'true' if commit else 'false', 'wt': 'json'},
+            data=json.dumps(documents, ensure_ascii=False).encode('utf-8'),
+            headers={'Content-Type': 'application/json'},
+            timeout=self.timeout)
+        if response.status_code != 200:
+            raise pysolr.SolrError('Solr responded with an error (HTTP %d): %s' % (response.status_code, response.text))
+        if commit:
+            self._notify_change(core_name)
+        return response.json()
     
     def add_document(self, core_name, document):
         """
         Queues a document for insertion into the specified core and returns None.
-        If the number of documents in the queue exceeds QUEUE_THRESHOLD,
-        this method will insert them all and return the response from Solr.
+        If the number of documents in the queue reaches queue_threshold (bulk_queue_threshold in bulk mode
+        if it is set), or their size reaches queue_max_bytes, this method will insert them all and return the response from Solr.
         All values in 'doc' must be strings.
         """
         self._validate_core(core_name)
         self.queues[core_name].append(document)
-        if len(self.queues[core_name]) >= self.QUEUE_THRESHOLD:
-            docs = list(self.queues[core_name].copy())
-            del self.queues[core_name][:]
-            return self.add_documents(core_name, docs)
+        if self.queue_max_bytes is not None:
+            self.queue_bytes[core_name] = self.queue_bytes.get(core_name, 0) + self._document_size(document)
+        if self.max_queued is not None and len(self.queues[core_name]) > self.max_queued:
+            self._drop_overflow(core_name)
+        
+        if core_name in self.retries and time.monotonic() < self.retries[core_name][0]:
+            return None
+        threshold = self.bulk_queue_threshold if self.bulk and self.bulk_queue_threshold is not None else self.queue_threshold
+        if len(self.queues[core_name]) >= threshold or \
+                (self.queue_max_bytes is not None and self.queue_bytes[core_name] >= self.queue_max_bytes):
+            return self._add_queue(core_name)
         
         return None
     
+    def _drop_overflow(self, core_name):
+        """
+        Removes the oldest documents of the queue of a core beyond max_queued and passes them to the overflow listeners.
+        """
+        queue = self.queues[core_name]
+        overflow = queue[:len(queue) - self.max_queued]
+        del queue[:len(overflow)]
+        if self.queue_max_bytes is not None:
+            self.queue_bytes[core_name] -= sum(self._document_size(document) for document in overflow)
+        if len(self.overflow_listeners) == 0:
+            logger.error('Dropped %d documents queued for core %s beyond %d', len(overflow), core_name, self.max_queued)
+        for listener in self.overflow_listeners:
+            listener(core_name, overflow)
+    
     def add_queued(self):
         """
         Adds all queued documents in all cores.
@@ -89,13 +433,95 @@ class SolrConnection(object):
         """
         responses = {}
         for core in self.cores:
-            docs = list(self.queues[core].copy())
-            del self.queues[core][:]
-            responses[core] = self.add_documents(core, docs)
+            responses[core] = self._add_queue(core)
+        return responses
+    
+    def _add_queue(self, core_name):
+        """
+        Inserts and empties the queue of a core, committing as configured for the current mode.
+        Returns the response from Solr.
+        If the insert fails, the documents stay queued and are inserted again with the next batch,
+        which add_document postpones for the retry interval.
+        """
+        docs = list(self.queues[core_name])
+        try:
+            if not self.bulk:
+                response = self.add_documents(core_name, docs)
+            else:
+                self.bulk_cores.add(core_name)
+                if self.bulk_commit_within is None:
+                    response = self.add_documents(core_name, docs, commit=False, soft_commit=True)
+                else:
+                    response = self.add_documents(core_name, docs, commit=False, commit_within=self.bulk_commit_within)
+        except Exception:
+            last_interval = self.retries.get(core_name, (0, 0))[1]
+            interval = min(last_interval * 2, self.MAX_RETRY_INTERVAL) if last_interval > 0 else self.retry_interval
+            self.retries[core_name] = (time.monotonic() + interval, interval)
+            raise
+        
+        self.retries.pop(core_name, None)
+        del self.queues[core_name][:len(docs)]
+        self.queue_bytes[core_name] = 0
+        return response
+    
+    def drop_queued(self):
+        """
+        Empties the queues of all cores without inserting their documents.
+        Returns a dictionary containing the documents dropped from each core.
+        """
+        dropped = {}
+        for core_name in self.queues:
+            dropped[core_name] = list(self.queues[core_name])
+            del self.queues[core_name][:]
+            self.queue_bytes[core_name] = 0
+        self.retries = {}
+        return dropped
+    
+    def _document_size(self, document):
+        """
+        Returns the approximate number of bytes a document takes in an update request.
+        """
+        return len(json.dumps(document, ensure_ascii=False).encode('utf-8'))
+    
+    def start_bulk(self):
+        """
+        Starts a bulk indexing run, e.g. a full crawl.
+        Until finish_bulk is called, queued documents are inserted without a hard commit, 
+        which would open a new searcher for every batch, and only made visible through 
+        commitWithin or soft commits.
+        """
+        self.bulk = True
+        self.bulk_cores = set()
+    
+    def finish_bulk(self):
+        """
+        Adds the remaining queued documents and hard commits every core documents were added to 
+        since start_bulk, then leaves bulk mode.
+        Returns a dictionary containing the Solr response to the commit of each core.
+        """
+        for core in self.cores:
+            if len(self.queues[core]) > 0:
+                self._add_queue(core)
+        
+        self.bulk = False
+        responses = {}
+        for core in sorted(self.bulk_cores):
+            responses[core] = self.commit(core)
+        self.bulk_cores = set()
         return responses
     
+    def commit(self, core_name):
+        """
+        Hard commits the documents added to the specified core and returns the Solr response.
+        """
+        self._validate_core(core_name)
+        response = self.cores[core_name].commit()
+        self._notify_change(core_name)
+        return response
+    
     def query(self, core_name, query='*:*', filter_query='', sort='', start='', rows='', 
-              field_list='', default_field='', highlight_fields='', omit_header=True):
+              field_list='', default_field='', highlight_fields='', omit_header=True, def_type='', 
+              query_fields='', phrase_fields='', cursor_mark=''):
         """
         Parameters
         ----------
@@ -124,15 +550,119 @@ class SolrConnection(object):
         highlight_fields : string, optional
             Fields to hightlight on.
         omit_header : bool, optional
-            Whether or not Solr excludes the header from the returned results.
-            The default is True.
+            Whether or not the header of the Solr response is excluded from the returned results.
+            The default is True. Solr still sends it when query_stats is set, to record its QTime.
+        def_type : string, optional
+            The query parser, e.g. 'edismax'.
+            The default is the standard query parser.
+        query_fields : string, optional
+            Fields searched by the edismax query parser with their boosts.
+            Example: 'title^10 description^8'
+        phrase_fields : string, optional
+            Fields boosted by the edismax query parser when all terms of the query appear close together in them.
+        cursor_mark : string, optional
+            The position to continue a deep paging from, '*' to start one.
+            Requires a sort including the 'id' field and no 'start'.
+            The mark to pass next is returned as 'nextCursorMark'.
 
         Returns a response corresponding to the given query from Solr.
         -------
-        See https://lucene.apache.org/solr/guide/8_4/common-query-parameters.html
-        and https://lucene.apache.org/solr/guide/8_4/highlighting.html for more details.
+        See https://lucene.apache.org/solr/guide/8_4/common-query-parameters.html,
+        https://lucene.apache.org/solr/guide/8_4/highlighting.html,
+        https://lucene.apache.org/solr/guide/8_4/the-extended-dismax-query-parser.html
+        and https://lucene.apache.org/solr/guide/8_4/pagination-of-results.html for more details.
+        """
+        self._validate_core(core_name)
+        params = self._query_params(query, filter_query, sort, start, rows, field_list, default_field, 
+                                    highlight_fields, omit_header and self.query_stats is None, def_type, 
+                                    query_fields, phrase_fields, cursor_mark)
+        start_time = time.perf_counter()
+        response, size = self._get_url_sized('%s/%s/select' % (self.url, core_name), params)
+        return self._record_query(core_name, response, size, time.perf_counter() - start_time, omit_header)
+    
+    async def aquery(self, core_name, query='*:*', filter_query='', sort='', start='', rows='', 
+                     field_list='', default_field='', highlight_fields='', omit_header=True, def_type='', 
+                     query_fields='', phrase_fields='', cursor_mark=''):
+        """
+        Asynchronous version of query, to be awaited from async views.
+        Takes the same parameters and returns the same response.
+        """
+        self._validate_core(core_name)
+        params = self._query_params(query, filter_query, sort, start, rows, field_list, default_field, 
+                                    highlight_fields, omit_header and self.query_stats is None, def_type, 
+                                    query_fields, phrase_fields, cursor_mark)
+        start_time = time.perf_counter()
+        response, size = await self._aget_url_sized('%s/%s/select' % (self.url, core_name), params)
+        return self._record_query(core_name, response, size, time.perf_counter() - start_time, omit_header)
+    
+    def query_raw(self, core_name, query='*:*', filter_query='', sort='', start='', rows='', 
+                  field_list='', default_field='', highlight_fields='', def_type='', 
+                  query_fields='', phrase_fields='', cursor_mark=''):
+        """
+        Same as query without the response header, but returns the JSON body of the Solr response as bytes
+        without decoding it, so that it can be passed through to the client as it is.
+        Responses with an error status are decoded and returned like those of query, to be told apart
+        by their type. The QTime of raw queries is not recorded in query_stats, as it is in the header.
         """
         self._validate_core(core_name)
+        params = self._raw_query_params(query, filter_query, sort, start, rows, field_list, default_field, 
+                                        highlight_fields, def_type, query_fields, phrase_fields, cursor_mark)
+        start_time = time.perf_counter()
+        status, body = self._get_url_raw('%s/%s/select' % (self.url, core_name), params)
+        return self._record_raw_query(core_name, status, body, time.perf_counter() - start_time)
+    
+    async def aquery_raw(self, core_name, query='*:*', filter_query='', sort='', start='', rows='', 
+                         field_list='', default_field='', highlight_fields='', def_type='', 
+                         query_fields='', phrase_fields='', cursor_mark=''):
+        """
+        Asynchronous version of query_raw.
+        """
+        self._validate_core(core_name)
+        params = self._raw_query_params(query, filter_query, sort, start, rows, field_list, default_field, 
+                                        highlight_fields, def_type, query_fields, phrase_fields, cursor_mark)
+        start_time = time.perf_counter()
+        status, body = await self._aget_url_raw('%s/%s/select' % (self.url, core_name), params)
+        return self._record_raw_query(core_name, status, body, time.perf_counter() - start_time)
+    
+    def _raw_query_params(self, query, filter_query, sort, start, rows, field_list, default_field, 
+                          highlight_fields, def_type, query_fields, phrase_fields, cursor_mark):
+        """
+        Returns the Solr request parameters of a raw query, which are those of query
+        without the header or indentation, since the body is not re-encoded.
+        """
+        params = self._query_params(query, filter_query, sort, start, rows, field_list, default_field, 
+                                    highlight_fields, True, def_type, query_fields, phrase_fields, cursor_mark)
+        params["indent"] = "false"
+        return params
+    
+    def _record_raw_query(self, core_name, status, body, seconds):
+        """
+        Records a raw query in query_stats if it is set, and returns its body, or its decoded body if it failed.
+        """
+        if self.query_stats is not None:
+            self.query_stats.record(core_name, None, seconds, len(body))
+        if status != 200:
+            return json.loads(body)
+        return body
+    
+    def _record_query(self, core_name, response, size, seconds, omit_header):
+        """
+        Records a query in query_stats if it is set, with the QTime from the header of its response,
+        then removes the header from the response if omit_header is True and returns the response.
+        """
+        if self.query_stats is None:
+            return response
+        
+        header = response.pop('responseHeader', None) if omit_header else response.get('responseHeader')
+        qtime = header.get('QTime') if isinstance(header, dict) else None
+        self.query_stats.record(core_name, qtime, seconds, size)
+        return response
+    
+    def _query_params(self, query, filter_query, sort, start, rows, field_list, default_field, 
+                      highlight_fields, omit_header, def_type, query_fields, phrase_fields, cursor_mark):
+        """
+        Returns the Solr request parameters of a query. See query for the parameters.
+        """
         params = {
             "q": query,
             "wt": "json",
@@ -154,10 +684,58 @@ class SolrConnection(object):
         if highlight_fields != '':
             params["hl"] = "on"
             params["hl.fl"] = highlight_fields
-            
-        response = self._get_url('%s/%s/select' % (self.url, core_name), params)
+        if def_type != '':
+            params["defType"] = def_type
+        if query_fields != '':
+            params["qf"] = query_fields
+        if phrase_fields != '':
+            params["pf"] = phrase_fields
+        if cursor_mark != '':
+            params["cursorMark"] = cursor_mark
+        return params
+    
+    def get_documents(self, core_name, ids, field_list=''):
+        """
+        Parameters
+        ----------
+        core_name : string
+            The name of the Solr core.
+        ids : list
+            The ids of the documents.
+        field_list : string, optional
+            Limits the information included in the documents to a specified list of fields.
+
+        Returns the response of Solr's real-time get handler containing the documents with the given ids
+        that exist in the core, fetched in a single request.
+        -------
+        See https://lucene.apache.org/solr/guide/8_4/realtime-get.html for more details.
+        """
+        self._validate_core(core_name)
+        response = self._get_url('%s/%s/get' % (self.url, core_name), self._get_params(ids, field_list))
         return response
     
+    async def aget_documents(self, core_name, ids, field_list=''):
+        """
+        Asynchronous version of get_documents.
+        """
+        self._validate_core(core_name)
+        response = await self._aget_url('%s/%s/get' % (self.url, core_name), self._get_params(ids, field_list))
+        return response
+    
+    def _get_params(self, ids, field_list):
+        """
+        Returns the parameters of a real-time get request. See get_documents for the parameters.
+        Ids are always sent in the comma-separated 'ids' parameter, escaping commas in them,
+        so that Solr responds with a list of documents even for a single id.
+        """
+        params = {
+            "ids": ','.join(doc_id.replace('\\', '\\\\').replace(',', '\\,') for doc_id in ids),
+            "wt": "json",
+        }
+        if field_list != '':
+            params["fl"] = field_list
+        return params
+    
     def optimize(self, core_name=None):
         """
         Performs defragmentation of specified core in Solr.
@@ -166,8 +744,11 @@ class SolrConnection(object):
         if core_name:
             self._validate_core(core_name)
             self.cores[core_name].optimize()
+            self._notify_change(core_name)
         else:
-            [self.cores[core].optimize() for core in self.cores]
+            for core in self.cores:
+                self.cores[core].optimize()
+                self._notify_change(core)
     
     def _validate_core(self, core_name):
         """
@@ -11,15 +11,19 @@ class SolrDocument(object):
         'description': '',
         'updatedAt': '',
     }
+    # Fields returned as lists by the API, even with a single value
+    LIST_FIELDS = ()
     
     def __init__(self, doc, **kwargs):
         """
-        This method should be called by the subclass constructor
+        This method should be called by the subclass constructor.
+        The default fields in doc are copied, so that documents can be kept around
+        without being changed by the next one created.
         """
-        self.doc = doc
+        self.doc = doc.copy()
         for key in self.doc.keys():
             if key in kwargs and key != 'type':
-                doc[key] = kwargs[key]
+                self.doc[key] = kwargs[key]
         
     def get_type(self):
         """
@@ -54,6 +58,7 @@ class SolrThesis(SolrDocument):
         'language': '',
         'keywords': '',
     }
+    LIST_FIELDS = ('keywords',)
     
     def __init__(self, **kwargs):
         super(SolrThesis, self).__init__(self.doc, **kwargs)
@@ -65,4 +70,15 @@ def get_models_fields(type_list):
     for doc in [model.doc for model in MODELS]:
         if doc['type'] in type_list:
             fields += [key for key in doc.keys() if key not in fields]
+    return fields
+
+def get_models_list_fields(type_list):
+    """
+    Returns the LIST_FIELDS of the models of the given types, which are returned as lists
+    even with a single value.
+    """
+    fields = []
+    for model in MODELS:
+        if model.doc['type'] in type_list:
+            fields += [key for key in model.LIST_FIELDS if key not in fields]
     return fields
\ No newline at end of file
@@ -1,5 +1,36 @@
 import nltk
+import threading
 from pyvi import ViTokenizer, ViPosTagger
+from . import timing
+from .cache import LRUCache
+from UTDVN_backend.settings import SANITIZE_CACHE_SIZE
+
+# Sanitized query strings and numbers of deleted words, keyed by the query string before sanitization.
+# POS tagging is the slowest part of building a search query, so repeated queries reuse its result.
+SANITIZE_CACHE = LRUCache(SANITIZE_CACHE_SIZE)
+
+# nltk.pos_tag loads the English tagger model on every call, so one tagger is loaded and shared instead.
+_english_tagger = None
+_english_tagger_lock = threading.Lock()
+
+def get_english_tagger():
+    """
+    Returns the shared English POS tagger, loading it on first use.
+    """
+    global _english_tagger
+    if _english_tagger is None:
+        with _english_tagger_lock:
+            if _english_tagger is None:
+                _english_tagger = nltk.tag.PerceptronTagger()
+    return _english_tagger
+
+def warm_up():
+    """
+    Loads the English and Vietnamese tokenizers and POS taggers by sanitizing a query in each language
+    without caching the results, so that the first searches do not pay for loading their models.
+    """
+    Query.sanitize_str('luận văn về ung thư phổi')
+    Query.sanitize_str('theses about lung cancer')
 
 class Query(object):
     """
@@ -152,13 +183,29 @@ class Query(object):
 
     def _sanitize(self):
         '''
-        Trims nonessential words such as 'and', 'or', 'for'
+        Trims nonessential words such as 'and', 'or', 'for'.
+        Results are memoized in SANITIZE_CACHE.
+        '''
+        with timing.phase('sanitize'):
+            sanitized = SANITIZE_CACHE.get(self.query_str)
+            if sanitized is None:
+                sanitized = Query.sanitize_str(self.query_str)
+                SANITIZE_CACHE.set(self.query_str, sanitized)
+            
+        new_query_str, deleted_words = sanitized
+        self.deleted_words += deleted_words
+        self.query_str = new_query_str
+    
+    @staticmethod
+    def sanitize_str(query_str):
+        '''
+        Returns the given query string trimmed of nonessential words and the number of words deleted.
         Parts of Speech types:
         http://www.ling.upenn.edu/courses/Fall_2003/ling001/penn_treebank_pos.html
         For vietnamese, see: https://pypi.org/project/pyvi/
         '''
         words_list = []
-        if (len(self.query_str) == len(self.query_str.encode('utf-8'))):
+        if (len(query_str) == len(query_str.encode('utf-8'))):
             tags_to_keep = [
                 'NN', 'NNS', 'NNP', 'NNPS',                 # noun types
                 'VB', 'VBD', 'VBG', 'VBN', 'VBP', 'VBZ',    # verb types
@@ -166,8 +213,8 @@ class Query(object):
                 'RB', 'RBR', 'RBS',                         # adverbs
                 'CD', 'FW'
             ]
-            tokens = nltk.word_tokenize(self.query_str)
-            tags = nltk.pos_tag(tokens)
+            tokens = nltk.word_tokenize(query_str)
+            tags = get_english_tagger().tag(tokens)
             for tag in tags:
                 if tag[1] in tags_to_keep:
                     words_list.append(tag[0])
@@ -177,7 +224,7 @@ class Query(object):
                 'N', 'Ny', 'Np', 'V', 'A', 'R',
                 'M', 'X'
             ]
-            tokens = ViTokenizer.tokenize(self.query_str)
+            tokens = ViTokenizer.tokenize(query_str)
             tags = ViPosTagger.postagging(tokens)
             for index in range(len(tags[0])):
                 if tags[1][index] in tags_to_keep:
@@ -185,7 +232,6 @@ class Query(object):
                     
         new_query_str = ' '.join(words_list)
         if len(new_query_str) == 0:
-            new_query_str = self.query_str
+            new_query_str = query_str
             
-        self.deleted_words += len(self.query_str.split()) - len(new_query_str.split())
-        self.query_str = new_query_str
\ No newline at end of file
+        return (new_query_str, len(query_str.split()) - len(new_query_str.split()))
@@ -0,0 +1,100 @@
+"""
+Replays the searches of slow query logs against a Solr instance.
+
+Every logged search is replayed by sending the Solr query of each of its cores, with the parameters
+it was sent with, so that a slow search can be reproduced or the logged traffic replayed against
+another Solr instance or configuration. Searches are started at --rate searches per second whatever
+the time Solr takes to answer, as the logged traffic was, with up to --concurrency queries in flight.
+Without --rate, records are read from the logs as queries complete, so that at most --concurrency
+queries wait to be sent.
+Prints the number of searches, queries and errors, and the QTime, request time and response size
+percentiles of each core as JSON.
+
+Usage (from UTDVN_backend):
+    python -m UTDVN_database.solr.replay LOG [LOG ...] [--solr-url http://localhost:8983/solr] [--rate 10]
+                                         [--concurrency 16] [--limit 1000]
+"""
+import argparse
+import json
+import pysolr
+import requests
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from UTDVN_backend.settings import HAYSTACK_CONNECTIONS
+from .connection import SolrConnection
+from .slow_query import read_log
+
+def replay(connection, records, rate=None, concurrency=16, limit=None):
+    """
+    Sends the queries of each slow query log record to connection, starting rate records per second
+    (as fast as possible if it is None), and returns the counts of searches, queries and errors sent.
+    The QTimes and request times of the queries are recorded in connection.query_stats.
+    Without a rate, at most concurrency queries wait to be sent besides those in flight.
+    Raises the first exception of a query that is not an error of Solr or of the request.
+    """
+    counts = {'searches': 0, 'queries': 0, 'errors': 0}
+    lock = threading.Lock()
+    pending = threading.BoundedSemaphore(2 * concurrency) if not rate else None
+    crashes = []
+
+    def send(entry):
+        try:
+            response = connection.query(entry['core'], entry['query'], **entry['params'])
+            failed = 'error' in response
+        except (requests.exceptions.RequestException, pysolr.SolrError, ValueError):
+            failed = True
+        except Exception as e:
+            with lock:
+                crashes.append(e)
+            raise
+        finally:
+            if pending is not None:
+                pending.release()
+        with lock:
+            counts['queries'] += 1
+            if failed:
+                counts['errors'] += 1
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        for record in records:
+            if limit is not None and counts['searches'] >= limit:
+                break
+            if rate:
+                # Records are started on schedule, so a slow Solr does not slow down the replayed traffic
+                delay = start + counts['searches'] / rate - time.perf_counter()
+                if delay > 0:
+                    time.sleep(delay)
+            if len(crashes) > 0:
+                break
+            counts['searches'] += 1
+            for entry in record.get('cores', []):
+                if pending is not None:
+                    pending.acquire()
+                executor.submit(send, entry)
+    if len(crashes) > 0:
+        raise crashes[0]
+    counts['seconds'] = round(time.perf_counter() - start, 3)
+    return counts
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('logs', nargs='+', help='Slow query log files, replayed in the given order.')
+    parser.add_argument('--solr-url', default=HAYSTACK_CONNECTIONS['default']['URL'],
+                        help='Base URL of the Solr instance to replay against.')
+    parser.add_argument('--rate', type=float, help='Searches started per second, as fast as possible if not given.')
+    parser.add_argument('--concurrency', type=int, default=16, help='Maximum number of queries in flight.')
+    parser.add_argument('--limit', type=int, help='Maximum number of searches to replay.')
+    args = parser.parse_args()
+
+    connection = SolrConnection(args.solr_url, pool_size=args.concurrency, lazy=True, query_stats_window=100000)
+    counts = replay(connection, read_log(args.logs), args.rate, args.concurrency, args.limit)
+    counts['rate'] = round(counts['searches'] / counts['seconds'], 3) if counts['seconds'] else None
+    counts['cores'] = connection.query_stats.stats()
+    json.dump(counts, sys.stdout, indent=2)
+    sys.stdout.write('\n')
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,236 @@
+import pysolr
+import requests
+import threading
+import time
+from . import builder, models
+from .cache import LRUCache
+
+class SchemaRegistry(object):
+    """
+    Parameters
+    ----------
+    solr_connection : SolrConnection
+        The connection the schemas are fetched from.
+    refresh_interval : float
+        Number of seconds after which the schema of a core is fetched again, in the background.
+    return_fields_cache_size : int, optional
+        The maximum number of return fields memoized by build_return_fields. Nothing is memoized by default.
+    flatten_plans_cache_size : int, optional
+        The maximum number of flatten plans memoized for each core. Nothing is memoized by default.
+
+    Keeps the schema of each core, fetched with SolrConnection.fetch_schema, and what is derived from it:
+    the return fields of search and document requests, validated against the fields of the models
+    and those the cores store, and the flatten plans listing the fields of the documents that hold
+    a single value in a list to unwrap.
+    Whether a field is returned as a list follows its declaration: the fields of the models are unwrapped
+    unless they are in their LIST_FIELDS, as a schemaless core makes every field but id multi-valued,
+    and the other fields keep the shape of the schema.
+    The schema of a core is fetched again after refresh_interval seconds, or once documents are committed
+    to the core through solr_connection since a schemaless core adds fields for new documents,
+    and what was derived from it is dropped if it changed.
+    If the schema of a core cannot be fetched, its fields are taken from its models
+    and every return field not declared as a list is unwrapped until it is fetched again.
+    -------
+    Example Usage:
+        return_fields = registry.build_return_fields('title,author', ['thesis'])
+        plan = registry.flatten_plan('thesis', return_fields)
+        builder.flatten_docs(response['response']['docs'], plan)
+    """
+
+    def __init__(self, solr_connection, refresh_interval, return_fields_cache_size=0, flatten_plans_cache_size=0):
+        self.solr_connection = solr_connection
+        self.refresh_interval = refresh_interval
+        self.flatten_plans_cache_size = flatten_plans_cache_size
+        # (schema parsed by _parse, or None if it could not be fetched, LRUCache of the plans compiled from it
+        # by sorted return fields) by core name. A refetched schema comes with a new cache of plans,
+        # so that a plan compiled from the last one meanwhile is dropped with it.
+        self.schemas = {}
+        # Incremented whenever a schema changes. Memoized return fields are keyed by it,
+        # so that those built from the last schemas are not used anymore.
+        self.generation = 0
+        self.return_fields_cache = LRUCache(return_fields_cache_size)
+        self.next_refresh = {}
+        self.load_lock = threading.Lock()
+        self.refreshing = set()
+        self.refresh_lock = threading.Lock()
+        solr_connection.add_change_listener(self.invalidate)
+
+    def has_schema(self, core_name):
+        """
+        Returns whether the schema of a core was loaded, so that flatten_plan does not wait for Solr.
+        """
+        return core_name in self.schemas
+
+    def build_return_fields(self, fields, types):
+        """
+        Memoized version of builder.build_return_fields, where the fields that can be returned from a core
+        are the fields of its models followed by the other fields stored in its schema.
+        Fields of the models missing from the schema stay valid, as a schemaless core only adds a field
+        once a document has it, but those the schema does not store are not.
+        A core whose schema is not loaded yet uses the fields of its models while the schema is fetched
+        in the background, so that requests do not wait for it.
+        Raises an exception if any field is not available.
+        """
+        if types == ['test']:
+            return fields
+
+        key = (self.generation, tuple(types), fields)
+        return_fields = self.return_fields_cache.get(key)
+        if return_fields is None:
+            try:
+                return_fields = builder.build_return_fields(fields, types, self._valid_fields(types))
+            except ValueError as e:
+                return_fields = e
+            self.return_fields_cache.set(key, return_fields)
+        if isinstance(return_fields, ValueError):
+            raise ValueError(str(return_fields))
+        return return_fields
+
+    def _valid_fields(self, types):
+        """
+        Returns the list of the fields that can be returned from any of the given cores, without duplicates.
+        """
+        valid_fields = []
+        for core_name in types:
+            if core_name not in self.schemas or time.monotonic() >= self.next_refresh.get(core_name, 0):
+                self._refresh_in_background(core_name)
+            model_fields = models.get_models_fields([core_name])
+            schema = self.schemas.get(core_name, (None, None))[0]
+            if schema is None:
+                core_fields = model_fields
+            else:
+                fields, _, stored_set, stored = schema
+                core_fields = [field for field in model_fields if field in stored_set or field not in fields] + \
+                    [field for field in stored if field not in model_fields]
+            valid_fields += [field for field in core_fields if field not in valid_fields]
+        return valid_fields
+
+    def flatten_plan(self, core_name, return_fields):
+        """
+        Returns the tuple of the fields of the given comma-separated return fields that builder.flatten_docs
+        unwraps in the documents of a core: those Solr returns as lists, but the API as single values.
+        Fields in the LIST_FIELDS of the models are always returned as lists, and fields Solr returns
+        as single values are left alone.
+        The schema of the core is fetched from Solr the first time, and refreshed in the background afterwards.
+        """
+        if core_name not in self.schemas:
+            self.load(core_name)
+        elif time.monotonic() >= self.next_refresh.get(core_name, 0):
+            self._refresh_in_background(core_name)
+
+        schema, plans = self.schemas[core_name]
+        # The same fields repeated or in another order get the same plan
+        fields = tuple(sorted(frozenset(return_fields.split(',')) - {''}))
+        plan = plans.get(fields)
+        if plan is None:
+            plan = self._compile(schema, core_name, fields)
+            plans.set(fields, plan)
+        return plan
+
+    def load(self, core_name):
+        """
+        Fetches the schema of a core unless another thread just did.
+        """
+        with self.load_lock:
+            if core_name not in self.schemas:
+                self._fetch(core_name)
+
+    def invalidate(self, core_name):
+        """
+        Makes the schema of a core be refetched on its next use, as documents committed to a schemaless core
+        may have added fields to it. The last schema is used until then.
+        """
+        self.next_refresh[core_name] = 0
+
+    def _fetch(self, core_name):
+        """
+        Fetches the schema of a core and replaces the last one along with its plans if it changed,
+        or keeps it if Solr cannot be reached. Must be called with load_lock held.
+        """
+        self.next_refresh[core_name] = time.monotonic() + self.refresh_interval
+        try:
+            schema = self._parse(self.solr_connection.fetch_schema(core_name))
+        except (requests.exceptions.RequestException, pysolr.SolrError, ValueError, KeyError):
+            if core_name in self.schemas:
+                return
+            schema = None
+        if core_name in self.schemas and self.schemas[core_name][0] == schema:
+            return
+        self.schemas[core_name] = (schema, LRUCache(self.flatten_plans_cache_size))
+        self.generation += 1
+
+    def _refresh_in_background(self, core_name):
+        """
+        Starts refetching the schema of a core on a background thread unless it is already being refetched.
+        """
+        with self.refresh_lock:
+            if core_name in self.refreshing:
+                return
+            self.refreshing.add(core_name)
+        # Postponed so that a failing Solr is not asked again on every search
+        self.next_refresh[core_name] = time.monotonic() + self.refresh_interval
+        threading.Thread(
+            target=self._refresh_and_release, args=(core_name,), name='solr-schema-refresh', daemon=True).start()
+
+    def _refresh_and_release(self, core_name):
+        try:
+            with self.load_lock:
+                self._fetch(core_name)
+        finally:
+            with self.refresh_lock:
+                self.refreshing.discard(core_name)
+
+    def _parse(self, schema):
+        """
+        Returns whether each field and dynamic field of a schema returned by SolrConnection.fetch_schema
+        is multi-valued, along with the frozenset and the tuple (in the order of the schema) of the fields
+        that can be returned: the stored fields, except for those Solr uses internally like _version_.
+        A field is multi-valued or stored if it says so, or otherwise if its type does.
+        Dynamic fields are listed longest pattern first, the order Solr matches them in.
+        -------
+        See https://lucene.apache.org/solr/guide/8_4/schema-api.html for more details.
+        """
+        types = {field_type['name']: field_type for field_type in schema.get('fieldTypes', [])}
+        def attribute(field, name, default):
+            return bool(field.get(name, types.get(field.get('type'), {}).get(name, default)))
+
+        fields = {field['name']: attribute(field, 'multiValued', False) for field in schema['fields']}
+        dynamic_fields = sorted(
+            ((field['name'], attribute(field, 'multiValued', False)) for field in schema.get('dynamicFields', [])),
+            key=lambda dynamic_field: -len(dynamic_field[0]))
+        stored = tuple(
+            field['name'] for field in schema['fields']
+            if attribute(field, 'stored', True) and not (field['name'].startswith('_') and field['name'].endswith('_')))
+        return (fields, dynamic_fields, frozenset(stored), stored)
+
+    def _compile(self, schema, core_name, fields):
+        """
+        Returns the plan of the given distinct return fields of a core for its schema parsed by _parse.
+        The fields of the models of the core are unwrapped unless they are declared as lists
+        or are single-valued in the schema. Other fields are unwrapped only if they are neither in the schema
+        nor match one of its dynamic fields, so that multi-valued ones keep their shape.
+        Every field not declared as a list is unwrapped if the schema is None.
+        """
+        model_fields = models.get_models_fields([core_name])
+        list_fields = models.get_models_list_fields([core_name])
+        plan = []
+        for field in fields:
+            if field in list_fields:
+                continue
+            multi_valued = self._multi_valued(schema, field) if schema is not None else None
+            if multi_valued is None or (multi_valued and field in model_fields):
+                plan.append(field)
+        return tuple(plan)
+
+    def _multi_valued(self, schema, field):
+        """
+        Returns whether a field is multi-valued in a schema parsed by _parse, or None if it is not in it.
+        """
+        fields, dynamic_fields, _, _ = schema
+        if field in fields:
+            return fields[field]
+        for pattern, multi_valued in dynamic_fields:
+            if (pattern.startswith('*') and field.endswith(pattern[1:])) or \
+                    (pattern.endswith('*') and field.startswith(pattern[:-1])):
+                return multi_valued
+        return None
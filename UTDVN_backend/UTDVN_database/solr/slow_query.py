@@ -0,0 +1,208 @@
+import contextvars
+import datetime
+import json
+import logging
+import logging.handlers
+import os
+import random
+import threading
+import time
+from concurrent import futures
+
+# The SearchRecord of the search being handled, None when searches are not recorded
+_current_record = contextvars.ContextVar('search_record', default=None)
+
+def current_record():
+    """
+    Returns the SearchRecord of the search being handled, or None if it is not recorded.
+    """
+    return _current_record.get()
+
+class SearchRecord(object):
+    """
+    Parameters
+    ----------
+    params : dict
+        The parameters of the search request.
+
+    What a search did: its parameters, and for each core the Solr query built by builder.build_search_query,
+    its parameters, the time taken, the QTime reported by Solr and the number of results.
+    Cores are added from the threads or tasks querying them, in the order they respond.
+    """
+
+    def __init__(self, params):
+        self.params = params
+        self.cores = []
+        self.status = None
+        self.start = time.perf_counter()
+        self.lock = threading.Lock()
+
+    def add_core(self, core, query, kwargs, seconds, response):
+        """
+        Adds the query of a core, sent with SolrConnection.query(core, query, **kwargs), which took seconds
+        to return response. The header of the response is removed, as API clients do not receive it.
+        The body of a raw query (SolrConnection.query_raw) is not decoded, so only its size is recorded.
+        """
+        raw = isinstance(response, bytes)
+        header = response.pop('responseHeader', None) if not raw else None
+        entry = {
+            'core': core,
+            'query': query,
+            'params': kwargs,
+            'elapsedMs': round(seconds * 1000, 3),
+            'qtimeMs': header.get('QTime') if isinstance(header, dict) else None,
+        }
+        if raw:
+            entry['bytes'] = len(response)
+        elif 'error' in response:
+            entry['error'] = response['error'].get('msg')
+        else:
+            entry['numFound'] = response['response']['numFound']
+            entry['docs'] = len(response['response']['docs'])
+        with self.lock:
+            self.cores.append(entry)
+
+class _Recording(object):
+    """
+    The context manager returned by SlowQueryLog.recording.
+    """
+
+    def __init__(self, log, record):
+        self.log = log
+        self.record = record
+        self.token = None
+
+    def __enter__(self):
+        if self.log is not None:
+            self.token = _current_record.set(self.record)
+        return self.record
+
+    def __exit__(self, *exc_info):
+        if self.log is not None:
+            _current_record.reset(self.token)
+            self.log.finish(self.record)
+        return False
+
+class SlowQueryLog(object):
+    """
+    Parameters
+    ----------
+    path : string
+        The JSON lines file the searches are logged to. Nothing is logged if it is None.
+    threshold : float
+        Number of seconds above which a search is logged. Searches are not logged for their time if it is None.
+    sample_rate : float
+        Fraction of the searches logged whatever their time.
+    max_bytes : int
+        Size of the file at which it is rotated, keeping backup_count older files as path.1, path.2...
+    backup_count : int
+        Number of rotated files kept.
+
+    Logs the searches slower than a threshold and a random sample of all searches as SearchRecords,
+    one JSON object per line, so that expensive searches can be found and traffic replayed against Solr
+    with UTDVN_database.solr.replay.
+    Lines are written by a single background thread, so that logging does not block the event loop
+    of the async views on file I/O. The directory, file and thread are only created with the first line,
+    so that processes importing the views without serving searches do not create them.
+    -------
+    Example Usage:
+        with log.recording({'q': query}) as record:
+            ...
+            record.status = 200
+    """
+
+    def __init__(self, path, threshold, sample_rate, max_bytes, backup_count):
+        self.path = path
+        self.threshold = threshold
+        self.sample_rate = sample_rate
+        self.max_bytes = max_bytes
+        self.backup_count = backup_count
+        self.handler = None
+        self.writer = None
+        self.open_lock = threading.Lock()
+
+    def enabled(self):
+        return self.path is not None and (self.threshold is not None or self.sample_rate > 0)
+
+    def _open(self):
+        """
+        Creates the thread writing the log unless it exists. The file is opened by that thread, see _write.
+        """
+        with self.open_lock:
+            if self.writer is None:
+                self.writer = futures.ThreadPoolExecutor(max_workers=1, thread_name_prefix='slow-query-log')
+
+    def recording(self, params):
+        """
+        Returns a context manager that records the search with the given parameters made in its block,
+        and logs it on exit if it is slow or sampled.
+        """
+        return _Recording(self if self.enabled() else None, SearchRecord(params))
+
+    def finish(self, record):
+        """
+        Logs a search once it is done, if it is slow or sampled.
+        The line is written in the background, see flush.
+        """
+        elapsed = time.perf_counter() - record.start
+        if self.threshold is not None and elapsed >= self.threshold:
+            reason = 'slow'
+        elif self.sample_rate > 0 and random.random() < self.sample_rate:
+            reason = 'sample'
+        else:
+            return
+
+        with record.lock:
+            cores = list(record.cores)
+        entry = {
+            'time': datetime.datetime.now(datetime.timezone.utc).isoformat(),
+            'reason': reason,
+            'status': record.status,
+            'elapsedMs': round(elapsed * 1000, 3),
+            'params': record.params,
+            'cores': cores,
+        }
+        self._open()
+        self.writer.submit(self._write, entry)
+
+    def _write(self, entry):
+        if self.handler is None:
+            directory = os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            # Rotates the file when it gets too big
+            self.handler = logging.handlers.RotatingFileHandler(
+                self.path, maxBytes=self.max_bytes, backupCount=self.backup_count, encoding='utf-8')
+        self.handler.handle(logging.makeLogRecord({'msg': json.dumps(entry, ensure_ascii=False)}))
+
+    def flush(self):
+        """
+        Waits until the searches logged so far are written to the file.
+        """
+        if self.writer is not None:
+            self.writer.submit(lambda: None).result()
+
+    def close(self):
+        """
+        Writes the searches logged so far, then stops the writing thread and closes the file.
+        """
+        with self.open_lock:
+            writer, self.writer = self.writer, None
+        if writer is not None:
+            writer.shutdown()
+        if self.handler is not None:
+            self.handler.close()
+            self.handler = None
+
+def read_log(paths):
+    """
+    Yields the records of the given slow query log files in order, skipping lines that are not valid JSON,
+    e.g. the last line of a file being written.
+    """
+    for path in paths:
+        with open(path, encoding='utf-8') as f:
+            for line in f:
+                try:
+                    yield json.loads(line)
+                except ValueError:
+                    continue
@@ -0,0 +1,75 @@
+import threading
+from collections import deque
+
+class QueryStats(object):
+    """
+    Parameters
+    ----------
+    window : int
+        The number of most recent queries of each core the percentiles are computed over.
+
+    Thread-safe rolling statistics of the Solr queries of each core.
+    For every query, records the QTime Solr reports (the milliseconds it spent searching),
+    the time the whole request took from this process including the network and JSON decoding,
+    and the size of the response. Their difference, the overhead, is the time spent outside of Solr's search.
+    """
+
+    # Percentiles reported for every measure
+    PERCENTILES = [50, 95, 99]
+
+    def __init__(self, window):
+        self.window = window
+        # Deques of (QTime in ms or None, time in ms, bytes) by core name
+        self.samples = {}
+        self.counts = {}
+        self.lock = threading.Lock()
+
+    def record(self, core_name, qtime, seconds, size):
+        """
+        Records a query of a core that Solr reported to take qtime milliseconds (None if unknown)
+        and that took seconds to get a response of size bytes.
+        """
+        with self.lock:
+            samples = self.samples.get(core_name)
+            if samples is None:
+                samples = self.samples[core_name] = deque(maxlen=self.window)
+                self.counts[core_name] = 0
+            samples.append((qtime, seconds * 1000, size))
+            self.counts[core_name] += 1
+
+    def stats(self):
+        """
+        Returns a dictionary mapping each core name to its number of queries and the percentiles of
+        its QTime, request time, overhead (request time minus QTime) in milliseconds and response size in bytes
+        over its last window queries.
+        """
+        with self.lock:
+            samples = {core_name: list(core_samples) for core_name, core_samples in self.samples.items()}
+            counts = dict(self.counts)
+
+        stats = {}
+        for core_name, core_samples in samples.items():
+            qtimes = [qtime for qtime, _, _ in core_samples if qtime is not None]
+            stats[core_name] = {
+                'queries': counts[core_name],
+                'window': len(core_samples),
+                'qtimeMs': self._percentiles(qtimes),
+                'requestMs': self._percentiles([elapsed for _, elapsed, _ in core_samples]),
+                'overheadMs': self._percentiles(
+                    [elapsed - qtime for qtime, elapsed, _ in core_samples if qtime is not None]),
+                'bytes': self._percentiles([size for _, _, size in core_samples]),
+            }
+        return stats
+
+    def _percentiles(self, values):
+        """
+        Returns the PERCENTILES of values using the nearest-rank method, or an empty dictionary if there are none.
+        """
+        if len(values) == 0:
+            return {}
+        ordered = sorted(values)
+        percentiles = {}
+        for p in self.PERCENTILES:
+            rank = max(1, int(round(p / 100.0 * len(ordered))))
+            percentiles['p%d' % p] = round(ordered[rank - 1], 3)
+        return percentiles
@@ -0,0 +1,172 @@
+import contextvars
+import threading
+import time
+from collections import OrderedDict
+from UTDVN_backend.settings import REQUEST_TIMING_BUCKETS
+
+# The RequestTimer of the request being handled, None when requests are not timed.
+# Being a context variable, it follows the request into the coroutines of async views,
+# and into the threads of the search executor, which run in a copy of the context of the request.
+_current_timer = contextvars.ContextVar('request_timer', default=None)
+
+class RequestTimer(object):
+    """
+    Parameters
+    ----------
+    view : string
+        The name of the timed view.
+
+    Adds up the time a request spends in each phase of its handling.
+    Phases may be timed from several threads at once, e.g. the Solr requests of each core,
+    so the phases run concurrently can add up to more than the time of the whole request.
+    -------
+    Example Usage:
+        timer = RequestTimer('search')
+        token = timer.activate()
+        with phase('build'):
+            ...
+        timer.deactivate(token)
+        response['Server-Timing'] = timer.server_timing()
+    """
+
+    def __init__(self, view):
+        self.view = view
+        self.phases = OrderedDict()
+        self.lock = threading.Lock()
+
+    def activate(self):
+        """
+        Makes this timer the one phases are recorded in, and returns a token to give to deactivate.
+        """
+        return _current_timer.set(self)
+
+    def deactivate(self, token):
+        _current_timer.reset(token)
+
+    def add(self, name, seconds):
+        """
+        Adds seconds to the time spent in the phase with the given name.
+        """
+        with self.lock:
+            self.phases[name] = self.phases.get(name, 0) + seconds
+
+    def server_timing(self):
+        """
+        Returns the phases as the value of a Server-Timing header, with durations in milliseconds.
+        -------
+        See https://www.w3.org/TR/server-timing/ for more details.
+        """
+        with self.lock:
+            return ', '.join('%s;dur=%.3f' % (name, seconds * 1000) for name, seconds in self.phases.items())
+
+class _Phase(object):
+    __slots__ = ['timer', 'name', 'start']
+
+    def __init__(self, timer, name):
+        self.timer = timer
+        self.name = name
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.timer.add(self.name, time.perf_counter() - self.start)
+        return False
+
+class _NoPhase(object):
+    __slots__ = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return False
+
+# Returned by phase when no request is timed, so that timing costs a single lookup
+_NO_PHASE = _NoPhase()
+
+def phase(name):
+    """
+    Returns a context manager adding the time spent in its block to the phase with the given name
+    of the current RequestTimer, which does nothing if there is none.
+    """
+    timer = _current_timer.get()
+    if timer is None:
+        return _NO_PHASE
+    return _Phase(timer, name)
+
+class Histograms(object):
+    """
+    Parameters
+    ----------
+    name : string
+        The name of the Prometheus metric.
+    help_text : string
+        The description of the metric.
+    buckets : list
+        The upper bounds of the buckets in seconds, in increasing order.
+        A bucket for any duration ('+Inf') is added after them.
+
+    Thread-safe cumulative histograms of the durations of the phases of each view,
+    rendered in the Prometheus text exposition format.
+    -------
+    See https://prometheus.io/docs/instrumenting/exposition_formats/ for more details.
+    """
+
+    def __init__(self, name, help_text, buckets):
+        self.name = name
+        self.help_text = help_text
+        self.buckets = list(buckets)
+        # [bucket counts, sum, count] keyed by (view, phase)
+        self.series = OrderedDict()
+        self.lock = threading.Lock()
+
+    def observe(self, view, name, seconds):
+        """
+        Records a duration of the phase with the given name of a view.
+        """
+        with self.lock:
+            series = self.series.get((view, name))
+            if series is None:
+                series = self.series[(view, name)] = [[0] * len(self.buckets), 0.0, 0]
+            counts = series[0]
+            for index, bound in enumerate(self.buckets):
+                if seconds <= bound:
+                    counts[index] += 1
+            series[1] += seconds
+            series[2] += 1
+
+    def observe_timer(self, timer):
+        """
+        Records the durations of all the phases of a RequestTimer.
+        """
+        with timer.lock:
+            phases = list(timer.phases.items())
+        for name, seconds in phases:
+            self.observe(timer.view, name, seconds)
+
+    def render(self):
+        """
+        Returns the histograms in the Prometheus text exposition format.
+        """
+        lines = ['# HELP %s %s' % (self.name, self.help_text), '# TYPE %s histogram' % self.name]
+        with self.lock:
+            series = [(key, list(counts), total, count) for key, (counts, total, count) in self.series.items()]
+        for (view, name), counts, total, count in series:
+            labels = 'view="%s",phase="%s"' % (_escape_label(view), _escape_label(name))
+            for bound, bucket_count in zip(self.buckets, counts):
+                lines.append('%s_bucket{%s,le="%s"} %d' % (self.name, labels, repr(float(bound)), bucket_count))
+            lines.append('%s_bucket{%s,le="+Inf"} %d' % (self.name, labels, count))
+            lines.append('%s_sum{%s} %s' % (self.name, labels, repr(total)))
+            lines.append('%s_count{%s} %d' % (self.name, labels, count))
+        return '\n'.join(lines) + '\n'
+
+def _escape_label(value):
+    return value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+# Durations of the phases of the timed requests of this process
+PHASE_HISTOGRAMS = Histograms(
+    'utdvn_request_phase_seconds',
+    'Time spent by search and document requests in each phase of their handling.',
+    REQUEST_TIMING_BUCKETS)
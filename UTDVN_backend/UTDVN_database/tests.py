@@ -1,29 +1,48 @@
-from django.test import TestCase
-from django.urls import reverse
-from unittest.mock import MagicMock, patch, call
+from django.test import AsyncClient, TestCase, RequestFactory, override_settings
+from django.urls import path, reverse
+from unittest.mock import AsyncMock, MagicMock, patch, call
+from asgiref.sync import async_to_sync
 from .solr.connection import SolrConnection
 from .solr.error import APIError, ErrorType
 from .solr.models import *
-from .solr.query import Query
-from .solr import builder
+from .solr.query import Query, SANITIZE_CACHE
+from .solr import query as solr_query
+from pyvi import ViPosTagger
+from .solr.cache import LRUCache, SearchCache
+from .solr.stats import QueryStats
+from .solr.schema import SchemaRegistry
+from .solr import builder, replay, slow_query, timing
+from . import apps
+from django.apps import apps as django_apps
 from .mocks import MockSolr, MockAdmin, MockResponse
 from UTDVN_database.views import SOLR
+from UTDVN_database import views
+import aiohttp
+import pysolr
+import asyncio
 import json
+import os
+import tempfile
+import threading
+import time
+import requests
+import urllib.parse
 
 class SolrConnectionTests(TestCase):
     
-    @patch('pysolr.SolrCoreAdmin')
+    @patch.object(SolrConnection, 'fetch_core_status')
     @patch('pysolr.Solr')
-    def setUp(self, mock_solr, mock_admin):
+    def setUp(self, mock_solr, mock_core_status):
         mock_solr.return_value = MockSolr()
         self.mock_solr = mock_solr
         
         cores = ['test', 'something']
-        mock_admin.return_value = MockAdmin(cores)
-        self.mock_admin = mock_admin
+        mock_core_status.return_value = MockAdmin(cores).core_status()
+        self.mock_core_status = mock_core_status
         
         url = "http://a.test.url/solr"
         self.solr_connection = SolrConnection(url)
+        self.solr_connection.fetch_core_status = MockAdmin(cores).core_status
         
         self.doc = {"id":"testid"}
         
@@ -33,6 +52,14 @@ class SolrConnectionTests(TestCase):
     def test_fetch_core_names(self):
         self.assertEqual(self.solr_connection.fetch_core_names(), ['test', 'something'])
         
+    @patch('requests.Session.get')
+    def test_fetch_core_names_uses_session_with_timeout(self, mock_get):
+        del self.solr_connection.fetch_core_status
+        mock_get.return_value = MockResponse({'status': MockAdmin(['test', 'something']).core_status()})
+        self.assertEqual(self.solr_connection.fetch_core_names(), ['test', 'something'])
+        self.assertEqual(mock_get.call_args[0][0], 'http://a.test.url/solr/admin/cores')
+        self.assertEqual(mock_get.call_args[1]['timeout'], self.solr_connection.timeout)
+        
     def test_get_core_name(self):
         self.assertEqual(self.solr_connection.get_core_names(), ['something'])
         
@@ -40,7 +67,7 @@ class SolrConnectionTests(TestCase):
         with self.assertRaises(ValueError):
             self.solr_connection.fetch_schema('blahblah')
         
-    @patch('requests.get')
+    @patch('requests.Session.get')
     def test_fetch_schema(self, mock_get):
         response = {
             "schema" : {
@@ -53,6 +80,152 @@ class SolrConnectionTests(TestCase):
         mock_get.return_value = MockResponse(response)
         self.assertEqual(self.solr_connection.fetch_schema('something'), response["schema"])
         
+    def test_session_is_shared_by_pysolr_clients(self):
+        self.assertIs(self.solr_connection.solr.session, self.solr_connection.session)
+        self.assertIs(self.solr_connection.cores['something'].session, self.solr_connection.session)
+        
+    @patch.object(SolrConnection, 'fetch_core_status')
+    def test_session_pool(self, mock_core_status):
+        mock_core_status.return_value = MockAdmin(['test']).core_status()
+        solr_connection = SolrConnection.from_config({
+            'URL': 'http://a.test.url/solr', 'POOL_SIZE': 7, 'CONNECT_TIMEOUT': 1, 'TIMEOUT': 5, 'MAX_RETRIES': 3})
+        adapter = solr_connection.session.get_adapter(solr_connection.url)
+        self.assertEqual(adapter._pool_maxsize, 7)
+        self.assertEqual(adapter.max_retries.total, 3)
+        self.assertEqual(adapter.max_retries.connect, 3)
+        self.assertEqual(adapter.max_retries.read, 0)
+        self.assertEqual(solr_connection.timeout, (1, 5))
+        
+    @patch('requests.Session.get')
+    def test_query_uses_session_with_timeout(self, mock_get):
+        mock_get.return_value = MockResponse({'response': {}})
+        self.solr_connection.query('something', 'q')
+        self.assertEqual(mock_get.call_args[1]['timeout'], self.solr_connection.timeout)
+        
+    @patch('requests.Session.get')
+    def test_get_documents(self, mock_get):
+        mock_get.return_value = MockResponse({'response': {'numFound': 1, 'start': 0, 'docs': [{'id': 'a'}]}})
+        response = self.solr_connection.get_documents('something', ['a', 'b,c', 'd\\e'], 'id,title')
+        self.assertEqual(response['response']['docs'], [{'id': 'a'}])
+        self.assertEqual(mock_get.call_args[0][0], 'http://a.test.url/solr/something/get')
+        self.assertEqual(
+            urllib.parse.parse_qs(mock_get.call_args[1]['params']), 
+            {'ids': ['a,b\\,c,d\\\\e'], 'wt': ['json'], 'fl': ['id,title']})
+        
+    def test_get_documents_with_non_existent_core(self):
+        with self.assertRaises(ValueError):
+            self.solr_connection.get_documents('non-existent-core', ['a'])
+            
+    @patch('requests.Session.get')
+    def test_query_with_edismax_params(self, mock_get):
+        mock_get.return_value = MockResponse({'response': {}})
+        self.solr_connection.query('something', 'q', def_type='edismax', query_fields='title^10', phrase_fields='title^20')
+        params = urllib.parse.parse_qs(mock_get.call_args[1]['params'])
+        self.assertEqual(params['defType'], ['edismax'])
+        self.assertEqual(params['qf'], ['title^10'])
+        self.assertEqual(params['pf'], ['title^20'])
+        
+    @patch('requests.Session.get')
+    def test_query_with_cursor_mark(self, mock_get):
+        mock_get.return_value = MockResponse({'response': {}, 'nextCursorMark': 'AoE='})
+        response = self.solr_connection.query('something', 'q', sort='id asc', cursor_mark='*')
+        params = urllib.parse.parse_qs(mock_get.call_args[1]['params'])
+        self.assertEqual(params['cursorMark'], ['*'])
+        self.assertNotIn('start', params)
+        self.assertEqual(response['nextCursorMark'], 'AoE=')
+        
+    def test_aquery_with_non_existent_core(self):
+        with self.assertRaises(ValueError):
+            async_to_sync(self.solr_connection.aquery)('non-existent-core')
+            
+    @patch.object(SolrConnection, '_aget_url_sized', new_callable=AsyncMock)
+    def test_aquery_uses_same_params_as_query(self, mock_aget_url):
+        mock_aget_url.return_value = ({'response': {}}, 14)
+        with patch.object(SolrConnection, '_get_url_sized', return_value=({'response': {}}, 14)) as mock_get_url:
+            self.solr_connection.query('something', 'name:*', sort='id asc', rows=5, field_list='id')
+        
+        response = async_to_sync(self.solr_connection.aquery)('something', 'name:*', sort='id asc', rows=5, field_list='id')
+        self.assertEqual(response, {'response': {}})
+        self.assertEqual(mock_aget_url.call_args, mock_get_url.call_args)
+        
+    @patch('requests.Session.get')
+    def test_query_records_stats_without_returning_header(self, mock_get):
+        mock_get.return_value = MockResponse({'responseHeader': {'status': 0, 'QTime': 7}, 'response': {}})
+        with patch.object(self.solr_connection, 'query_stats', QueryStats(10)):
+            response = self.solr_connection.query('something', 'q')
+            stats = self.solr_connection.query_stats.stats()
+        self.assertEqual(urllib.parse.parse_qs(mock_get.call_args[1]['params'])['omitHeader'], ['false'])
+        self.assertEqual(response, {'response': {}})
+        self.assertEqual(stats['something']['queries'], 1)
+        self.assertEqual(stats['something']['qtimeMs'], {'p50': 7, 'p95': 7, 'p99': 7})
+        self.assertEqual(sorted(stats['something'].keys()), ['bytes', 'overheadMs', 'qtimeMs', 'queries', 'requestMs', 'window'])
+        
+    @patch('requests.Session.get')
+    def test_query_keeps_header_when_asked(self, mock_get):
+        mock_get.return_value = MockResponse({'responseHeader': {'status': 0, 'QTime': 7}, 'response': {}})
+        with patch.object(self.solr_connection, 'query_stats', QueryStats(10)):
+            response = self.solr_connection.query('something', 'q', omit_header=False)
+        self.assertEqual(response['responseHeader']['QTime'], 7)
+        
+    @patch('requests.Session.get')
+    def test_query_omits_header_without_stats(self, mock_get):
+        mock_get.return_value = MockResponse({'response': {}})
+        self.solr_connection.query('something', 'q')
+        self.assertEqual(urllib.parse.parse_qs(mock_get.call_args[1]['params'])['omitHeader'], ['true'])
+            
+    @patch.object(SolrConnection, '_get_url_raw', return_value=(200, b'{"response":{"docs":[]}}'))
+    def test_query_raw_returns_body(self, mock_get_url_raw):
+        with patch.object(self.solr_connection, 'query_stats', QueryStats(10)):
+            response = self.solr_connection.query_raw('something', 'q', rows=5)
+            stats = self.solr_connection.query_stats.stats()
+        self.assertEqual(response, b'{"response":{"docs":[]}}')
+        params = mock_get_url_raw.call_args[0][1]
+        self.assertEqual((params['omitHeader'], params['indent'], params['rows']), ('true', 'false', 5))
+        self.assertEqual(stats['something']['bytes'], {'p50': 24, 'p95': 24, 'p99': 24})
+        self.assertEqual(stats['something']['qtimeMs'], {})
+        
+    @patch.object(SolrConnection, '_get_url_raw', return_value=(400, b'{"error":{"msg":"bad query","code":400}}'))
+    def test_query_raw_decodes_errors(self, mock_get_url_raw):
+        response = self.solr_connection.query_raw('something', 'q')
+        self.assertEqual(response, {'error': {'msg': 'bad query', 'code': 400}})
+        
+    @patch.object(SolrConnection, '_aget_url_raw', new_callable=AsyncMock)
+    def test_aquery_raw_uses_same_params_as_query_raw(self, mock_aget_url_raw):
+        mock_aget_url_raw.return_value = (200, b'{}')
+        with patch.object(SolrConnection, '_get_url_raw', return_value=(200, b'{}')) as mock_get_url_raw:
+            self.solr_connection.query_raw('something', 'name:*', sort='id asc', rows=5, field_list='id')
+        
+        response = async_to_sync(self.solr_connection.aquery_raw)('something', 'name:*', sort='id asc', rows=5, field_list='id')
+        self.assertEqual(response, b'{}')
+        self.assertEqual(mock_aget_url_raw.call_args, mock_get_url_raw.call_args)
+            
+    def test_async_session_is_reused_within_event_loop(self):
+        async def sessions():
+            first = self.solr_connection._get_async_session()
+            second = self.solr_connection._get_async_session()
+            await self.solr_connection.aclose()
+            return first, second
+        
+        first, second = async_to_sync(sessions)()
+        self.assertIs(first, second)
+        self.assertTrue(first.closed)
+        
+    def test_async_session_of_each_event_loop_is_kept(self):
+        loops = [asyncio.new_event_loop(), asyncio.new_event_loop()]
+        async def session():
+            return self.solr_connection._get_async_session()
+        try:
+            first, second, first_again = [loop.run_until_complete(session()) for loop in loops + loops[:1]]
+            self.assertIsNot(first, second)
+            self.assertIs(first, first_again)
+            self.assertFalse(first.closed)
+        finally:
+            for loop in loops:
+                loop.run_until_complete(self.solr_connection.aclose())
+                loop.close()
+        self.assertTrue(first.closed)
+        self.assertTrue(second.closed)
+            
     def test_add_documents_with_non_existent_core(self):
         with self.assertRaises(ValueError):
             self.solr_connection.add_documents("blahblah", [self.doc, self.doc])
@@ -61,6 +234,23 @@ class SolrConnectionTests(TestCase):
         self.assertEqual(self.solr_connection.add_documents('something', [self.doc, self.doc]), 
                          [self.doc, self.doc])
         
+    @patch('requests.Session.post')
+    def test_post_documents(self, mock_post):
+        mock_post.return_value = MagicMock(status_code=200, json=lambda: {'responseHeader': {'status': 0}})
+        response = self.solr_connection.post_documents('something', [self.doc, {'id': 'Nguyễn'}])
+        self.assertEqual(response, {'responseHeader': {'status': 0}})
+        self.assertEqual(mock_post.call_args[0][0], 'http://a.test.url/solr/something/update')
+        self.assertEqual(mock_post.call_args[1]['params']['commit'], 'false')
+        self.assertEqual(json.loads(mock_post.call_args[1]['data'].decode('utf-8')), [self.doc, {'id': 'Nguyễn'}])
+        
+    @patch('requests.Session.post')
+    def test_post_documents_with_error(self, mock_post):
+        mock_post.return_value = MagicMock(status_code=400, text='bad document')
+        with self.assertRaises(pysolr.SolrError):
+            self.solr_connection.post_documents('something', [self.doc])
+        with self.assertRaises(ValueError):
+            self.solr_connection.post_documents('blahblah', [self.doc])
+        
     def test_add_document_with_non_existent_core(self):
         with self.assertRaises(ValueError):
             self.solr_connection.add_document("blahblah", self.doc)
@@ -105,6 +295,119 @@ class SolrConnectionTests(TestCase):
         self.assertEqual(self.solr_connection.add_queued(), 
                          {'test': [self.doc], 'something': [other_doc]})
         
+    def test_add_document_with_documents_exceed_queue_max_bytes(self):
+        self.solr_connection.queue_max_bytes = 30
+        self.assertEqual(self.solr_connection.add_document('something', self.doc), None)
+        self.assertEqual(self.solr_connection.add_document('something', self.doc), [self.doc, self.doc])
+        self.assertEqual(self.solr_connection.queues['something'], [])
+        
+    def test_failed_insert_keeps_documents_queued(self):
+        other_doc = {"id": "other_testid"}
+        mock_core = MagicMock()
+        mock_core.add.side_effect = [pysolr.SolrError('Solr is down'), [self.doc, other_doc]]
+        self.solr_connection.cores['something'] = mock_core
+        self.solr_connection.queue_threshold = 1
+        self.solr_connection.retry_interval = 0
+        with self.assertRaises(pysolr.SolrError):
+            self.solr_connection.add_document('something', self.doc)
+        self.assertEqual(self.solr_connection.queues['something'], [self.doc])
+        
+        self.solr_connection.add_document('something', other_doc)
+        mock_core.add.assert_called_with([self.doc, other_doc], commit=True)
+        self.assertEqual(self.solr_connection.queues['something'], [])
+        
+    @patch('time.monotonic')
+    def test_failed_insert_is_retried_after_interval(self, mock_monotonic):
+        mock_monotonic.return_value = 100
+        mock_core = MagicMock()
+        mock_core.add.side_effect = pysolr.SolrError('Solr is down')
+        self.solr_connection.cores['something'] = mock_core
+        self.solr_connection.queue_threshold = 1
+        with self.assertRaises(pysolr.SolrError):
+            self.solr_connection.add_document('something', self.doc)
+        
+        self.assertIsNone(self.solr_connection.add_document('something', self.doc))
+        self.assertEqual(mock_core.add.call_count, 1)
+        mock_monotonic.return_value = 100 + self.solr_connection.RETRY_INTERVAL
+        with self.assertRaises(pysolr.SolrError):
+            self.solr_connection.add_document('something', self.doc)
+        self.assertEqual(mock_core.add.call_count, 2)
+        # The interval doubles after each failure in a row
+        self.assertEqual(self.solr_connection.retries['something'][1], 2 * self.solr_connection.RETRY_INTERVAL)
+        
+    @patch('time.monotonic', return_value=100)
+    def test_queue_overflow_goes_to_listeners(self, mock_monotonic):
+        mock_core = MagicMock()
+        mock_core.add.side_effect = pysolr.SolrError('Solr is down')
+        self.solr_connection.cores['something'] = mock_core
+        self.solr_connection.queue_threshold = 1
+        self.solr_connection.max_queued = 2
+        listener = MagicMock()
+        self.solr_connection.add_overflow_listener(listener)
+        docs = [{'id': str(i)} for i in range(4)]
+        with self.assertRaises(pysolr.SolrError):
+            self.solr_connection.add_document('something', docs[0])
+        for doc in docs[1:]:
+            self.solr_connection.add_document('something', doc)
+        
+        self.assertEqual(self.solr_connection.queues['something'], docs[2:])
+        self.assertEqual(listener.call_args_list, [call('something', [docs[0]]), call('something', [docs[1]])])
+        self.assertEqual(mock_core.add.call_count, 1)
+        
+    def test_drop_queued(self):
+        self.solr_connection.add_document('something', self.doc)
+        self.assertEqual(self.solr_connection.drop_queued(), {'test': [], 'something': [self.doc]})
+        self.assertEqual(self.solr_connection.queues['something'], [])
+        
+    def test_add_document_with_configured_queue_threshold(self):
+        self.solr_connection.queue_threshold = 2
+        self.assertEqual(self.solr_connection.add_document('something', self.doc), None)
+        self.assertEqual(self.solr_connection.add_document('something', self.doc), [self.doc, self.doc])
+        
+    def test_bulk_queue_threshold_only_applies_in_bulk_mode(self):
+        self.solr_connection.queue_threshold = 1
+        self.solr_connection.bulk_queue_threshold = 2
+        self.assertEqual(self.solr_connection.add_document('something', self.doc), [self.doc])
+        self.solr_connection.start_bulk()
+        self.assertEqual(self.solr_connection.add_document('something', self.doc), None)
+        self.assertEqual(self.solr_connection.add_document('something', self.doc), [self.doc, self.doc])
+        
+    def test_bulk_adds_without_hard_commit(self):
+        mock_core = MagicMock()
+        self.solr_connection.cores['something'] = mock_core
+        listener = MagicMock()
+        self.solr_connection.add_change_listener(listener)
+        self.solr_connection.queue_threshold = 1
+        
+        self.solr_connection.bulk_commit_within = 5000
+        self.solr_connection.start_bulk()
+        self.solr_connection.add_document('something', self.doc)
+        mock_core.add.assert_called_with([self.doc], commit=False, commitWithin='5000')
+        listener.assert_not_called()
+        
+        self.solr_connection.bulk_commit_within = None
+        self.solr_connection.add_document('something', self.doc)
+        mock_core.add.assert_called_with([self.doc], commit=False, softCommit=True)
+        self.assertFalse(mock_core.commit.called)
+        
+    def test_finish_bulk(self):
+        mock_core = MagicMock()
+        self.solr_connection.cores['something'] = mock_core
+        listener = MagicMock()
+        self.solr_connection.add_change_listener(listener)
+        
+        self.solr_connection.start_bulk()
+        self.solr_connection.add_document('something', self.doc)
+        self.solr_connection.finish_bulk()
+        self.assertEqual(mock_core.add.call_count, 1)
+        self.assertEqual(mock_core.commit.call_count, 1)
+        listener.assert_called_with('something')
+        self.assertFalse(self.solr_connection.bulk)
+        
+        self.solr_connection.add_document('something', self.doc)
+        self.solr_connection.add_queued()
+        mock_core.add.assert_called_with([self.doc], commit=True)
+        
     def test_query_with_test_core(self):
         expected_response = {
             "response": {
@@ -142,12 +445,116 @@ class SolrConnectionTests(TestCase):
         
         self.assertEqual(result, expected_response)
         
+    @patch('requests.Session.get')
+    def test_fetch_index_versions(self, mock_get):
+        del self.solr_connection.fetch_core_status
+        mock_get.return_value = MockResponse({'status': MockAdmin(['test', 'something'], {'test': 3, 'something': 5}).core_status()})
+        self.assertEqual(self.solr_connection.fetch_index_versions(), {'test': 3, 'something': 5})
+        self.assertEqual(mock_get.call_args[0][0], 'http://a.test.url/solr/admin/cores')
+        self.assertEqual(urllib.parse.parse_qs(mock_get.call_args[1]['params']), {'action': ['STATUS'], 'wt': ['json']})
+        self.assertEqual(mock_get.call_args[1]['timeout'], self.solr_connection.timeout)
+        
+    def test_change_listeners_on_commit(self):
+        listener = MagicMock()
+        self.solr_connection.add_change_listener(listener)
+        self.solr_connection.add_documents('something', [self.doc], commit=False)
+        self.assertFalse(listener.called)
+        self.solr_connection.add_documents('something', [self.doc])
+        listener.assert_called_once_with('something')
+        
+    def test_change_listeners_on_optimize(self):
+        listener = MagicMock()
+        self.solr_connection.add_change_listener(listener)
+        self.solr_connection.cores['test'] = MagicMock()
+        self.solr_connection.cores['something'] = MagicMock()
+        self.solr_connection.optimize()
+        self.assertEqual(listener.call_args_list, [call('test'), call('something')])
+        
+    @patch.object(SolrConnection, 'fetch_core_status')
+    def test_lazy_connection_fetches_cores_on_first_use(self, mock_core_status):
+        mock_core_status.side_effect = MockAdmin(['test', 'something']).core_status
+        solr_connection = SolrConnection("http://a.test.url/solr", lazy=True)
+        self.assertFalse(mock_core_status.called)
+        self.assertFalse(solr_connection.has_cores())
+        
+        self.assertEqual(solr_connection.get_core_names(), ['something'])
+        self.assertEqual(solr_connection.get_core_names(), ['something'])
+        self.assertEqual(mock_core_status.call_count, 1)
+        self.assertTrue(solr_connection.has_cores())
+        
+    @patch.object(SolrConnection, 'fetch_core_status')
+    def test_lazy_connection_raises_until_solr_is_reachable(self, mock_core_status):
+        mock_core_status.side_effect = requests.exceptions.ConnectionError('Connection refused')
+        solr_connection = SolrConnection("http://a.test.url/solr", lazy=True)
+        with self.assertRaises(requests.exceptions.ConnectionError):
+            solr_connection.get_core_names()
+            
+        mock_core_status.side_effect = MockAdmin(['test', 'something']).core_status
+        with patch('time.monotonic', return_value=time.monotonic() + SolrConnection.LOAD_RETRY_INTERVAL + 1):
+            self.assertEqual(solr_connection.get_core_names(), ['something'])
+        
+    @patch.object(SolrConnection, 'fetch_core_status')
+    def test_lazy_connection_does_not_refetch_failed_cores_right_away(self, mock_core_status):
+        mock_core_status.side_effect = requests.exceptions.ConnectionError('Connection refused')
+        solr_connection = SolrConnection("http://a.test.url/solr", lazy=True)
+        for _ in range(3):
+            with self.assertRaises(requests.exceptions.ConnectionError):
+                solr_connection.get_core_names()
+        self.assertEqual(mock_core_status.call_count, 1)
+        
+        with patch('time.monotonic', return_value=time.monotonic() + SolrConnection.LOAD_RETRY_INTERVAL + 1):
+            with self.assertRaises(requests.exceptions.ConnectionError):
+                solr_connection.get_core_names()
+        self.assertEqual(mock_core_status.call_count, 2)
+        
+    @patch('requests.Session.get')
+    def test_lazy_connection_raises_when_solr_does_not_respond(self, mock_get):
+        mock_get.side_effect = requests.exceptions.ReadTimeout('Read timed out')
+        solr_connection = SolrConnection("http://a.test.url/solr", lazy=True)
+        with self.assertRaises(requests.exceptions.ReadTimeout):
+            solr_connection.get_core_names()
+        self.assertEqual(mock_get.call_args[1]['timeout'], solr_connection.timeout)
+        self.assertFalse(solr_connection._load_lock.locked())
+        
+    def test_refresh_cores_keeps_known_clients(self):
+        client = self.solr_connection.cores['something']
+        self.solr_connection.queues['something'].append(self.doc)
+        self.solr_connection.fetch_core_status = MockAdmin(['something', 'new']).core_status
+        self.assertEqual(self.solr_connection.refresh_cores(), ['something', 'new'])
+        self.assertEqual(sorted(self.solr_connection.cores.keys()), ['new', 'something'])
+        self.assertIs(self.solr_connection.cores['something'], client)
+        self.assertEqual(self.solr_connection.queues['something'], [self.doc])
+        self.assertEqual(self.solr_connection.queues['new'], [])
+        
+    @patch('threading.Thread')
+    def test_cores_are_refreshed_in_background(self, mock_thread):
+        mock_thread.side_effect = lambda target, **kwargs: MagicMock(start=target)
+        self.solr_connection.refresh_interval = 60
+        self.solr_connection.fetch_core_status = MockAdmin(['test', 'new']).core_status
+        
+        with patch('time.monotonic', return_value=time.monotonic() + 30):
+            self.assertEqual(self.solr_connection.get_core_names(), ['something'])
+        with patch('time.monotonic', return_value=time.monotonic() + 90):
+            self.solr_connection.get_core_names()
+        self.assertEqual(self.solr_connection.get_core_names(), ['new'])
+        
+    @patch('threading.Thread')
+    def test_failed_refresh_keeps_last_known_cores(self, mock_thread):
+        mock_thread.side_effect = lambda target, **kwargs: MagicMock(start=target)
+        self.solr_connection.refresh_interval = 0
+        self.solr_connection.fetch_core_status = MagicMock(
+            side_effect=requests.exceptions.ConnectionError('Connection refused'))
+        
+        self.assertEqual(self.solr_connection.get_core_names(), ['something'])
+        self.assertEqual(self.solr_connection.get_core_names(), ['something'])
+        self.assertEqual(self.solr_connection.fetch_core_status.call_count, 2)
+        
     def test_optimize_with_non_existent_core(self):
         with self.assertRaises(ValueError):
             self.solr_connection.optimize('blahblah')
         
     def test_optimize(self):
-        self.mock_admin.return_value = MockAdmin(['c1', 'c2'])
+        self.mock_core_status.return_value = MockAdmin(['c1', 'c2']).core_status()
         self.solr_connection.cores['test'] = MagicMock()
         self.solr_connection.cores['something'] = MagicMock()
         self.solr_connection.cores['c1'] = MagicMock()
@@ -189,6 +596,13 @@ class SolrModelsTests(TestCase):
         for (key, value) in self.args.items():
             self.assertEqual(self.model.doc[key], value)
     
+    def test_init_does_not_change_other_documents(self):
+        other = SolrThesis(id='otherid', title='othertitle')
+        self.assertEqual(self.model.doc['id'], 'testid')
+        self.assertEqual(self.model.doc['title'], 'testtitle')
+        self.assertEqual(other.doc['author'], '')
+        self.assertEqual(SolrThesis.doc['id'], '')
+    
     def test_get_type(self):
         self.assertEqual(self.model.get_type(), 'thesis')
         
@@ -207,6 +621,11 @@ class SolrModelsTests(TestCase):
         self.assertEquals(result, ['id', 'type', 'title', 'author', 'description', 'updatedAt', 'yearpub',
                                    'advisor', 'publisher', 'uri', 'file_url', 'language', 'keywords'])
         
+    def test_get_models_list_fields(self):
+        self.assertEqual(get_models_list_fields(['thesis']), ['keywords'])
+        self.assertEqual(get_models_list_fields(['blah']), [])
+        self.assertEqual(SolrThesis().doc['keywords'], '')
+        
 class ErrorTypeTests(TestCase):
     def test(self):
         self.assertEqual(ErrorType(0).name, 'UNEXPECTED_SERVER_ERROR')
@@ -363,6 +782,43 @@ class SolrQueryTests(TestCase):
         query = Query('nhưng để và', sanitize=True)
         self.assertEqual(str(query), '"nhưng để và"')
         
+    @patch.object(ViPosTagger, 'postagging', wraps=ViPosTagger.postagging)
+    def test_sanitation_is_memoized(self, mock_postagging):
+        SANITIZE_CACHE.clear()
+        first = Query('Con cáo nâu nhanh nhảy qua 12 chú chó lười', sanitize=True)
+        second = Query('Con cáo nâu nhanh nhảy qua 12 chú chó lười', sanitize=True)
+        self.assertEqual(mock_postagging.call_count, 1)
+        self.assertEqual(str(first), str(second))
+        self.assertEqual(first.deleted_words, 1)
+        self.assertEqual(second.deleted_words, 1)
+        
+    @patch.object(ViPosTagger, 'postagging', wraps=ViPosTagger.postagging)
+    def test_sanitation_memo_distinguishes_queries(self, mock_postagging):
+        SANITIZE_CACHE.clear()
+        self.assertEqual(str(Query('nhưng để và', sanitize=True)), '"nhưng để và"')
+        query = Query('Con cáo nâu nhanh nhảy qua 12 chú chó lười', sanitize=True)
+        self.assertEqual(str(query), '"Con cáo nâu nhanh nhảy qua 12 chó lười"')
+        self.assertEqual(mock_postagging.call_count, 2)
+        
+    @patch.object(Query, 'sanitize_str', return_value=('sanitized', 0))
+    def test_warm_up_does_not_fill_memo(self, mock_sanitize_str):
+        SANITIZE_CACHE.clear()
+        solr_query.warm_up()
+        self.assertEqual(mock_sanitize_str.call_count, 2)
+        self.assertEqual(len(SANITIZE_CACHE), 0)
+        
+    @patch('threading.Thread')
+    def test_warm_up_logs_missing_data(self, mock_thread):
+        mock_thread.side_effect = lambda target, **kwargs: MagicMock(start=target)
+        with patch.object(solr_query, 'warm_up', side_effect=LookupError('punkt')), \
+                self.assertLogs('UTDVN_database.apps', 'WARNING'):
+            apps.start_query_warm_up()
+        
+    @patch('threading.Thread')
+    def test_warm_up_is_not_started_by_apps(self, mock_thread):
+        django_apps.get_app_config('UTDVN_database').ready()
+        self.assertFalse(mock_thread.called)
+        
 class SolrBuilderTests(TestCase):
     def setUp(self):
         self.solr_cores = ['sc1', 'sc2', 'sc3']
@@ -478,6 +934,71 @@ class SolrBuilderTests(TestCase):
             )
         )
         
+    def test_build_search_query_with_invalid_mode(self):
+        with self.assertRaises(ValueError):
+            builder.build_search_query('thesis', '*', {'sort':''}, mode='dismax')
+        
+    def test_build_search_query_with_search_term_in_core_thesis_in_edismax_mode(self):
+        self.assertEqual(
+            builder.build_search_query('thesis', '1+1=2', {'sort':''}, mode='edismax'),
+            (
+                '1\+1=2',
+                {
+                    'default_field':'title', 
+                    'highlight_fields':'title,description', 
+                    'sort':'',
+                    'def_type':'edismax',
+                    'query_fields':'id^1 title^10 author^5 description^8 advisor^5 publisher^4 keywords^6',
+                }
+            )
+        )
+        
+    def test_build_search_query_with_search_all_in_core_thesis_in_edismax_mode(self):
+        query, kwargs = builder.build_search_query('thesis', '*', {'sort':''}, mode='edismax')
+        self.assertEqual(query, '*:*')
+        
+    def test_build_search_query_with_search_number_in_core_thesis_in_edismax_mode(self):
+        query, kwargs = builder.build_search_query('thesis', '2020', {'sort':''}, mode='edismax')
+        self.assertEqual(query, '2020')
+        self.assertEqual(
+            kwargs['query_fields'], 
+            'id^1 title^10 author^5 description^8 advisor^5 publisher^4 keywords^6 yearpub^1')
+        
+    def test_build_search_query_with_search_phrase_in_core_thesis_in_edismax_mode(self):
+        query, kwargs = builder.build_search_query('thesis', 'ung thư phổi', {'sort':'title asc'}, mode='edismax')
+        self.assertEqual(query, '"ung thư phổi"~0')
+        self.assertEqual(kwargs['phrase_fields'], 'title^20 description^8')
+        self.assertEqual(kwargs['sort'], 'title_str asc')
+        
+    def test_build_search_query_with_cursor_adds_id_tiebreak(self):
+        query, kwargs = builder.build_search_query('thesis', '*', {'sort':'title asc', 'cursor_mark':'*'})
+        self.assertEqual(kwargs['sort'], 'title_str asc, id asc')
+        query, kwargs = builder.build_search_query('thesis', '*', {'sort':'', 'cursor_mark':'*'})
+        self.assertEqual(kwargs['sort'], 'score desc, id asc')
+        
+    def test_build_search_query_with_cursor_keeps_id_sort(self):
+        query, kwargs = builder.build_search_query('thesis', '*', {'sort':'yearpub desc,id desc', 'cursor_mark':'*'})
+        self.assertEqual(kwargs['sort'], 'yearpub desc,id desc')
+        query, kwargs = builder.build_search_query('thesis', '*', {'sort':'title asc'})
+        self.assertEqual(kwargs['sort'], 'title_str asc')
+        
+    def test_build_cursor_marks(self):
+        self.assertEqual(builder.build_cursor_marks('*', ['thesis', 'other']), {'thesis': '*', 'other': '*'})
+        self.assertEqual(
+            builder.build_cursor_marks('thesis:AoE=,other:AoI=,gone:AoJ=', ['thesis', 'other']), 
+            {'thesis': 'AoE=', 'other': 'AoI='})
+        
+    def test_build_cursor_marks_with_missing_core(self):
+        with self.assertRaises(ValueError):
+            builder.build_cursor_marks('thesis:AoE=', ['thesis', 'other'])
+        with self.assertRaises(ValueError):
+            builder.build_cursor_marks('thesis:AoE=,other:', ['thesis', 'other'])
+        
+    def test_build_search_query_with_core_test_in_edismax_mode(self):
+        self.assertEqual(
+            builder.build_search_query('test', 'cat:electronics', {}, mode='edismax'), 
+            ('cat:electronics',{}))
+        
     def test_build_document_query(self):
         self.assertEqual(builder.build_document_query('1+1=2',{}), ('id:1\+1=2',{'default_field':'id'}))
         
@@ -511,6 +1032,338 @@ class SolrBuilderTests(TestCase):
                 'exception': ['except']
             }
         )
+        
+    def test_flatten_docs(self):
+        docs = [{'returned': ['rt'], 'list': ['l1', 'l2'], 'number': 5}, {'returned': ['rt2'], 'other': ['o']}]
+        self.assertIs(builder.flatten_docs(docs, ('returned', 'list', 'number', 'not_in_doc')), docs)
+        self.assertEqual(docs, [{'returned': 'rt', 'list': ['l1', 'l2'], 'number': 5}, {'returned': 'rt2', 'other': ['o']}])
+
+class SchemaRegistryTests(TestCase):
+    def setUp(self):
+        self.solr_connection = MagicMock()
+        self.solr_connection.fetch_schema.return_value = self._schema()
+        self.registry = SchemaRegistry(self.solr_connection, 300, 16, 2)
+        
+    def _schema(self, **extra_fields):
+        fields = [
+            {'name': '_version_', 'type': 'plong'},
+            {'name': 'full_text', 'type': 'text_general', 'stored': False},
+            {'name': 'id', 'type': 'string', 'multiValued': False},
+            {'name': 'title', 'type': 'text_general'},
+            {'name': 'yearpub', 'type': 'plong'},
+            {'name': 'keywords', 'type': 'text_general'},
+            {'name': 'uri', 'type': 'string', 'multiValued': True},
+        ]
+        fields += [{'name': name, 'type': field_type} for name, field_type in extra_fields.items()]
+        return {
+            'fieldTypes': [
+                {'name': 'string', 'class': 'solr.StrField'},
+                {'name': 'plong', 'class': 'solr.LongPointField'},
+                {'name': 'text_general', 'class': 'solr.TextField', 'multiValued': True},
+            ],
+            'fields': fields,
+            'dynamicFields': [
+                {'name': '*_str', 'type': 'string', 'multiValued': True},
+                {'name': '*_s', 'type': 'string'},
+            ],
+        }
+        
+    def test_flatten_plan_follows_schema(self):
+        plan = self.registry.flatten_plan('thesis', 'id,title,yearpub,keywords,uri,title_str,author_s,unknown')
+        self.assertEqual(plan, ('title', 'unknown', 'uri'))
+        
+    def test_flatten_plan_keeps_list_fields_of_schemaless_core(self):
+        # A schemaless core makes every field but id multi-valued
+        self.solr_connection.fetch_schema.return_value = {
+            'fields': [{'name': 'id', 'type': 'string', 'multiValued': False}] + [
+                {'name': name, 'type': 'text_general', 'multiValued': True}
+                for name in ['title', 'keywords', 'subject']],
+        }
+        docs = [{'id': 'a', 'title': ['A'], 'keywords': ['k'], 'subject': ['s']}]
+        builder.flatten_docs(docs, self.registry.flatten_plan('thesis', 'id,title,keywords,subject'))
+        self.assertEqual(docs, [{'id': 'a', 'title': 'A', 'keywords': ['k'], 'subject': ['s']}])
+        
+    def test_flatten_plan_is_compiled_once(self):
+        first = self.registry.flatten_plan('thesis', 'id,title')
+        self.assertIs(self.registry.flatten_plan('thesis', 'id,title'), first)
+        self.assertEqual(self.registry.flatten_plan('thesis', 'title,uri'), ('title', 'uri'))
+        self.assertEqual(self.solr_connection.fetch_schema.call_count, 1)
+        
+    def test_flatten_plans_are_bounded(self):
+        first = self.registry.flatten_plan('thesis', 'title,uri')
+        self.assertIs(self.registry.flatten_plan('thesis', 'uri,title,uri,'), first)
+        for fields in ['title', 'uri', 'id,title']:
+            self.registry.flatten_plan('thesis', fields)
+        self.assertEqual(len(self.registry.schemas['thesis'][1]), 2)
+        
+    def test_flatten_plan_without_schema(self):
+        self.solr_connection.fetch_schema.side_effect = requests.exceptions.ConnectionError()
+        self.assertEqual(self.registry.flatten_plan('thesis', 'id,title,keywords'), ('id', 'title'))
+        
+    def test_refetched_schema_replaces_plans(self):
+        self.assertEqual(self.registry.flatten_plan('thesis', 'title,advisor'), ('advisor', 'title'))
+        self.solr_connection.fetch_schema.return_value = self._schema(advisor='plong')
+        self.registry._refresh_and_release('thesis')
+        self.assertEqual(self.registry.flatten_plan('thesis', 'title,advisor'), ('title',))
+        
+    def test_failed_refresh_keeps_schema(self):
+        self.registry.flatten_plan('thesis', 'title,yearpub')
+        self.solr_connection.fetch_schema.side_effect = requests.exceptions.ConnectionError()
+        self.registry._refresh_and_release('thesis')
+        self.assertEqual(self.registry.flatten_plan('thesis', 'title,yearpub'), ('title',))
+        
+    def test_change_refreshes_schema(self):
+        self.registry.flatten_plan('thesis', 'title')
+        listener = self.solr_connection.add_change_listener.call_args[0][0]
+        listener('thesis')
+        with patch.object(self.registry, '_refresh_in_background') as mock_refresh:
+            self.registry.flatten_plan('thesis', 'title')
+        mock_refresh.assert_called_once_with('thesis')
+        
+    def test_return_fields_follow_schema(self):
+        schema = self._schema(subject='text_general')
+        schema['fields'].append({'name': 'language', 'type': 'string', 'stored': False})
+        self.solr_connection.fetch_schema.return_value = schema
+        self.registry.load('thesis')
+        self.assertEqual(
+            self.registry.build_return_fields('', ['thesis']),
+            'id,type,title,author,description,updatedAt,yearpub,advisor,publisher,uri,file_url,keywords,subject')
+        self.assertEqual(self.registry.build_return_fields('uri', ['thesis']), 'id,title,author,description,updatedAt,uri')
+        for fields in ['language', 'full_text', '_version_', 'blah']:
+            with self.assertRaises(ValueError):
+                self.registry.build_return_fields(fields, ['thesis'])
+        
+    @patch.object(SchemaRegistry, '_refresh_in_background')
+    def test_return_fields_of_cores_without_models(self, mock_refresh):
+        self.registry.load('other')
+        self.assertEqual(
+            self.registry.build_return_fields('', ['thesis', 'other']),
+            'id,type,title,author,description,updatedAt,yearpub,advisor,publisher,uri,file_url,language,keywords')
+        self.assertEqual(self.registry.build_return_fields('', ['other']), 'id,title,yearpub,keywords,uri')
+        
+    def test_return_fields_use_models_until_schema_is_loaded(self):
+        with patch.object(self.registry, '_refresh_in_background') as mock_refresh:
+            self.assertEqual(self.registry.build_return_fields('advisor', ['thesis']), builder.build_return_fields('advisor', ['thesis']))
+        mock_refresh.assert_called_once_with('thesis')
+        self.assertFalse(self.solr_connection.fetch_schema.called)
+        
+    def test_return_fields_are_memoized(self):
+        self.registry.load('thesis')
+        with patch.object(builder, 'build_return_fields', wraps=builder.build_return_fields) as mock_build:
+            for _ in range(3):
+                self.registry.build_return_fields('uri', ['thesis'])
+                with self.assertRaises(ValueError):
+                    self.registry.build_return_fields('blah', ['thesis'])
+        self.assertEqual(mock_build.call_count, 2)
+        
+    def test_changed_schema_rebuilds_return_fields(self):
+        self.registry.load('thesis')
+        with self.assertRaises(ValueError):
+            self.registry.build_return_fields('subject', ['thesis'])
+        self.solr_connection.fetch_schema.return_value = self._schema(subject='text_general')
+        self.registry._refresh_and_release('thesis')
+        self.assertEqual(
+            self.registry.build_return_fields('subject', ['thesis']), 'id,title,author,description,updatedAt,subject')
+        
+    def test_return_fields_of_empty_schemaless_core(self):
+        # A schemaless core without documents only has id
+        self.solr_connection.fetch_schema.return_value = {
+            'fields': [{'name': 'id', 'type': 'string', 'multiValued': False}]}
+        with patch.object(self.registry, '_refresh_in_background'):
+            before = self.registry.build_return_fields('title', ['thesis'])
+        self.registry.load('thesis')
+        self.assertEqual(self.registry.build_return_fields('title', ['thesis']), before)
+        self.assertEqual(self.registry.build_return_fields('', ['thesis']), builder.build_return_fields('', ['thesis']))
+        
+    @patch.object(SOLR, 'get_core_names', return_value=['thesis'])
+    @patch.object(SOLR, 'query')
+    def test_search_flattens_with_plan(self, mock_query, mock_get_core_names):
+        views.SEARCH_CACHE.invalidate()
+        mock_query.return_value = {'response': {'numFound': 1, 'start': 0, 'docs': [
+            {'id': 'a', 'title': ['A'], 'yearpub': 2019, 'keywords': ['lung']}]}}
+        with patch.object(views, 'SCHEMAS', self.registry):
+            response = self.client.get(reverse('UTDVN_database:search'), {'q': '*', 'return': 'yearpub'})
+        self.assertEqual(response.json()['data'][0]['response']['docs'],
+                         [{'id': 'a', 'title': 'A', 'yearpub': 2019, 'keywords': ['lung']}])
+
+class QueryStatsTests(TestCase):
+    def test_percentiles_of_last_queries(self):
+        stats = QueryStats(window=4)
+        for qtime in range(10):
+            stats.record('thesis', qtime, (qtime + 2) / 1000.0, 100 * qtime)
+        core_stats = stats.stats()['thesis']
+        self.assertEqual(core_stats['queries'], 10)
+        self.assertEqual(core_stats['window'], 4)
+        self.assertEqual(core_stats['qtimeMs'], {'p50': 7, 'p95': 9, 'p99': 9})
+        self.assertEqual(core_stats['overheadMs'], {'p50': 2, 'p95': 2, 'p99': 2})
+        self.assertEqual(core_stats['bytes']['p99'], 900)
+        
+    def test_unknown_qtime(self):
+        stats = QueryStats(window=4)
+        stats.record('thesis', None, 0.005, 10)
+        core_stats = stats.stats()['thesis']
+        self.assertEqual(core_stats['qtimeMs'], {})
+        self.assertEqual(core_stats['overheadMs'], {})
+        self.assertEqual(core_stats['requestMs'], {'p50': 5, 'p95': 5, 'p99': 5})
+        
+class LRUCacheTests(TestCase):
+    def setUp(self):
+        self.cache = LRUCache(2)
+        
+    def test_get_missing_key(self):
+        self.assertEqual(self.cache.get('a'), None)
+        self.assertEqual(self.cache.get('a', 'default'), 'default')
+        
+    def test_set_and_get(self):
+        self.cache.set('a', 1)
+        self.assertEqual(self.cache.get('a'), 1)
+        
+    def test_evicts_least_recently_used(self):
+        self.cache.set('a', 1)
+        self.cache.set('b', 2)
+        self.cache.get('a')
+        self.cache.set('c', 3)
+        self.assertEqual(self.cache.get('a'), 1)
+        self.assertEqual(self.cache.get('b'), None)
+        self.assertEqual(self.cache.get('c'), 3)
+        
+    def test_expires_entries(self):
+        cache = LRUCache(2, ttl=10)
+        with patch('time.monotonic', return_value=100):
+            cache.set('a', 1)
+        with patch('time.monotonic', return_value=105):
+            self.assertEqual(cache.get('a'), 1)
+        with patch('time.monotonic', return_value=110):
+            self.assertEqual(cache.get('a'), None)
+        self.assertEqual(len(cache), 0)
+        
+    def test_size_0_stores_nothing(self):
+        cache = LRUCache(0)
+        cache.set('a', 1)
+        self.assertEqual(cache.get('a'), None)
+        
+    def test_clear(self):
+        self.cache.set('a', 1)
+        self.cache.clear()
+        self.assertEqual(len(self.cache), 0)
+        
+    def test_stats(self):
+        cache = LRUCache(1, ttl=10)
+        with patch('time.monotonic', return_value=100):
+            cache.set('a', 1)
+            cache.get('a')
+            cache.get('b')
+            cache.set('b', 2)
+        with patch('time.monotonic', return_value=200):
+            cache.get('b')
+        self.assertEqual(cache.stats(), {
+            'size': 0, 'maxsize': 1, 'hits': 1, 'misses': 2, 'evictions': 1, 'expirations': 1})
+        
+class SearchCacheTests(TestCase):
+    @patch.object(SolrConnection, 'fetch_core_status')
+    @patch('pysolr.Solr')
+    def setUp(self, mock_solr, mock_core_status):
+        mock_solr.return_value = MagicMock()
+        mock_core_status.return_value = MockAdmin(['thesis'], {'thesis': 1}).core_status()
+        self.solr_connection = SolrConnection("http://a.test.url/solr")
+        self.cache = SearchCache(self.solr_connection, 10, version_check_interval=0)
+        self.key = SearchCache.make_key({'q': '*'})
+        
+    def test_make_key_ignores_unrelated_params(self):
+        self.assertEqual(
+            SearchCache.make_key({'q': '*', 'types': 'thesis', 'page': '2'}),
+            SearchCache.make_key({'types': 'thesis', 'q': '*'}))
+        
+    def test_make_key_normalizes_sort(self):
+        self.assertEqual(
+            SearchCache.make_key({'q': '*', 'sort': 'title asc,  yearpub   desc'}),
+            SearchCache.make_key({'q': '*', 'sort': 'title asc, yearpub desc'}))
+        
+    def test_make_key_distinguishes_params(self):
+        self.assertNotEqual(SearchCache.make_key({'q': '*'}), SearchCache.make_key({'q': '*', 'rows': '20'}))
+        self.assertNotEqual(SearchCache.make_key({'q': 'a'}), SearchCache.make_key({'q': 'a '}))
+        
+    def test_get_and_set(self):
+        self.assertEqual(self.cache.get(self.key), None)
+        self.cache.set(self.key, b'{}', self.cache.generation)
+        self.assertEqual(self.cache.get(self.key), b'{}')
+        
+    def test_disabled(self):
+        cache = SearchCache(self.solr_connection, 0)
+        cache.set(self.key, b'{}', cache.generation)
+        self.assertEqual(cache.get(self.key), None)
+        
+    def test_set_after_invalidation_is_ignored(self):
+        generation = self.cache.generation
+        self.cache.invalidate()
+        self.cache.set(self.key, b'{}', generation)
+        self.assertEqual(self.cache.get(self.key), None)
+        
+    def test_invalidated_by_commit(self):
+        self.cache.set(self.key, b'{}', self.cache.generation)
+        self.solr_connection.add_documents('thesis', [{'id': 'a'}])
+        self.assertEqual(self.cache.get(self.key), None)
+        self.assertEqual(self.cache.stats()['invalidations'], 1)
+        
+    def test_invalidated_by_optimize(self):
+        self.cache.set(self.key, b'{}', self.cache.generation)
+        self.solr_connection.optimize('thesis')
+        self.assertEqual(self.cache.get(self.key), None)
+        
+    @patch('threading.Thread')
+    def test_invalidated_by_index_version_change(self, mock_thread):
+        mock_thread.side_effect = lambda target, **kwargs: MagicMock(start=target)
+        self.solr_connection.fetch_core_status = MockAdmin(['thesis'], {'thesis': 1}).core_status
+        self.cache.get(self.key)
+        self.cache.set(self.key, b'{}', self.cache.generation)
+        self.assertEqual(self.cache.get(self.key), b'{}')
+        self.solr_connection.fetch_core_status = MockAdmin(['thesis'], {'thesis': 2}).core_status
+        self.assertEqual(self.cache.get(self.key), None)
+        
+    @patch('threading.Thread')
+    def test_keeps_serving_when_solr_is_unreachable(self, mock_thread):
+        mock_thread.side_effect = lambda target, **kwargs: MagicMock(start=target)
+        self.solr_connection.fetch_core_status = MockAdmin(['thesis'], {'thesis': 1}).core_status
+        self.cache.get(self.key)
+        self.cache.set(self.key, b'{}', self.cache.generation)
+        self.solr_connection.fetch_core_status = MagicMock(side_effect=requests.exceptions.ConnectionError())
+        self.assertEqual(self.cache.get(self.key), b'{}')
+        
+    @patch('threading.Thread')
+    def test_checks_index_versions_at_most_once_per_interval(self, mock_thread):
+        mock_thread.side_effect = lambda target, **kwargs: MagicMock(start=target)
+        cache = SearchCache(self.solr_connection, 10, version_check_interval=60)
+        with patch.object(self.solr_connection, 'fetch_index_versions', return_value={}) as mock_fetch:
+            cache.get(self.key)
+            cache.get(self.key)
+            self.assertEqual(mock_fetch.call_count, 1)
+        
+    def test_get_does_not_wait_for_index_versions(self):
+        started = threading.Event()
+        release = threading.Event()
+        def fetch_index_versions():
+            started.set()
+            release.wait(5)
+            return {'thesis': 1}
+        
+        with patch.object(self.solr_connection, 'fetch_index_versions', side_effect=fetch_index_versions):
+            self.cache.set(self.key, b'{}', self.cache.generation)
+            self.assertEqual(self.cache.get(self.key), b'{}')
+            self.assertTrue(started.wait(5))
+            self.assertEqual(self.cache.get(self.key), b'{}')
+            release.set()
+            
+    def test_set_is_atomic_with_invalidate(self):
+        generation = self.cache.generation
+        with self.cache.generation_lock:
+            thread = threading.Thread(target=self.cache.set, args=(self.key, b'{}', generation))
+            thread.start()
+            thread.join(0.05)
+            # set waits for the lock rather than comparing generations without it
+            self.assertTrue(thread.is_alive())
+            self.cache.generation += 1
+        thread.join(5)
+        self.assertEqual(self.cache.get(self.key), None)
 
 class CoresViewTests(TestCase):
     def test_post_method(self):
@@ -521,6 +1374,17 @@ class CoresViewTests(TestCase):
         response = self.client.get(reverse('UTDVN_database:cores'))
         self.assertNotContains(response, "test")
         self.assertContains(response, "thesis")
+        
+    @patch.object(SOLR, 'get_core_names', side_effect=requests.exceptions.ConnectionError('Connection refused'))
+    def test_get_method_when_solr_is_unreachable(self, mock_get_core_names):
+        response = self.client.get(reverse('UTDVN_database:cores'))
+        self.assertEqual(response.status_code, 503)
+        self.assertEqual(response.json()['errorType'], ErrorType.SOLR_CONNECTION_ERROR.name)
+        
+        response = self.client.get(reverse('UTDVN_database:search'), {'q': '*'})
+        self.assertEqual(response.status_code, 503)
+        response = self.client.get(reverse('UTDVN_database:document'), {'id': 'someid'})
+        self.assertEqual(response.status_code, 503)
 
 class SearchViewTests(TestCase):
     def test_post_method(self):
@@ -650,6 +1514,448 @@ class SearchViewTests(TestCase):
         self.assertEqual(d['docs'][0]['id'], '9885A004')
         self.assertEqual(d['docs'][0]['name'], ['Canon PowerShot SD500'])
         
+class MockCoresTestCase(TestCase):
+    """
+    Base class of the view tests, which search the cores in CORES without reaching Solr
+    and start with an empty search cache.
+    """
+    CORES = ('thesis', 'other')
+    
+    def setUp(self):
+        views.SEARCH_CACHE.invalidate()
+        patcher = patch.object(SOLR, 'get_core_names', return_value=list(self.CORES))
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        
+    def _documents(self, docs, num_found=None):
+        return {'response': {'numFound': len(docs) if num_found is None else num_found, 'start': 0, 'docs': docs}}
+        
+    def _response(self, core, num_found=1):
+        return self._documents([{'id': [core]}], num_found)
+    
+class SearchFanOutTests(MockCoresTestCase):
+    def _error(self, msg, code):
+        return {'error': {'msg': msg, 'code': code}}
+        
+    @patch.object(SOLR, 'query')
+    def test_queries_every_core(self, mock_query):
+        mock_query.side_effect = lambda core, *args, **kwargs: self._response(core)
+        response = self.client.get(reverse('UTDVN_database:search'), {'q': '*'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(sorted(c[0][0] for c in mock_query.call_args_list), ['other', 'thesis'])
+        
+    @patch.object(SOLR, 'query')
+    def test_keeps_core_order_when_first_core_is_slowest(self, mock_query):
+        def query(core, *args, **kwargs):
+            if core == 'thesis':
+                time.sleep(0.2)
+            return self._response(core)
+        mock_query.side_effect = query
+        
+        response = self.client.get(reverse('UTDVN_database:search'), {'q': '*'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([d['type'] for d in response.json()['data']], ['thesis', 'other'])
+        self.assertEqual(response.json()['data'][0]['response']['docs'][0]['id'], 'thesis')
+        
+    @patch.object(SOLR, 'query')
+    def test_queries_cores_concurrently(self, mock_query):
+        def query(core, *args, **kwargs):
+            time.sleep(0.3)
+            return self._response(core)
+        mock_query.side_effect = query
+        
+        start = time.monotonic()
+        response = self.client.get(reverse('UTDVN_database:search'), {'q': '*'})
+        self.assertEqual(response.status_code, 200)
+        self.assertLess(time.monotonic() - start, 0.55)
+        
+    @patch.object(SOLR, 'query')
+    def test_returns_error_of_failing_core(self, mock_query):
+        mock_query.side_effect = lambda core, *args, **kwargs: \
+            self._error('bad query', 400) if core == 'other' else self._response(core)
+        response = self.client.get(reverse('UTDVN_database:search'), {'q': '*'})
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.json()['errorType'], ErrorType.SOLR_SEARCH_ERROR.name)
+        self.assertEqual(response.json()['message'], 'bad query on core other')
+        
+    @patch.object(SOLR, 'query')
+    def test_returns_error_of_first_failing_core(self, mock_query):
+        def query(core, *args, **kwargs):
+            if core == 'thesis':
+                time.sleep(0.1)
+                return self._error('first', 400)
+            return self._error('second', 500)
+        mock_query.side_effect = query
+        
+        response = self.client.get(reverse('UTDVN_database:search'), {'q': '*'})
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.json()['message'], 'first on core thesis')
+        
+    @patch.object(SOLR, 'query')
+    def test_returns_unexpected_server_error_on_malformed_response(self, mock_query):
+        mock_query.return_value = {}
+        response = self.client.get(reverse('UTDVN_database:search'), {'q': '*'})
+        self.assertEqual(response.status_code, 500)
+        self.assertEqual(response.json()['errorType'], ErrorType.UNEXPECTED_SERVER_ERROR.name)
+        
+    @patch.object(SOLR, 'query')
+    def test_returns_connection_error_when_solr_is_unreachable(self, mock_query):
+        mock_query.side_effect = requests.exceptions.ConnectionError('Connection refused')
+        response = self.client.get(reverse('UTDVN_database:search'), {'q': '*'})
+        self.assertEqual(response.status_code, 503)
+        self.assertEqual(response.json()['errorType'], ErrorType.SOLR_CONNECTION_ERROR.name)
+        
+    @patch.object(SOLR, 'query')
+    def test_cursor_returns_next_cursor_of_every_core(self, mock_query):
+        def query(core, *args, **kwargs):
+            return dict(self._response(core), nextCursorMark=core + '-' + kwargs['cursor_mark'])
+        mock_query.side_effect = query
+        
+        response = self.client.get(reverse('UTDVN_database:search'), {'q': '*', 'cursor': '*', 'rows': '5'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['nextCursor'], 'thesis:thesis-*,other:other-*')
+        self.assertEqual(response.json()['data'][0]['nextCursorMark'], 'thesis-*')
+        for call in mock_query.call_args_list:
+            self.assertEqual(call[1]['start'], '')
+            self.assertIn('id asc', call[1]['sort'])
+        
+        mock_query.reset_mock()
+        response = self.client.get(
+            reverse('UTDVN_database:search'), {'q': '*', 'cursor': response.json()['nextCursor']})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(
+            sorted(call[1]['cursor_mark'] for call in mock_query.call_args_list), ['other-*', 'thesis-*'])
+        
+    @patch.object(SOLR, 'query')
+    def test_no_next_cursor_without_cursor(self, mock_query):
+        mock_query.side_effect = lambda core, *args, **kwargs: self._response(core)
+        response = self.client.get(reverse('UTDVN_database:search'), {'q': '*'})
+        self.assertEqual(response.status_code, 200)
+        self.assertNotIn('nextCursor', response.json())
+        self.assertNotIn('cursor_mark', mock_query.call_args[1])
+        
+    @patch.object(SOLR, 'query')
+    def test_invalid_cursor(self, mock_query):
+        for params in [
+                {'q': '*', 'cursor': 'thesis:AoE='},
+                {'q': '*', 'cursor': '*', 'start': '10'},
+                {'q': '*', 'cursor': '*', 'stream': 'true'}]:
+            response = self.client.get(reverse('UTDVN_database:search'), params)
+            self.assertEqual(response.status_code, 400)
+            self.assertEqual(response.json()['errorType'], ErrorType.INVALID_SEARCH_REQUEST.name)
+        mock_query.assert_not_called()
+        
+    @patch.object(views, 'SEARCH_CORE_TIMEOUT', 0.1)
+    @patch.object(SOLR, 'query')
+    def test_timeout(self, mock_query):
+        def query(core, *args, **kwargs):
+            if core == 'other':
+                time.sleep(0.5)
+            return self._response(core)
+        mock_query.side_effect = query
+        
+        response = self.client.get(reverse('UTDVN_database:search'), {'q': '*'})
+        self.assertEqual(response.status_code, 504)
+        self.assertEqual(response.json()['errorType'], ErrorType.SOLR_CONNECTION_ERROR.name)
+        self.assertRegex(response.json()['message'], 'on core other$')
+        
+class AsyncViewTests(MockCoresTestCase):
+    def setUp(self):
+        super().setUp()
+        self.factory = RequestFactory()
+        
+    def _search(self, params):
+        return async_to_sync(views.async_search)(self.factory.get('/api/search/', params))
+    
+    def _document(self, params):
+        return async_to_sync(views.async_document)(self.factory.get('/api/document/', params))
+        
+    def test_post_method(self):
+        request = self.factory.post('/api/search/')
+        self.assertEqual(async_to_sync(views.async_search)(request).status_code, 405)
+        self.assertEqual(async_to_sync(views.async_document)(request).status_code, 405)
+        self.assertEqual(async_to_sync(views.async_cores)(request).status_code, 405)
+    
+    def test_cores(self):
+        response = async_to_sync(views.async_cores)(self.factory.get('/api/cores/'))
+        self.assertEqual(json.loads(response.content), ['thesis', 'other'])
+        
+    def test_cores_are_not_fetched_on_event_loop(self):
+        threads = []
+        async def cores():
+            threads.append(threading.current_thread())
+            return await views.async_cores(self.factory.get('/api/cores/'))
+        
+        with patch.object(SOLR, 'get_core_names', side_effect=lambda: threads.append(threading.current_thread()) or []):
+            async_to_sync(cores)()
+        self.assertEqual(len(threads), 2)
+        self.assertIsNot(threads[1], threads[0])
+        
+    @patch.object(SOLR, 'has_cores', return_value=False)
+    def test_cores_are_loaded_off_event_loop(self, mock_has_cores):
+        threads = []
+        async def view(view_func, path):
+            threads.append(threading.current_thread())
+            return await view_func(self.factory.get(path, {'q': '*', 'id': 'a', 'types': 'none'}))
+        
+        with patch.object(SOLR, 'get_core_names', side_effect=lambda: threads.append(threading.current_thread()) or []):
+            async_to_sync(view)(views.async_search, '/api/search/')
+            async_to_sync(view)(views.async_document, '/api/document/')
+        # Each view fetches the cores on the executor, then gets them again on the event loop
+        self.assertEqual(len(threads), 6)
+        self.assertIsNot(threads[1], threads[0])
+        self.assertIsNot(threads[4], threads[3])
+        
+    @patch.object(SOLR, 'has_cores', return_value=False)
+    def test_search_when_cores_cannot_be_loaded(self, mock_has_cores):
+        with patch.object(SOLR, 'get_core_names', side_effect=requests.exceptions.ReadTimeout('Read timed out')):
+            self.assertEqual(self._search({'q': '*'}).status_code, 503)
+            self.assertEqual(self._document({'id': 'a'}).status_code, 503)
+        
+    def test_search_without_param_q(self):
+        response = self._search({})
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(json.loads(response.content)['errorType'], ErrorType.INVALID_SEARCH_REQUEST.name)
+        
+    @patch.object(SOLR, 'aquery', new_callable=AsyncMock)
+    def test_search_matches_sync_view(self, mock_aquery):
+        mock_aquery.side_effect = lambda core, *args, **kwargs: self._response(core)
+        with patch.object(SOLR, 'query', side_effect=lambda core, *args, **kwargs: self._response(core)):
+            expected = views.search(self.factory.get('/api/search/', {'q': 'ung thư', 'rows': 5}))
+        views.SEARCH_CACHE.invalidate()
+        
+        response = self._search({'q': 'ung thư', 'rows': 5})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(json.loads(response.content), json.loads(expected.content))
+        
+    @patch.object(SOLR, 'aquery', new_callable=AsyncMock)
+    def test_stream_params_are_validated_before_cache(self, mock_aquery):
+        mock_aquery.side_effect = lambda core, *args, **kwargs: self._response(core)
+        rows = views.SEARCH_STREAM_MAX_ROWS + 1
+        self.assertEqual(self._search({'q': '*', 'rows': rows}).status_code, 200)
+        self.assertEqual(self._search({'q': '*', 'cursor': '*'}).status_code, 200)
+        
+        self.assertEqual(self._search({'q': '*', 'rows': rows, 'stream': 'true'}).status_code, 400)
+        self.assertEqual(self._search({'q': '*', 'cursor': '*', 'stream': 'true'}).status_code, 400)
+        
+    @patch.object(SOLR, 'aquery', new_callable=AsyncMock)
+    def test_search_queries_cores_concurrently(self, mock_aquery):
+        async def aquery(core, *args, **kwargs):
+            await asyncio.sleep(0.3 if core == 'thesis' else 0.1)
+            return self._response(core)
+        mock_aquery.side_effect = aquery
+        
+        start = time.monotonic()
+        response = self._search({'q': '*'})
+        self.assertLess(time.monotonic() - start, 0.55)
+        self.assertEqual([d['type'] for d in json.loads(response.content)['data']], ['thesis', 'other'])
+        
+    @patch.object(SOLR, 'aquery', new_callable=AsyncMock)
+    def test_search_returns_connection_error_when_solr_is_unreachable(self, mock_aquery):
+        mock_aquery.side_effect = aiohttp.ClientConnectionError('Connection refused')
+        response = self._search({'q': '*'})
+        self.assertEqual(response.status_code, 503)
+        self.assertEqual(json.loads(response.content)['errorType'], ErrorType.SOLR_CONNECTION_ERROR.name)
+        
+    @patch.object(views, 'SEARCH_CORE_TIMEOUT', 0.1)
+    @patch.object(SOLR, 'aquery', new_callable=AsyncMock)
+    def test_search_timeout(self, mock_aquery):
+        async def aquery(core, *args, **kwargs):
+            if core == 'other':
+                await asyncio.sleep(0.5)
+            return self._response(core)
+        mock_aquery.side_effect = aquery
+        
+        response = self._search({'q': '*'})
+        self.assertEqual(response.status_code, 504)
+        self.assertRegex(json.loads(response.content)['message'], 'on core other$')
+        
+    @patch.object(SOLR, 'aquery', new_callable=AsyncMock)
+    def test_search_is_cached(self, mock_aquery):
+        mock_aquery.side_effect = lambda core, *args, **kwargs: self._response(core)
+        first = self._search({'q': '*'})
+        second = self._search({'q': '*'})
+        self.assertEqual(first.content, second.content)
+        self.assertEqual(mock_aquery.call_count, 2)
+        
+    @patch.object(SOLR, 'aget_documents', new_callable=AsyncMock)
+    def test_document_returns_first_core_having_it(self, mock_aget_documents):
+        mock_aget_documents.side_effect = lambda core, ids, *args: \
+            {'response': {'numFound': 0 if core == 'thesis' else 1, 'docs': [] if core == 'thesis' else [{'id': ids[0]}]}}
+        response = self._document({'id': 'someid'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(json.loads(response.content)['data'], {'type': 'other', 'doc': {'id': 'someid'}})
+        
+    @patch.object(SOLR, 'aget_documents', new_callable=AsyncMock)
+    def test_document_not_found(self, mock_aget_documents):
+        mock_aget_documents.return_value = {'response': {'numFound': 0, 'docs': []}}
+        self.assertEqual(self._document({'id': 'someid'}).status_code, 404)
+        
+    @patch.object(SOLR, 'aget_documents', new_callable=AsyncMock)
+    def test_document_batch(self, mock_aget_documents):
+        mock_aget_documents.side_effect = lambda core, ids, *args: \
+            {'response': {'numFound': 1, 'docs': [{'id': 'b' if core == 'thesis' else 'a'}]}}
+        response = self._document({'ids': 'a,b,c'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(
+            json.loads(response.content)['data'], 
+            [{'type': 'other', 'doc': {'id': 'a'}}, {'type': 'thesis', 'doc': {'id': 'b'}}])
+        
+class StreamingSearchTests(MockCoresTestCase):
+    def _query(self, core, query, start='', rows='', **kwargs):
+        start = int(start) if start != '' else 0
+        rows = int(rows) if rows != '' else 10
+        num_found = 250 if core == 'thesis' else 3
+        docs = [{'id': '%s%d' % (core, i), 'title': ['Title %d' % i]} for i in range(start, min(num_found, start + rows))]
+        return {
+            'response': {'numFound': num_found, 'start': start, 'docs': docs},
+            'highlighting': {doc['id']: {'title': doc['title']} for doc in docs},
+        }
+    
+    def _search(self, params):
+        response = self.client.get(reverse('UTDVN_database:search'), params)
+        if response.streaming:
+            return response, json.loads(b''.join(response.streaming_content))
+        return response, response.json()
+        
+    @patch.object(views, 'SEARCH_STREAM_CHUNK_ROWS', 100)
+    @patch.object(SOLR, 'query')
+    def test_matches_search_response(self, mock_query):
+        mock_query.side_effect = self._query
+        response, streamed = self._search({'q': '*', 'rows': 240, 'start': 5, 'stream': 'true'})
+        self.assertTrue(response.streaming)
+        _, expected = self._search({'q': '*', 'rows': 240, 'start': 5})
+        self.assertEqual(streamed, expected)
+        self.assertEqual(len(streamed['data'][0]['response']['docs']), 240)
+        
+    @patch.object(views, 'SEARCH_STREAM_CHUNK_ROWS', 100)
+    @patch.object(SOLR, 'query')
+    def test_fetches_in_chunks(self, mock_query):
+        mock_query.side_effect = self._query
+        self._search({'q': '*', 'rows': 240, 'stream': 'true'})
+        thesis_calls = [c[1] for c in mock_query.call_args_list if c[0][0] == 'thesis']
+        self.assertEqual([(c['start'], c['rows']) for c in thesis_calls], [(0, 100), (100, 100), (200, 40)])
+        self.assertEqual(len([c for c in mock_query.call_args_list if c[0][0] == 'other']), 1)
+        
+    @patch.object(SOLR, 'query')
+    def test_rows_above_limit(self, mock_query):
+        response, content = self._search({'q': '*', 'rows': views.SEARCH_STREAM_MAX_ROWS + 1, 'stream': 'true'})
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(content['errorType'], ErrorType.INVALID_SEARCH_REQUEST.name)
+        self.assertFalse(mock_query.called)
+        
+    def test_rows_not_a_number(self):
+        response, content = self._search({'q': '*', 'rows': 'abc', 'stream': 'true'})
+        self.assertEqual(response.status_code, 400)
+        
+    @patch.object(SOLR, 'query')
+    def test_returns_error_of_first_chunk(self, mock_query):
+        mock_query.side_effect = lambda core, *args, **kwargs: \
+            {'error': {'msg': 'bad query', 'code': 400}} if core == 'other' else self._query(core, *args, **kwargs)
+        response, content = self._search({'q': '*', 'stream': 'true'})
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(content['message'], 'bad query on core other')
+        
+class RawSearchTests(MockCoresTestCase):
+    def _query(self, core, query, cursor_mark='', **kwargs):
+        response = {
+            'response': {'numFound': 1, 'start': 0, 'docs': [{'id': core + '1', 'title': ['Tiêu đề "1"']}]},
+            'highlighting': {core + '1': {'title': ['<em>Tiêu</em> đề']}},
+        }
+        if cursor_mark != '':
+            response['nextCursorMark'] = 'AoE' + core
+        return response
+    
+    def _query_raw(self, core, query, **kwargs):
+        return json.dumps(self._query(core, query, **kwargs), indent=2, ensure_ascii=False).encode('utf-8')
+        
+    @patch.object(SOLR, 'query_raw')
+    @patch.object(SOLR, 'query')
+    def test_matches_search_response_without_flattening(self, mock_query, mock_query_raw):
+        mock_query.side_effect = self._query
+        mock_query_raw.side_effect = self._query_raw
+        raw = self.client.get(reverse('UTDVN_database:search'), {'q': '*', 'raw': 'true'})
+        self.assertEqual(raw.status_code, 200)
+        self.assertEqual(mock_query_raw.call_count, 2)
+        
+        expected = self.client.get(reverse('UTDVN_database:search'), {'q': '*'}).json()
+        for core_response in expected['data']:
+            for doc in core_response['response']['docs']:
+                doc['title'] = [doc['title']]
+        self.assertEqual(raw.json(), expected)
+        
+    @patch.object(SOLR, 'query_raw')
+    def test_joins_cursor_marks(self, mock_query_raw):
+        mock_query_raw.side_effect = self._query_raw
+        response = self.client.get(reverse('UTDVN_database:search'), {'q': '*', 'raw': 'true', 'cursor': '*'})
+        self.assertEqual(response.json()['nextCursor'], 'thesis:AoEthesis,other:AoEother')
+        
+    @patch.object(SOLR, 'query_raw')
+    def test_returns_error_of_core(self, mock_query_raw):
+        mock_query_raw.side_effect = lambda core, *args, **kwargs: \
+            {'error': {'msg': 'bad query', 'code': 400}} if core == 'other' else self._query_raw(core, *args, **kwargs)
+        response = self.client.get(reverse('UTDVN_database:search'), {'q': '*', 'raw': 'true'})
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.json()['message'], 'bad query on core other')
+        
+    @patch.object(SOLR, 'query_raw')
+    def test_invalid_body(self, mock_query_raw):
+        mock_query_raw.return_value = b'<html></html>'
+        response = self.client.get(reverse('UTDVN_database:search'), {'q': '*', 'raw': 'true'})
+        self.assertEqual(response.status_code, 500)
+        
+    def test_cannot_stream(self):
+        response = self.client.get(reverse('UTDVN_database:search'), {'q': '*', 'raw': 'true', 'stream': 'true'})
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.json()['errorType'], ErrorType.INVALID_SEARCH_REQUEST.name)
+        
+    @patch.object(SOLR, 'aquery_raw', new_callable=AsyncMock)
+    @patch.object(SOLR, 'query_raw')
+    def test_async_matches_sync_view(self, mock_query_raw, mock_aquery_raw):
+        mock_query_raw.side_effect = self._query_raw
+        mock_aquery_raw.side_effect = self._query_raw
+        params = {'q': '*', 'raw': 'true'}
+        expected = self.client.get(reverse('UTDVN_database:search'), params).content
+        views.SEARCH_CACHE.invalidate()
+        response = async_to_sync(views.async_search)(RequestFactory().get('/api/search/', params))
+        self.assertEqual(response.content, expected)
+        
+    def test_cache_key_distinguishes_raw(self):
+        self.assertNotEqual(SearchCache.make_key({'q': '*'}), SearchCache.make_key({'q': '*', 'raw': 'true'}))
+        
+class SearchCacheViewTests(MockCoresTestCase):
+    CORES = ('thesis',)
+    
+    @patch.object(SOLR, 'query')
+    def test_repeated_search_is_served_from_cache(self, mock_query):
+        mock_query.return_value = self._documents([{'id': 'a'}])
+        first = self.client.get(reverse('UTDVN_database:search'), {'q': 'ung thư'})
+        second = self.client.get(reverse('UTDVN_database:search'), {'q': 'ung thư'})
+        self.assertEqual(mock_query.call_count, 1)
+        self.assertEqual(second.status_code, 200)
+        self.assertEqual(second.json(), first.json())
+        
+    @patch.object(SOLR, 'query')
+    def test_errors_are_not_cached(self, mock_query):
+        mock_query.return_value = {'error': {'msg': 'bad query', 'code': 400}}
+        self.client.get(reverse('UTDVN_database:search'), {'q': '*'})
+        self.client.get(reverse('UTDVN_database:search'), {'q': '*'})
+        self.assertEqual(mock_query.call_count, 2)
+        
+    def test_stats(self):
+        response = self.client.get(reverse('UTDVN_database:stats'))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(
+            sorted(response.json()['searchCache'].keys()),
+            ['evictions', 'expirations', 'hits', 'invalidations', 'maxsize', 'misses', 'size'])
+        self.assertEqual(
+            sorted(response.json()['sanitizeCache'].keys()),
+            ['evictions', 'expirations', 'hits', 'maxsize', 'misses', 'size'])
+        
+    def test_stats_post_method(self):
+        response = self.client.post(reverse('UTDVN_database:stats'))
+        self.assertEqual(response.status_code, 405)
+        
 class DocumentViewTests(TestCase):
     def setUp(self):
         self.existing_id = 'Đặng_Ngọc_Anh_Xây_dựng_phương_pháp_định_lượng_flurbiprofen_trong_dược_phẩm'
@@ -755,4 +2061,292 @@ class DocumentViewTests(TestCase):
         )
         self.assertEqual(response.status_code, 200)
         self.assertEqual(json.loads(response.content)['data']['doc']['id'], '9885A004')
-        self.assertEqual(json.loads(response.content)['data']['doc']['name'], ['Canon PowerShot SD500'])
\ No newline at end of file
+        self.assertEqual(json.loads(response.content)['data']['doc']['name'], ['Canon PowerShot SD500'])
+        
+class DocumentBatchTests(MockCoresTestCase):
+    @patch.object(SOLR, 'get_documents')
+    def test_returns_documents_in_order_of_ids(self, mock_get_documents):
+        mock_get_documents.side_effect = lambda core, ids, field_list: \
+            self._documents([{'id': 'c', 'title': ['C']}, {'id': 'a', 'title': ['A']}] if core == 'thesis' else [])
+        response = self.client.get(reverse('UTDVN_database:document'), {'ids': 'a,b,c'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['request']['ids'], ['a', 'b', 'c'])
+        self.assertEqual(
+            response.json()['data'], 
+            [{'type': 'thesis', 'doc': {'id': 'a', 'title': 'A'}}, {'type': 'thesis', 'doc': {'id': 'c', 'title': 'C'}}])
+        
+    @patch.object(SOLR, 'get_documents')
+    def test_makes_one_request_per_core(self, mock_get_documents):
+        mock_get_documents.return_value = self._documents([])
+        response = self.client.get(reverse('UTDVN_database:document'), {'ids': 'a,b,a,,c'})
+        self.assertEqual(response.json()['data'], [])
+        self.assertEqual(sorted(c[0][0] for c in mock_get_documents.call_args_list), ['other', 'thesis'])
+        self.assertEqual(mock_get_documents.call_args[0][1], ['a', 'b', 'c'])
+        
+    @patch.object(SOLR, 'get_documents')
+    def test_takes_documents_from_first_core_having_them(self, mock_get_documents):
+        def get_documents(core, ids, field_list):
+            if core == 'thesis':
+                time.sleep(0.1)
+                return self._documents([{'id': 'b'}])
+            return self._documents([{'id': 'a'}, {'id': 'b'}])
+        mock_get_documents.side_effect = get_documents
+        
+        response = self.client.get(reverse('UTDVN_database:document'), {'ids': 'a,b'})
+        self.assertEqual(response.json()['data'], [{'type': 'other', 'doc': {'id': 'a'}}, {'type': 'thesis', 'doc': {'id': 'b'}}])
+        
+    @patch.object(SOLR, 'get_documents')
+    def test_single_id_ignores_cores_after_first_hit(self, mock_get_documents):
+        mock_get_documents.side_effect = lambda core, ids, field_list: \
+            self._documents([{'id': 'a'}]) if core == 'thesis' else {'error': {'msg': 'failed', 'code': 500}}
+        response = self.client.get(reverse('UTDVN_database:document'), {'id': 'a'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['data'], {'type': 'thesis', 'doc': {'id': 'a'}})
+        
+    @patch.object(SOLR, 'get_documents')
+    def test_returns_error_of_failing_core(self, mock_get_documents):
+        mock_get_documents.side_effect = lambda core, ids, field_list: \
+            self._documents([{'id': 'a'}]) if core == 'thesis' else {'error': {'msg': 'failed', 'code': 500}}
+        response = self.client.get(reverse('UTDVN_database:document'), {'ids': 'a,b'})
+        self.assertEqual(response.status_code, 500)
+        self.assertEqual(response.json()['message'], 'failed on core other')
+        
+    def test_too_many_ids(self):
+        ids = ','.join(str(i) for i in range(views.DOCUMENT_MAX_IDS + 1))
+        response = self.client.get(reverse('UTDVN_database:document'), {'ids': ids})
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.json()['errorType'], ErrorType.INVALID_DOCUMENT_REQUEST.name)
+        
+# The URLs of the async views, as routed by urls.py when ASYNC_VIEWS is set
+urlpatterns = [
+    path('api/search/', views.async_search),
+    path('api/document/', views.async_document),
+]
+
+class RequestTimingTests(MockCoresTestCase):
+    CORES = ('thesis',)
+    
+    def _phases(self, response):
+        return [metric.split(';')[0] for metric in response['Server-Timing'].split(', ')]
+        
+    @patch.object(SOLR, 'query')
+    def test_search_sends_server_timing(self, mock_query):
+        mock_query.return_value = self._documents([{'id': 'a', 'title': ['A']}])
+        response = self.client.get(reverse('UTDVN_database:search'), {'q': 'ung thư'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(
+            self._phases(response), 
+            ['cache', 'cores', 'build', 'sanitize', 'solr.thesis', 'flatten', 'encode', 'total'])
+        
+    @patch.object(SOLR, 'get_documents')
+    def test_document_sends_server_timing(self, mock_get_documents):
+        mock_get_documents.return_value = self._documents([{'id': 'a'}])
+        response = self.client.get(reverse('UTDVN_database:document'), {'id': 'a'})
+        self.assertEqual(self._phases(response), ['cores', 'build', 'solr.thesis', 'flatten', 'encode', 'total'])
+        
+    @override_settings(ROOT_URLCONF=__name__)
+    @patch.object(SOLR, 'aquery')
+    def test_async_searches_run_concurrently(self, mock_aquery):
+        async def aquery(*args, **kwargs):
+            await asyncio.sleep(0.2)
+            return self._documents([{'id': 'a'}])
+        mock_aquery.side_effect = aquery
+        
+        async def searches():
+            client = AsyncClient()
+            start = time.perf_counter()
+            responses = await asyncio.gather(*[client.get('/api/search/?q=*&rows=%d' % i) for i in range(10)])
+            return responses, time.perf_counter() - start
+        
+        with patch.object(views, '_aload_schema', new_callable=AsyncMock):
+            responses, elapsed = async_to_sync(searches)()
+        self.assertEqual([response.status_code for response in responses], [200] * 10)
+        self.assertTrue(all('solr.thesis' in response['Server-Timing'] for response in responses))
+        # Run one after the other, the searches would take 2 seconds
+        self.assertLess(elapsed, 1)
+        
+    def test_other_views_are_not_timed(self):
+        response = self.client.get(reverse('UTDVN_database:cores'))
+        self.assertFalse(response.has_header('Server-Timing'))
+        
+    @patch.object(SOLR, 'query')
+    def test_metrics(self, mock_query):
+        mock_query.return_value = self._documents([])
+        self.client.get(reverse('UTDVN_database:search'), {'q': '*'})
+        response = self.client.get(reverse('UTDVN_database:metrics'))
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response['Content-Type'].startswith('text/plain'))
+        lines = response.content.decode('utf-8').split('\n')
+        self.assertIn('# TYPE utdvn_request_phase_seconds histogram', lines)
+        self.assertTrue(any(line.startswith('utdvn_request_phase_seconds_count{view="search",phase="solr.thesis"}') 
+                            for line in lines))
+        
+    def test_metrics_post_method(self):
+        response = self.client.post(reverse('UTDVN_database:metrics'))
+        self.assertEqual(response.status_code, 405)
+        
+    def test_phase_without_timer_does_nothing(self):
+        with timing.phase('build'):
+            pass
+        self.assertIs(timing.phase('build'), timing._NO_PHASE)
+        
+    def test_histograms_are_cumulative(self):
+        histograms = timing.Histograms('test_seconds', 'Test.', [0.1, 1])
+        for seconds in [0.05, 0.5, 5]:
+            histograms.observe('search', 'total', seconds)
+        self.assertEqual(histograms.render().split('\n')[2:7], [
+            'test_seconds_bucket{view="search",phase="total",le="0.1"} 1',
+            'test_seconds_bucket{view="search",phase="total",le="1.0"} 2',
+            'test_seconds_bucket{view="search",phase="total",le="+Inf"} 3',
+            'test_seconds_sum{view="search",phase="total"} 5.55',
+            'test_seconds_count{view="search",phase="total"} 3',
+        ])
+
+class SlowQueryLogTests(MockCoresTestCase):
+    CORES = ('thesis',)
+    
+    def setUp(self):
+        super().setUp()
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.path = os.path.join(directory.name, 'slow_queries.jsonl')
+        
+    def _use_log(self, threshold, sample_rate):
+        log = slow_query.SlowQueryLog(self.path, threshold, sample_rate, 1024 * 1024, 1)
+        self.addCleanup(log.close)
+        patcher = patch.object(views, 'SLOW_QUERY_LOG', log)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.log = log
+        
+    def _records(self):
+        self.log.flush()
+        if not os.path.exists(self.path):
+            return []
+        return list(slow_query.read_log([self.path]))
+        
+    @patch.object(SOLR, 'query')
+    def test_slow_search_is_logged(self, mock_query):
+        mock_query.return_value = {
+            'responseHeader': {'QTime': 7},
+            'response': {'numFound': 3, 'start': 0, 'docs': [{'id': 'a', 'title': ['A']}]}
+        }
+        self._use_log(0, 0)
+        response = self.client.get(reverse('UTDVN_database:search'), {'q': '*', 'rows': '1'})
+        self.assertEqual(response.status_code, 200)
+        self.assertNotIn('responseHeader', json.loads(response.content))
+        
+        [record] = self._records()
+        self.assertEqual(record['reason'], 'slow')
+        self.assertEqual(record['status'], 200)
+        self.assertEqual(record['params'], {'q': '*', 'rows': '1'})
+        [core] = record['cores']
+        self.assertEqual(core['core'], 'thesis')
+        self.assertEqual(core['query'], mock_query.call_args[0][1])
+        self.assertEqual(core['params']['rows'], mock_query.call_args[1]['rows'])
+        self.assertEqual(core['qtimeMs'], 7)
+        self.assertEqual((core['numFound'], core['docs']), (3, 1))
+        self.assertFalse(mock_query.call_args[1]['omit_header'])
+        
+    @patch.object(SOLR, 'query')
+    def test_sampled_search_is_logged(self, mock_query):
+        mock_query.return_value = self._documents([])
+        self._use_log(None, 1)
+        self.client.get(reverse('UTDVN_database:search'), {'q': '*'})
+        [record] = self._records()
+        self.assertEqual(record['reason'], 'sample')
+        
+    @patch.object(SOLR, 'query')
+    def test_streamed_search_is_logged(self, mock_query):
+        mock_query.return_value = self._documents([{'id': 'a'}])
+        self._use_log(0, 0)
+        response = self.client.get(reverse('UTDVN_database:search'), {'q': '*', 'stream': 'true'})
+        self.assertEqual(response.status_code, 200)
+        b''.join(response.streaming_content)
+        
+        [record] = self._records()
+        self.assertEqual(record['params'], {'q': '*', 'stream': 'true'})
+        self.assertEqual(record['status'], 200)
+        [core] = record['cores']
+        self.assertEqual(core['core'], 'thesis')
+        
+    @patch.object(SOLR, 'query')
+    def test_search_is_logged_in_background(self, mock_query):
+        mock_query.return_value = self._documents([])
+        self._use_log(0, 0)
+        threads = []
+        with patch.object(self.log, '_write', side_effect=lambda entry: threads.append(threading.current_thread())):
+            self.client.get(reverse('UTDVN_database:search'), {'q': '*'})
+            self.log.flush()
+        [thread] = threads
+        self.assertNotEqual(thread, threading.current_thread())
+        
+    @patch.object(SOLR, 'query')
+    def test_fast_search_is_not_logged(self, mock_query):
+        mock_query.return_value = self._documents([])
+        self._use_log(60, 0)
+        self.client.get(reverse('UTDVN_database:search'), {'q': '*'})
+        self.assertEqual(self._records(), [])
+        
+    @patch.object(SOLR, 'query')
+    def test_log_is_created_with_first_search(self, mock_query):
+        mock_query.return_value = self._documents([])
+        self.path = os.path.join(os.path.dirname(self.path), 'logs', 'slow_queries.jsonl')
+        self._use_log(0, 0)
+        self.assertIsNone(self.log.writer)
+        self.assertFalse(os.path.exists(os.path.dirname(self.path)))
+        
+        self.client.get(reverse('UTDVN_database:search'), {'q': '*'})
+        self.assertEqual(len(self._records()), 1)
+        
+    @patch.object(SOLR, 'query')
+    def test_search_is_not_recorded_when_disabled(self, mock_query):
+        mock_query.return_value = self._documents([])
+        with patch.object(views, 'SLOW_QUERY_LOG', slow_query.SlowQueryLog(None, 0, 1, 0, 0)):
+            self.client.get(reverse('UTDVN_database:search'), {'q': '*'})
+        self.assertTrue(mock_query.call_args[1]['omit_header'])
+        
+    def test_replay_sends_logged_queries(self):
+        connection = MagicMock()
+        connection.query.return_value = self._documents([])
+        records = [
+            {'cores': [{'core': 'thesis', 'query': 'title:a', 'params': {'rows': 10}}]},
+            {'cores': [{'core': 'thesis', 'query': 'title:b', 'params': {'rows': 5}},
+                       {'core': 'core1', 'query': 'title:b', 'params': {'rows': 5}}]},
+        ]
+        counts = replay.replay(connection, records, concurrency=1)
+        self.assertEqual((counts['searches'], counts['queries'], counts['errors']), (2, 3, 0))
+        connection.query.assert_has_calls([
+            call('thesis', 'title:a', rows=10), call('thesis', 'title:b', rows=5), call('core1', 'title:b', rows=5)])
+        
+    def test_replay_limit(self):
+        connection = MagicMock()
+        connection.query.side_effect = requests.exceptions.ConnectionError()
+        records = [{'cores': [{'core': 'thesis', 'query': '*', 'params': {}}]}] * 3
+        counts = replay.replay(connection, records, limit=2)
+        self.assertEqual((counts['searches'], counts['queries'], counts['errors']), (2, 2, 2))
+        
+    def test_replay_raises_unexpected_errors(self):
+        connection = MagicMock()
+        connection.query.side_effect = TypeError('bad params')
+        records = [{'cores': [{'core': 'thesis', 'query': '*', 'params': {}}]}] * 3
+        with self.assertRaises(TypeError):
+            replay.replay(connection, records, concurrency=1)
+        
+    def test_replay_bounds_pending_queries(self):
+        sent = threading.Event()
+        connection = MagicMock()
+        connection.query.side_effect = lambda *args, **kwargs: sent.wait(5) and {'response': {'numFound': 0}}
+        read = []
+        def records():
+            for i in range(100):
+                read.append(i)
+                yield {'cores': [{'core': 'thesis', 'query': '*', 'params': {}}]}
+        
+        thread = threading.Thread(target=replay.replay, args=(connection, records()), kwargs={'concurrency': 1})
+        thread.start()
+        time.sleep(0.2)
+        self.assertLessEqual(len(read), 3)
+        sent.set()
+        thread.join(5)
+        self.assertEqual(len(read), 100)
@@ -1,10 +1,13 @@
 from django.urls import path
 
+from UTDVN_backend.settings import ASYNC_VIEWS
 from . import views
 
 app_name = 'UTDVN_database'
 urlpatterns = [
-    path('cores/', views.cores, name='cores'),
-    path('search/', views.search, name='search'),
-    path('document/', views.document, name='document'),
-]
\ No newline at end of file
+    path('cores/', views.async_cores if ASYNC_VIEWS else views.cores, name='cores'),
+    path('search/', views.async_search if ASYNC_VIEWS else views.search, name='search'),
+    path('document/', views.async_document if ASYNC_VIEWS else views.document, name='document'),
+    path('stats/', views.stats, name='stats'),
+    path('metrics/', views.metrics, name='metrics'),
+]
@@ -1,19 +1,599 @@
+import aiohttp
+import asyncio
+import contextvars
+import json
+import re
+import tempfile
+import time
+import requests
+from collections import OrderedDict
+from concurrent import futures
 from django.shortcuts import render
-from django.http import HttpResponse, JsonResponse
+from django.http import HttpResponse, JsonResponse, StreamingHttpResponse
 from django.views import generic
-from .solr import connection, builder
+from .solr import connection, builder, query as solr_query, slow_query, timing
+from .solr.cache import SearchCache
+from .solr.schema import SchemaRegistry
 from .solr.error import APIError, ErrorType
-from UTDVN_backend.settings import HAYSTACK_CONNECTIONS
+from UTDVN_backend.settings import HAYSTACK_CONNECTIONS, SEARCH_MAX_WORKERS, SEARCH_CORE_TIMEOUT, \
+    SEARCH_CACHE_SIZE, SEARCH_CACHE_TTL, SEARCH_CACHE_VERSION_CHECK_INTERVAL, SCHEMA_REFRESH_INTERVAL, \
+    RETURN_FIELDS_CACHE_SIZE, FLATTEN_PLANS_CACHE_SIZE, DOCUMENT_MAX_IDS, SEARCH_STREAM_MAX_ROWS, SEARCH_STREAM_CHUNK_ROWS, \
+    SEARCH_STREAM_SPOOL_SIZE, SLOW_QUERY_LOG_PATH, SLOW_QUERY_THRESHOLD, SLOW_QUERY_SAMPLE_RATE, \
+    SLOW_QUERY_LOG_MAX_BYTES, SLOW_QUERY_LOG_BACKUP_COUNT
 
-SOLR = connection.SolrConnection(HAYSTACK_CONNECTIONS['default']['URL'])
+# Lazy unless configured otherwise, so importing this module does not wait for Solr
+SOLR = connection.SolrConnection.from_config(HAYSTACK_CONNECTIONS['default'])
 DEFAULT_CORE = 'test'
 
+SEARCH_CACHE = SearchCache(SOLR, SEARCH_CACHE_SIZE, SEARCH_CACHE_TTL, SEARCH_CACHE_VERSION_CHECK_INTERVAL)
+
+# Which fields of each core can be returned and which are flattened, from their Solr schemas
+SCHEMAS = SchemaRegistry(SOLR, SCHEMA_REFRESH_INTERVAL, RETURN_FIELDS_CACHE_SIZE, FLATTEN_PLANS_CACHE_SIZE)
+
+# Shared by all requests so that the number of in-flight Solr queries stays bounded.
+EXECUTOR = futures.ThreadPoolExecutor(max_workers=SEARCH_MAX_WORKERS, thread_name_prefix='solr-search')
+
+SLOW_QUERY_LOG = slow_query.SlowQueryLog(SLOW_QUERY_LOG_PATH, SLOW_QUERY_THRESHOLD, SLOW_QUERY_SAMPLE_RATE,
+                                         SLOW_QUERY_LOG_MAX_BYTES, SLOW_QUERY_LOG_BACKUP_COUNT)
+
+# Exceptions that may be raised while querying Solr and are turned into an error response.
+SOLR_ERRORS = (KeyError, ValueError, futures.TimeoutError, asyncio.TimeoutError,
+               requests.exceptions.RequestException, aiohttp.ClientError)
+
+def _query_cores(func, cores, *args):
+    """
+    Calls func(core, *args) for every core concurrently on the search executor and
+    yields (core, result) pairs in the order of the given cores.
+    Raises the exception of the first core (in that order) that failed, or
+    futures.TimeoutError if a core did not respond within SEARCH_CORE_TIMEOUT seconds.
+    Queries that have not started yet are cancelled once the caller stops iterating.
+    Each query runs in a copy of the context of the caller, so that it is timed and recorded with its request.
+    """
+    deadline = time.monotonic() + SEARCH_CORE_TIMEOUT
+    pending = [(core, EXECUTOR.submit(contextvars.copy_context().run, func, core, *args)) for core in cores]
+    try:
+        for core, future in pending:
+            try:
+                result = future.result(timeout=max(0, deadline - time.monotonic()))
+            except futures.TimeoutError:
+                raise futures.TimeoutError(
+                    'Solr did not respond within %s seconds on core %s' % (SEARCH_CORE_TIMEOUT, core))
+            yield (core, result)
+    finally:
+        for _, future in pending:
+            future.cancel()
+
+async def _aquery_cores(func, cores, *args):
+    """
+    Asynchronous version of _query_cores.
+    Awaits func(core, *args) for every core concurrently and returns an iterator of (core, result) pairs
+    with the same ordering and errors as _query_cores.
+    """
+    tasks = [asyncio.ensure_future(func(core, *args)) for core in cores]
+    if len(tasks) == 0:
+        return iter([])
+    
+    done, pending = await asyncio.wait(tasks, timeout=SEARCH_CORE_TIMEOUT)
+    for task in pending:
+        task.cancel()
+    for task in done:
+        # Marks the exception as retrieved, since only the first failure in core order is raised
+        task.exception()
+    return _task_results(cores, tasks, pending)
+
+def _task_results(cores, tasks, pending):
+    """
+    Yields (core, result) pairs of the given finished tasks in order.
+    Raises the exception of a failed task, or futures.TimeoutError for a task that is still pending.
+    """
+    for core, task in zip(cores, tasks):
+        if task in pending:
+            raise futures.TimeoutError(
+                'Solr did not respond within %s seconds on core %s' % (SEARCH_CORE_TIMEOUT, core))
+        yield (core, task.result())
+
+def _solr_error_response(error):
+    """
+    Returns the error response for one of SOLR_ERRORS.
+    """
+    if isinstance(error, KeyError):
+        api_error = APIError(ErrorType.UNEXPECTED_SERVER_ERROR, str(error))
+        return JsonResponse(api_error.args(), status=500)
+    if isinstance(error, ValueError):
+        api_error = APIError(ErrorType.SOLR_CONNECTION_ERROR, str(error))
+        return JsonResponse(api_error.args(), status=500)
+    if isinstance(error, (futures.TimeoutError, asyncio.TimeoutError)):
+        api_error = APIError(ErrorType.SOLR_CONNECTION_ERROR, str(error))
+        return JsonResponse(api_error.args(), status=504)
+    api_error = APIError(ErrorType.SOLR_CONNECTION_ERROR, str(error))
+    return JsonResponse(api_error.args(), status=503)
+
+def _solr_search_error_response(core, query_response):
+    """
+    Returns the error response for a Solr response containing an error.
+    """
+    api_error = APIError(
+        ErrorType.SOLR_SEARCH_ERROR, 
+        query_response['error']['msg'] + " on core " + core)
+    return JsonResponse(api_error.args(), status=query_response['error']['code'])
+
+def _prepare_search(request):
+    """
+    Validates the parameters of a search request.
+    Returns (target_cores, return_fields, query, kwargs), or an error response if the request is invalid.
+    """
+    try:
+        with timing.phase('cores'):
+            core_names = SOLR.get_core_names()
+    except SOLR_ERRORS as e:
+        return _solr_error_response(e)
+    
+    try:
+        with timing.phase('build'):
+            target_cores = builder.build_cores(request.GET.get('types', ''), core_names)
+            return_fields = SCHEMAS.build_return_fields(request.GET.get('return', ''), target_cores)
+            cursor = request.GET.get('cursor', '')
+            cursor_marks = builder.build_cursor_marks(cursor, target_cores) if cursor != '' else None
+    except ValueError as ve:
+        api_error = APIError(ErrorType.INVALID_SEARCH_REQUEST, str(ve))
+        return JsonResponse(api_error.args(), status=400)
+    
+    query = request.GET.get('q', '')
+    if query == '':
+        api_error = APIError(ErrorType.INVALID_SEARCH_REQUEST)
+        return JsonResponse(api_error.args(), status=400)
+    
+    kwargs = {
+        'sort': request.GET.get('sort', ''),
+        'start': request.GET.get('start', ''),
+        'rows': request.GET.get('rows', ''),
+        'field_list': return_fields,
+    }
+    if cursor_marks is not None:
+        # Solr pages from the cursor mark of each core instead of skipping documents
+        if kwargs['start'] not in ['', '0']:
+            api_error = APIError(ErrorType.INVALID_SEARCH_REQUEST, 'start cannot be used with cursor')
+            return JsonResponse(api_error.args(), status=400)
+        kwargs['start'] = ''
+        kwargs['cursor_marks'] = cursor_marks
+    return (target_cores, return_fields, query, kwargs)
+
+def _core_kwargs(core, kwargs):
+    """
+    Returns the arguments of SolrConnection.query for a core from the kwargs of _prepare_search,
+    replacing the cursor marks of all cores by the one of the given core.
+    """
+    if 'cursor_marks' not in kwargs:
+        return kwargs
+    
+    core_kwargs = {key: value for key, value in kwargs.items() if key != 'cursor_marks'}
+    core_kwargs['cursor_mark'] = kwargs['cursor_marks'][core]
+    return core_kwargs
+
+def _search_response(target_cores, return_fields, results):
+    """
+    Builds the response of a search from the ordered (core, Solr response) pairs in results.
+    Returns the error response of the first core that failed instead, if any.
+    """
+    responses = {
+        'request': {
+            'types': target_cores,
+            'return fields': return_fields.split(","),
+        },
+        'data': []
+    }
+    next_cursor_marks = []
+    try:
+        for core, query_response in results:
+            if 'error' in query_response:
+                return _solr_search_error_response(core, query_response)
+
+            responses['data'].append(query_response)
+            if 'nextCursorMark' in query_response:
+                next_cursor_marks.append('%s:%s' % (core, query_response['nextCursorMark']))
+
+    #We do not use pysolr to query.
+    #except pysolr.SolrError as se:
+    #    api_error = APIError(ErrorType.SOLR_SEARCH_ERROR, str(se))
+    #    return JsonResponse(api_error.args(), status=400)
+    except SOLR_ERRORS as e:
+        return _solr_error_response(e)
+
+    if len(next_cursor_marks) > 0:
+        responses['nextCursor'] = ','.join(next_cursor_marks)
+    with timing.phase('encode'):
+        return JsonResponse(responses)
+
+def _search_core(core, query, kwargs, return_fields):
+    """
+    Searches a single core and returns the Solr response with its documents flattened.
+    Responses containing an error are returned untouched.
+    """
+    new_query, new_kwargs = builder.build_search_query(core, query, _core_kwargs(core, kwargs))
+    record = slow_query.current_record()
+    start_time = time.perf_counter()
+    with timing.phase('solr.' + core):
+        query_response = SOLR.query(core, new_query, omit_header=record is None, **new_kwargs)
+    if record is not None:
+        record.add_core(core, new_query, new_kwargs, time.perf_counter() - start_time, query_response)
+    return _flatten_search_response(core, query_response, return_fields)
+
+async def _asearch_core(core, query, kwargs, return_fields):
+    """
+    Asynchronous version of _search_core.
+    """
+    await _aload_schema(core)
+    new_query, new_kwargs = builder.build_search_query(core, query, _core_kwargs(core, kwargs))
+    record = slow_query.current_record()
+    start_time = time.perf_counter()
+    with timing.phase('solr.' + core):
+        query_response = await SOLR.aquery(core, new_query, omit_header=record is None, **new_kwargs)
+    if record is not None:
+        record.add_core(core, new_query, new_kwargs, time.perf_counter() - start_time, query_response)
+    return _flatten_search_response(core, query_response, return_fields)
+
+def _search_raw_core(core, query, kwargs, return_fields):
+    """
+    Same as _search_core, but returns the undecoded JSON body of the Solr response, whose documents are not flattened.
+    Responses containing an error are decoded and returned untouched.
+    """
+    new_query, new_kwargs = builder.build_search_query(core, query, _core_kwargs(core, kwargs))
+    record = slow_query.current_record()
+    start_time = time.perf_counter()
+    with timing.phase('solr.' + core):
+        query_response = SOLR.query_raw(core, new_query, **new_kwargs)
+    if record is not None:
+        record.add_core(core, new_query, new_kwargs, time.perf_counter() - start_time, query_response)
+    return query_response
+
+async def _asearch_raw_core(core, query, kwargs, return_fields):
+    """
+    Asynchronous version of _search_raw_core.
+    """
+    new_query, new_kwargs = builder.build_search_query(core, query, _core_kwargs(core, kwargs))
+    record = slow_query.current_record()
+    start_time = time.perf_counter()
+    with timing.phase('solr.' + core):
+        query_response = await SOLR.aquery_raw(core, new_query, **new_kwargs)
+    if record is not None:
+        record.add_core(core, new_query, new_kwargs, time.perf_counter() - start_time, query_response)
+    return query_response
+
+# Matches the cursor mark of a raw Solr response, which Solr writes after the documents
+NEXT_CURSOR_MARK = re.compile(rb'"nextCursorMark"\s*:\s*"([^"\\]*)"')
+
+def _search_raw_response(target_cores, return_fields, results):
+    """
+    Same as _search_response for the undecoded Solr responses of _search_raw_core.
+    Each body is copied into the response as it is, with the core added as its first key instead of its last,
+    so documents keep the lists Solr returns multi-valued fields in.
+    """
+    request_args = {
+        'types': target_cores,
+        'return fields': return_fields.split(","),
+    }
+    data = []
+    next_cursor_marks = []
+    try:
+        for core, query_response in results:
+            if isinstance(query_response, dict):
+                return _solr_search_error_response(core, query_response)
+            
+            body = query_response.strip()
+            if body[:1] != b'{' or body[-1:] != b'}':
+                raise ValueError('Solr returned an invalid response on core ' + core)
+            data.append(b'{"type": %s, %s' % (json.dumps(core).encode('utf-8'), body[1:]))
+            match = NEXT_CURSOR_MARK.match(body, body.rfind(b'"nextCursorMark"'))
+            if match is not None:
+                next_cursor_marks.append('%s:%s' % (core, match.group(1).decode('utf-8')))
+    except SOLR_ERRORS as e:
+        return _solr_error_response(e)
+    
+    with timing.phase('encode'):
+        content = b'{"request": %s, "data": [%s]' % (json.dumps(request_args).encode('utf-8'), b', '.join(data))
+        if len(next_cursor_marks) > 0:
+            content += b', "nextCursor": %s' % json.dumps(','.join(next_cursor_marks)).encode('utf-8')
+        return HttpResponse(content + b'}', content_type='application/json')
+
+def _flatten_search_response(core, query_response, return_fields):
+    """
+    Tags the Solr response of a search with its core and flattens its documents.
+    Responses containing an error are returned untouched.
+    """
+    if 'error' in query_response:
+        return query_response
+    
+    query_response['type'] = core
+    with timing.phase('flatten'):
+        plan = SCHEMAS.flatten_plan(core, return_fields)
+        builder.flatten_docs(query_response['response']['docs'], plan)
+    return query_response
+
+async def _aload_cores():
+    """
+    Fetches the cores on the search executor the first time they are needed, so that the event loop
+    does not wait for Solr. Raises one of SOLR_ERRORS if Solr cannot be reached.
+    """
+    if not SOLR.has_cores():
+        with timing.phase('cores'):
+            await asyncio.get_running_loop().run_in_executor(EXECUTOR, SOLR.get_core_names)
+
+async def _aload_schema(core):
+    """
+    Fetches the schema of a core on the search executor the first time it is needed, so that the first
+    flatten plans of the core are compiled without blocking the event loop.
+    """
+    if not SCHEMAS.has_schema(core):
+        await asyncio.get_running_loop().run_in_executor(EXECUTOR, SCHEMAS.load, core)
+
+def _stream_search(request):
+    """
+    Streaming version of search.
+    Each core is fetched from Solr in chunks of SEARCH_STREAM_CHUNK_ROWS documents and every document is written
+    to the client as soon as it is flattened, so memory does not grow with the number of rows requested.
+    The first chunk of every core is fetched before the response starts, so that errors on those still get
+    an error response. An error on a later chunk aborts the response.
+    """
+    stream_range = _prepare_stream_range(request.GET)
+    if isinstance(stream_range, HttpResponse):
+        return stream_range
+    start, rows = stream_range
+    
+    prepared = _prepare_search(request)
+    if isinstance(prepared, HttpResponse):
+        return prepared
+    target_cores, return_fields, query, kwargs = prepared
+    
+    first_kwargs = dict(kwargs, start=start, rows=min(rows, SEARCH_STREAM_CHUNK_ROWS))
+    first_chunks = []
+    try:
+        for core, query_response in _query_cores(_search_core, target_cores, query, first_kwargs, return_fields):
+            if 'error' in query_response:
+                return _solr_search_error_response(core, query_response)
+            first_chunks.append((core, query_response))
+    except SOLR_ERRORS as e:
+        return _solr_error_response(e)
+    
+    request_args = {
+        'types': target_cores,
+        'return fields': return_fields.split(","),
+    }
+    results = _stream_search_results(request_args, return_fields, query, kwargs, start, rows, first_chunks)
+    return StreamingHttpResponse(results, content_type='application/json')
+
+def _prepare_stream_range(params):
+    """
+    Validates the parameters of a streamed search that streaming restricts, before the search is prepared
+    or looked up in the cache, whose keys do not tell streamed searches apart.
+    Returns (start, rows), or an error response if they are invalid.
+    """
+    if params.get('raw', '') == 'true':
+        api_error = APIError(ErrorType.INVALID_SEARCH_REQUEST, 'raw cannot be used when streaming')
+        return JsonResponse(api_error.args(), status=400)
+    
+    if params.get('cursor', '') != '':
+        api_error = APIError(ErrorType.INVALID_SEARCH_REQUEST, 'cursor cannot be used when streaming')
+        return JsonResponse(api_error.args(), status=400)
+    
+    try:
+        start = int(params.get('start', '')) if params.get('start', '') != '' else 0
+        rows = int(params.get('rows', '')) if params.get('rows', '') != '' else 10
+    except ValueError:
+        api_error = APIError(ErrorType.INVALID_SEARCH_REQUEST, 'start and rows must be integers when streaming')
+        return JsonResponse(api_error.args(), status=400)
+    
+    if start < 0 or rows < 0 or rows > SEARCH_STREAM_MAX_ROWS:
+        api_error = APIError(
+            ErrorType.INVALID_SEARCH_REQUEST, 
+            'rows must be between 0 and %d when streaming' % SEARCH_STREAM_MAX_ROWS)
+        return JsonResponse(api_error.args(), status=400)
+    return (start, rows)
+
+def _stream_search_results(request_args, return_fields, query, kwargs, start, rows, first_chunks):
+    """
+    Yields the JSON of a search response piece by piece, in the same shape as the response of search.
+    Chunks are dropped as soon as they are written. The highlighting of a core follows its documents
+    in the response, so it is spooled to a temporary file (on disk once it exceeds
+    SEARCH_STREAM_SPOOL_SIZE bytes) until the documents are written.
+    """
+    yield '{"request": %s, "data": [' % json.dumps(request_args)
+    
+    for index in range(len(first_chunks)):
+        core, query_response = first_chunks[index]
+        first_chunks[index] = None
+        
+        response_header = {key: value for key, value in query_response['response'].items() if key != 'docs'}
+        response_header['start'] = start
+        yield '%s{"response": %s, "docs": [' % ('' if index == 0 else ', ', json.dumps(response_header)[:-1])
+        
+        num_rows = max(0, min(rows, query_response['response']['numFound'] - start))
+        has_highlighting = 'highlighting' in query_response
+        with tempfile.SpooledTemporaryFile(max_size=SEARCH_STREAM_SPOOL_SIZE, mode='w+') as highlighting:
+            fetched = 0
+            while True:
+                for doc in query_response['response']['docs']:
+                    yield '%s%s' % ('' if fetched == 0 else ', ', json.dumps(doc))
+                    fetched += 1
+                for doc_id, doc_highlighting in query_response.get('highlighting', {}).items():
+                    highlighting.write('%s%s: %s' % (
+                        ', ' if highlighting.tell() > 0 else '', json.dumps(doc_id), json.dumps(doc_highlighting)))
+                if fetched >= num_rows or len(query_response['response']['docs']) == 0:
+                    break
+                
+                chunk_kwargs = dict(kwargs, start=start + fetched, rows=min(num_rows - fetched, SEARCH_STREAM_CHUNK_ROWS))
+                query_response = _search_core(core, query, chunk_kwargs, return_fields)
+                if 'error' in query_response:
+                    raise ValueError(query_response['error']['msg'] + " on core " + core)
+            
+            yield ']}'
+            if has_highlighting:
+                yield ', "highlighting": {'
+                highlighting.seek(0)
+                for block in iter(lambda: highlighting.read(65536), ''):
+                    yield block
+                yield '}'
+        yield ', "type": %s}' % json.dumps(core)
+    
+    yield ']}'
+
+def _prepare_document(request):
+    """
+    Validates the parameters of a document request.
+    Returns (target_cores, return_fields, doc_ids, batch), or an error response if the request is invalid.
+    """
+    try:
+        with timing.phase('cores'):
+            core_names = SOLR.get_core_names()
+    except SOLR_ERRORS as e:
+        return _solr_error_response(e)
+    
+    try:
+        with timing.phase('build'):
+            target_cores = builder.build_cores(request.GET.get('types', ''), core_names)
+            return_fields = SCHEMAS.build_return_fields(request.GET.get('return', ''), target_cores)
+    except ValueError as ve:
+        api_error = APIError(ErrorType.INVALID_DOCUMENT_REQUEST, str(ve))
+        return JsonResponse(api_error.args(), status=400)
+    
+    ids = request.GET.get('ids', '')
+    if ids != '':
+        doc_ids = list(OrderedDict.fromkeys(doc_id for doc_id in ids.split(',') if doc_id != ''))
+        if len(doc_ids) > DOCUMENT_MAX_IDS:
+            api_error = APIError(
+                ErrorType.INVALID_DOCUMENT_REQUEST, 
+                'At most %d ids can be requested at once' % DOCUMENT_MAX_IDS)
+            return JsonResponse(api_error.args(), status=400)
+        if len(doc_ids) > 0:
+            return (target_cores, return_fields, doc_ids, True)
+    
+    doc_id = request.GET.get('id', '')
+    if doc_id == '':
+        api_error = APIError(ErrorType.INVALID_DOCUMENT_REQUEST)
+        return JsonResponse(api_error.args(), status=400)
+    
+    return (target_cores, return_fields, [doc_id], False)
+
+def _document_response(target_cores, return_fields, doc_ids, batch, results):
+    """
+    Builds the response of a document request from the ordered (core, Solr response) pairs in results.
+    Each document is taken from the first core (in order) that has it.
+    For a batch request, data lists the documents found in the order of doc_ids,
+    otherwise it is the single document found or the response is 404.
+    Returns the error response of the first core that failed before all documents were found instead, if any.
+    """
+    request_args = {
+        'types': target_cores,
+        'return fields': return_fields.split(","),
+    }
+    if batch:
+        request_args['ids'] = doc_ids
+    
+    found = {}
+    try:
+        for core, query_response in results:
+            if 'error' in query_response:
+                return _solr_search_error_response(core, query_response)
+            
+            with timing.phase('flatten'):
+                plan = SCHEMAS.flatten_plan(core, return_fields)
+                for doc in query_response['response']['docs']:
+                    doc_id = doc['id'] if batch else doc_ids[0]
+                    if doc_id not in found:
+                        found[doc_id] = {
+                            'type': core,
+                            'doc': builder.flatten_docs([doc], plan)[0]
+                        }
+            if len(found) == len(doc_ids):
+                break
+
+    #We do not use pysolr to query.
+    #except pysolr.SolrError as se:
+    #    api_error = APIError(ErrorType.SOLR_SEARCH_ERROR, str(se))
+    #    return JsonResponse(api_error.args(), status=400)
+    except SOLR_ERRORS as e:
+        return _solr_error_response(e)
+
+    if batch:
+        with timing.phase('encode'):
+            return JsonResponse({
+                'request': request_args,
+                'data': [found[doc_id] for doc_id in doc_ids if doc_id in found]
+            })
+    
+    if len(found) == 0:
+        return HttpResponse("Document not found", status=404)
+    with timing.phase('encode'):
+        return JsonResponse({'request': request_args, 'data': found[doc_ids[0]]})
+
+def _document_field_list(return_fields):
+    """
+    Returns the fields to request from Solr for the given return fields,
+    which must include 'id' to tell the documents of a batch apart.
+    """
+    if return_fields == '' or 'id' in return_fields.split(','):
+        return return_fields
+    return return_fields + ',id'
+
+def _document_core(core, doc_ids, return_fields):
+    """
+    Looks up the documents with the given ids in a single core and returns the Solr response.
+    """
+    with timing.phase('solr.' + core):
+        return SOLR.get_documents(core, doc_ids, _document_field_list(return_fields))
+
+async def _adocument_core(core, doc_ids, return_fields):
+    """
+    Asynchronous version of _document_core.
+    """
+    await _aload_schema(core)
+    with timing.phase('solr.' + core):
+        return await SOLR.aget_documents(core, doc_ids, _document_field_list(return_fields))
+
 # Create your views here.
 def cores(request):
     if request.method != "GET":
         return HttpResponse(status=405)
     
-    return JsonResponse(SOLR.get_core_names(), safe=False, status=200)
+    try:
+        core_names = SOLR.get_core_names()
+    except SOLR_ERRORS as e:
+        return _solr_error_response(e)
+    
+    return JsonResponse(core_names, safe=False, status=200)
+
+async def async_cores(request):
+    """
+    Asynchronous version of cores, used instead of it when ASYNC_VIEWS is set.
+    It runs on the search executor, as the cores are fetched from Solr on first use.
+    """
+    return await asyncio.get_running_loop().run_in_executor(EXECUTOR, cores, request)
+
+def stats(request):
+    """
+    Takes a GET request and returns the counters of the in-process caches,
+    and the percentiles of the QTime, time and response size of the recent Solr queries of each core.
+    """
+    if request.method != "GET":
+        return HttpResponse(status=405)
+    
+    return JsonResponse({
+        'searchCache': SEARCH_CACHE.stats(),
+        'sanitizeCache': solr_query.SANITIZE_CACHE.stats(),
+        'returnFieldsCache': SCHEMAS.return_fields_cache.stats(),
+        'solr': SOLR.query_stats.stats() if SOLR.query_stats is not None else {},
+    }, status=200)
+
+def metrics(request):
+    """
+    Takes a GET request and returns the histograms of the durations of the phases of the search and document
+    requests handled by this process, in the Prometheus text format. Nothing is recorded unless REQUEST_TIMING is set.
+    -------
+    See https://prometheus.io/docs/instrumenting/exposition_formats/ for more details.
+    """
+    if request.method != "GET":
+        return HttpResponse(status=405)
+    
+    return HttpResponse(timing.PHASE_HISTOGRAMS.render(), content_type='text/plain; version=0.0.4; charset=utf-8')
 
 def search(request):
     """
@@ -35,72 +615,126 @@ def search(request):
         The fields to be returned in the query response.
         All fields by default.
         Example: 'id,sales_price:price,secret_sauce:popularity,score'
+    stream : string, optional
+        If 'true', the response is streamed to the client while it is fetched from Solr
+        instead of being built in memory, and is not cached.
+        Up to SEARCH_STREAM_MAX_ROWS rows can be requested.
+    cursor : string, optional
+        '*' to start paging through the results with Solr cursors, which unlike 'start' do not get
+        slower on deep pages. Every following page is requested with the 'nextCursor' of the previous
+        response, until it stops changing. 'id asc' is added to the sort to order ties.
+        Cannot be used with start or stream.
+    raw : string, optional
+        If 'true', the response of each core is passed through as Solr sent it, without decoding and
+        re-encoding it, so every field but 'id' keeps the list Solr returns it in, even with a single value.
+        Cannot be used with stream.
 
     Takes a GET request containing a query and returns results from the connected Solr instance.
+    Successful responses are cached until the Solr index changes.
+    Searches slower than SLOW_QUERY_THRESHOLD and a sample of all searches are logged to SLOW_QUERY_LOG_PATH.
+    A streamed search is logged with the time and queries before its response starts.
     
     Example Usage:
     http://.../api/search?types=thesis&q=ung thư&sort=yearpub desc&start=0&rows=10
     -------
-    See https://lucene.apache.org/solr/guide/8_4/common-query-parameters.html
-    and https://lucene.apache.org/solr/guide/8_4/highlighting.html for more details.
+    See https://lucene.apache.org/solr/guide/8_4/common-query-parameters.html,
+    https://lucene.apache.org/solr/guide/8_4/highlighting.html,
+    and https://lucene.apache.org/solr/guide/8_4/pagination-of-results.html for more details.
     """
     if request.method != "GET":
         return HttpResponse(status=405)
     
-    try:
-        target_cores = builder.build_cores(request.GET.get('types', ''), SOLR.get_core_names())
-        return_fields = builder.build_return_fields(request.GET.get('return', ''), target_cores)
-    except ValueError as ve:
-        api_error = APIError(ErrorType.INVALID_SEARCH_REQUEST, str(ve))
-        return JsonResponse(api_error.args(), status=400)
-    
-    query = request.GET.get('q', '')
-    if query == '':
-        api_error = APIError(ErrorType.INVALID_SEARCH_REQUEST)
-        return JsonResponse(api_error.args(), status=400)
+    with SLOW_QUERY_LOG.recording(_search_params(request)) as record:
+        if request.GET.get('stream', '') == 'true':
+            response = _stream_search(request)
+        else:
+            response = _search(request)
+        record.status = response.status_code
+    return response
+
+def _search_params(request):
+    """
+    Returns the parameters of a search request that affect its response.
+    """
+    return {key: request.GET[key] for key in SearchCache.PARAMS + ['stream'] if key in request.GET}
+
+def _search(request):
+    """
+    Returns the response of a search request that is not streamed.
+    """
+    cache_key = SearchCache.make_key(request.GET)
+    with timing.phase('cache'):
+        cached_response = SEARCH_CACHE.get(cache_key)
+    if cached_response is not None:
+        return HttpResponse(cached_response, content_type='application/json')
+    cache_generation = SEARCH_CACHE.generation
     
-    kwargs = {
-        'sort': request.GET.get('sort', ''),
-        'start': request.GET.get('start', ''),
-        'rows': request.GET.get('rows', ''),
-        'field_list': return_fields,
-    }
+    prepared = _prepare_search(request)
+    if isinstance(prepared, HttpResponse):
+        return prepared
+    target_cores, return_fields, query, kwargs = prepared
     
-    responses = {
-        'request': {
-            'types': target_cores,
-            'return fields': return_fields.split(","),
-        },
-        'data': []
-    }
-    for core in target_cores:
-        try:
-            new_query, new_kwargs = builder.build_search_query(core, query, kwargs)
-            query_response = SOLR.query(core, new_query, **new_kwargs)
-            if 'error' in query_response:
-                api_error = APIError(
-                    ErrorType.SOLR_SEARCH_ERROR, 
-                    query_response['error']['msg'] + " on core " + core)
-                return JsonResponse(api_error.args(), status=query_response['error']['code'])
-            
-            query_response['type'] = core
-            for doc in query_response['response']['docs']:
-                builder.flatten_doc(doc, return_fields, ['keywords'])
-
-            responses['data'].append(query_response)
+    # Cores are queried concurrently, but responses and errors are handled in the order of target_cores.
+    if request.GET.get('raw', '') == 'true':
+        results = _query_cores(_search_raw_core, target_cores, query, kwargs, return_fields)
+        response = _search_raw_response(target_cores, return_fields, results)
+    else:
+        results = _query_cores(_search_core, target_cores, query, kwargs, return_fields)
+        response = _search_response(target_cores, return_fields, results)
+    if response.status_code == 200:
+        SEARCH_CACHE.set(cache_key, response.content, cache_generation)
+    return response
 
-        #We do not use pysolr to query.
-        #except pysolr.SolrError as se:
-        #    api_error = APIError(ErrorType.SOLR_SEARCH_ERROR, str(se))
-        #    return JsonResponse(api_error.args(), status=400)
-        except KeyError as ke:
-            api_error = APIError(ErrorType.UNEXPECTED_SERVER_ERROR, str(ke))
-            return JsonResponse(api_error.args(), status=500)
-        except ValueError as ve:
-            api_error = APIError(ErrorType.SOLR_CONNECTION_ERROR, str(ve))
-            return JsonResponse(api_error.args(), status=500)
+async def async_search(request):
+    """
+    Asynchronous version of search, used instead of it when ASYNC_VIEWS is set.
+    Cores are queried without blocking a worker thread, so a single process can wait on many
+    Solr requests at once.
+    Streaming would block the event loop while reading from Solr, so with stream=true the response is
+    built in memory instead, with the same limit on rows.
+    """
+    if request.method != "GET":
+        return HttpResponse(status=405)
+    
+    with SLOW_QUERY_LOG.recording(_search_params(request)) as record:
+        response = await _asearch(request)
+        record.status = response.status_code
+    return response
 
-    return JsonResponse(responses)
+async def _asearch(request):
+    """
+    Asynchronous version of _search, which also builds streamed searches in memory.
+    """
+    if request.GET.get('stream', '') == 'true':
+        stream_range = _prepare_stream_range(request.GET)
+        if isinstance(stream_range, HttpResponse):
+            return stream_range
+    
+    cache_key = SearchCache.make_key(request.GET)
+    with timing.phase('cache'):
+        cached_response = SEARCH_CACHE.get(cache_key)
+    if cached_response is not None:
+        return HttpResponse(cached_response, content_type='application/json')
+    cache_generation = SEARCH_CACHE.generation
+    
+    try:
+        await _aload_cores()
+    except SOLR_ERRORS as e:
+        return _solr_error_response(e)
+    prepared = _prepare_search(request)
+    if isinstance(prepared, HttpResponse):
+        return prepared
+    target_cores, return_fields, query, kwargs = prepared
+    
+    if request.GET.get('raw', '') == 'true':
+        results = await _aquery_cores(_asearch_raw_core, target_cores, query, kwargs, return_fields)
+        response = _search_raw_response(target_cores, return_fields, results)
+    else:
+        results = await _aquery_cores(_asearch_core, target_cores, query, kwargs, return_fields)
+        response = _search_response(target_cores, return_fields, results)
+    if response.status_code == 200:
+        SEARCH_CACHE.set(cache_key, response.content, cache_generation)
+    return response
 
 def document(request):
     """
@@ -109,68 +743,52 @@ def document(request):
     types : string, optional
         The Solr cores to search in.
         All cores by default.
-    id : int
+    id : string
         The id to search for and retrieve
+    ids : string, optional
+        Comma-separated ids of documents to retrieve at once, instead of id.
+        At most DOCUMENT_MAX_IDS ids can be requested.
     return : string, optional
         The fields to be returned in the query response.
         All fields by default.
         Example: 'id,sales_price:price,secret_sauce:popularity,score'
 
     Takes a GET request containing an ID URL and returns the associated document from Solr database.
+    All cores are looked up concurrently and each document is taken from the first core (in order) having it.
+    Given ids, returns the list of documents found in the order of the ids instead.
     
     Example Usage:
     http://.../api/document?types=thesis&id=someid
+    http://.../api/document?types=thesis&ids=someid,otherid
+    -------
+    See https://lucene.apache.org/solr/guide/8_4/realtime-get.html for more details.
     """
     if request.method != "GET":
         return HttpResponse(status=405)
     
-    try:
-        target_cores = builder.build_cores(request.GET.get('types', ''), SOLR.get_core_names())
-        return_fields = builder.build_return_fields(request.GET.get('return', ''), target_cores)
-    except ValueError as ve:
-        api_error = APIError(ErrorType.INVALID_DOCUMENT_REQUEST, str(ve))
-        return JsonResponse(api_error.args(), status=400)
+    prepared = _prepare_document(request)
+    if isinstance(prepared, HttpResponse):
+        return prepared
+    target_cores, return_fields, doc_ids, batch = prepared
     
-    doc_id = request.GET.get('id', '')
-    if doc_id == '':
-        api_error = APIError(ErrorType.INVALID_DOCUMENT_REQUEST)
-        return JsonResponse(api_error.args(), status=400)
+    results = _query_cores(_document_core, target_cores, doc_ids, return_fields)
+    return _document_response(target_cores, return_fields, doc_ids, batch, results)
+
+async def async_document(request):
+    """
+    Asynchronous version of document, used instead of it when ASYNC_VIEWS is set.
+    """
+    if request.method != "GET":
+        return HttpResponse(status=405)
     
-    kwargs = { 'field_list': return_fields}
+    try:
+        await _aload_cores()
+    except SOLR_ERRORS as e:
+        return _solr_error_response(e)
+    prepared = _prepare_document(request)
+    if isinstance(prepared, HttpResponse):
+        return prepared
+    target_cores, return_fields, doc_ids, batch = prepared
     
-    response = {
-        'request': {
-            'types': target_cores,
-            'return fields': return_fields.split(","),
-        },
-        'data': {}
-    }
-    for core in target_cores:
-        try:
-            new_query, new_kwargs = builder.build_document_query(doc_id, kwargs)
-            query_response = SOLR.query(core, new_query, **new_kwargs)
-            if 'error' in query_response:
-                api_error = APIError(
-                    ErrorType.SOLR_SEARCH_ERROR, 
-                    query_response['error']['msg'] + " on core " + core)
-                return JsonResponse(api_error.args(), status=query_response['error']['code'])
-            
-            if query_response['response']['numFound'] != 0:
-                response['data'] = {
-                    'type': core,
-                    'doc': builder.flatten_doc(query_response['response']['docs'][0], return_fields, ['keywords'])
-                }
-                return JsonResponse(response)
-
-        #We do not use pysolr to query.
-        #except pysolr.SolrError as se:
-        #    api_error = APIError(ErrorType.SOLR_SEARCH_ERROR, str(se))
-        #    return JsonResponse(api_error.args(), status=400)
-        except KeyError as ke:
-            api_error = APIError(ErrorType.UNEXPECTED_SERVER_ERROR, str(ke))
-            return JsonResponse(api_error.args(), status=500)
-        except ValueError as ve:
-            api_error = APIError(ErrorType.SOLR_CONNECTION_ERROR, str(ve))
-            return JsonResponse(api_error.args(), status=500)
-
-    return HttpResponse("Document not found", status=404)
\ No newline at end of file
+    results = await _aquery_cores(_adocument_core, target_cores, doc_ids, return_fields)
+    return _document_response(target_cores, return_fields, doc_ids, batch, results)
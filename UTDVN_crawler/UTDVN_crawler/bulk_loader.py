@@ -0,0 +1,149 @@
+# -*- coding: utf-8 -*-
+"""
+Loads crawled JSON lines data into Solr without going through a Scrapy crawl.
+
+The file is split into byte ranges ending on line boundaries, which worker processes parse,
+convert to SolrThesis documents and post to Solr's JSON update handler in large batches without committing.
+A single hard commit is issued once every shard is loaded.
+
+Usage (from UTDVN_crawler):
+    python -m UTDVN_crawler.bulk_loader [--file crawled_data/vnu.json] [--processes 4] [--batch-size 1000]
+"""
+import argparse
+import collections
+import json
+import multiprocessing
+import os
+import sys
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+# Include path to modules in UTDVN_backend so they can be imported, as in settings.py
+sys.path.append(os.path.dirname(BASE_DIR) + '/UTDVN_backend')
+
+from scrapy.exceptions import DropItem
+from UTDVN_backend.settings import HAYSTACK_CONNECTIONS
+from .documents import create_solr_connection, get_time, make_solr_thesis
+from .pipelines import DuplicatesPipeline
+
+# Number of shards per worker process, so that a slow shard does not leave the other processes idle
+SHARDS_PER_PROCESS = 4
+
+# The connection of each worker process
+_solr_connection = None
+
+def shard_ranges(path, num_shards):
+    """
+    Splits the file at path into at most num_shards (start, end) byte ranges
+    that start at the beginning of a line and end after a line break or at the end of the file.
+    """
+    size = os.path.getsize(path)
+    bounds = [0]
+    with open(path, 'rb') as f:
+        for i in range(1, num_shards):
+            offset = size * i // num_shards
+            if offset <= bounds[-1]:
+                continue
+            # Reading the rest of the line that contains the byte before offset
+            # moves to the start of the next line
+            f.seek(offset - 1)
+            f.readline()
+            if bounds[-1] < f.tell() < size:
+                bounds.append(f.tell())
+    bounds.append(size)
+    return [(bounds[i], bounds[i + 1]) for i in range(len(bounds) - 1) if bounds[i] < bounds[i + 1]]
+
+def read_shard(path, start, end):
+    """
+    Yields the non-empty lines of the file at path between the byte offsets start and end.
+    """
+    with open(path, 'rb') as f:
+        f.seek(start)
+        position = start
+        while position < end:
+            line = f.readline()
+            if not line:
+                return
+            position += len(line)
+            if line.strip():
+                yield line
+
+def load_shard(solr_connection, path, start, end, batch_size, updated_at, core_name='thesis'):
+    """
+    Adds the theses of a shard to the specified core in batches of batch_size documents, without committing.
+    Duplicates within the shard are dropped like in DuplicatesPipeline. Duplicates in different shards
+    get the same id, so Solr keeps only one of them.
+    Returns a dictionary counting the added documents, the duplicates and the invalid lines.
+    """
+    stats = collections.Counter(docs=0, duplicates=0, errors=0)
+    duplicates = DuplicatesPipeline()
+    batch = []
+    for line in read_shard(path, start, end):
+        try:
+            item = duplicates.process_item(json.loads(line))
+            batch.append(make_solr_thesis(item, updated_at).doc)
+        except DropItem:
+            stats['duplicates'] += 1
+            continue
+        except (ValueError, KeyError, AttributeError):
+            stats['errors'] += 1
+            continue
+
+        if len(batch) >= batch_size:
+            solr_connection.post_documents(core_name, batch)
+            stats['docs'] += len(batch)
+            batch = []
+
+    if len(batch) > 0:
+        solr_connection.post_documents(core_name, batch)
+        stats['docs'] += len(batch)
+    return stats
+
+def _init_worker(solr_url):
+    """
+    Creates the Solr connection of a worker process.
+    """
+    global _solr_connection
+    _solr_connection = create_solr_connection(solr_url)
+
+def _load_shard(args):
+    """
+    Loads a shard with the connection of the worker process.
+    """
+    return load_shard(_solr_connection, *args)
+
+def bulk_load(path, solr_url, processes=None, batch_size=1000, core_name='thesis'):
+    """
+    Loads the theses in the JSON lines file at path into the specified core with the given number
+    of worker processes (the number of CPUs by default), then commits them at once.
+    Returns a dictionary counting the added documents, the duplicates and the invalid lines.
+    """
+    processes = processes or os.cpu_count()
+    updated_at = get_time()
+    shards = [
+        (path, start, end, batch_size, updated_at, core_name)
+        for (start, end) in shard_ranges(path, processes * SHARDS_PER_PROCESS)]
+
+    totals = collections.Counter(docs=0, duplicates=0, errors=0)
+    with multiprocessing.Pool(processes, _init_worker, (solr_url,)) as pool:
+        for stats in pool.imap_unordered(_load_shard, shards):
+            totals.update(stats)
+
+    print('Committing core %s' % core_name)
+    create_solr_connection(solr_url).commit(core_name)
+    return dict(totals)
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--file', default=os.path.join(BASE_DIR, 'UTDVN_crawler', 'crawled_data', 'vnu.json'),
+                        help='The JSON lines file exported by JsonExporterPipeline.')
+    parser.add_argument('--solr-url', default=HAYSTACK_CONNECTIONS['default']['URL'])
+    parser.add_argument('--core', default='thesis')
+    parser.add_argument('--processes', type=int, default=None, help='Number of worker processes.')
+    parser.add_argument('--batch-size', type=int, default=1000, help='Number of documents per update request.')
+    args = parser.parse_args()
+
+    totals = bulk_load(args.file, args.solr_url, args.processes, args.batch_size, args.core)
+    print('Added %(docs)d documents, dropped %(duplicates)d duplicates and %(errors)d invalid lines' % totals)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,200 @@
+# -*- coding: utf-8 -*-
+"""
+Checkpoints of crawls, so that a crawl that is stopped or killed resumes where it was instead of starting over.
+
+A checkpoint holds the pending requests of the scheduler (the frontier) and the fingerprints of the
+requests seen so far. It is only taken while no request is in progress, after the item pipelines
+have flushed the items processed so far, so every request that is not in the frontier has been
+fully processed. The item pipelines and the spider persist their own state at the same point.
+"""
+import logging
+import os
+import pickle
+
+from scrapy import signals
+from scrapy.core.scheduler import Scheduler
+from scrapy.exceptions import NotConfigured
+from scrapy.utils.misc import load_object
+from twisted.internet import defer, task
+
+try:
+    from scrapy.utils.request import request_from_dict
+
+    def request_to_dict(request, spider):
+        return request.to_dict(spider=spider)
+except ImportError:
+    # Scrapy < 2.6
+    from scrapy.utils.reqser import request_from_dict, request_to_dict
+
+logger = logging.getLogger(__name__)
+
+def _fingerprints(dupefilter):
+    """
+    Returns the set of fingerprints of the requests seen by an RFPDupeFilter.
+    """
+    # It became private in Scrapy 2.14, and its public view is a frozenset
+    if hasattr(dupefilter, '_fingerprints'):
+        return dupefilter._fingerprints
+    return dupefilter.fingerprints
+
+# Seconds between two checks that no request is in progress while a checkpoint waits for it
+IDLE_POLL_INTERVAL = 0.1
+
+class CheckpointScheduler(Scheduler):
+    """
+    A Scheduler that keeps track of its pending requests, so that they can be saved in a checkpoint
+    with the fingerprints of the requests seen, and restored by the next run.
+    It relies on the memory queues returning the requests that were enqueued,
+    so it must not be used with JOBDIR.
+    """
+
+    def open(self, spider):
+        # The pending requests by id, in the order they were enqueued
+        self.pending = {}
+        return super(CheckpointScheduler, self).open(spider)
+
+    def enqueue_request(self, request):
+        if not super(CheckpointScheduler, self).enqueue_request(request):
+            return False
+        self.pending[id(request)] = request
+        return True
+
+    def next_request(self):
+        request = super(CheckpointScheduler, self).next_request()
+        if request is not None:
+            self.pending.pop(id(request), None)
+        return request
+
+    def get_state(self):
+        """
+        Returns the pending requests and the fingerprints of the requests seen, in a picklable form.
+        """
+        return {
+            'requests': [request_to_dict(request, self.spider) for request in self.pending.values()],
+            'seen': set(_fingerprints(self.df)),
+        }
+
+    def restore_state(self, state):
+        """
+        Enqueues the pending requests of a state returned by get_state, and marks its requests as seen.
+        """
+        for request_dict in state['requests']:
+            self.enqueue_request(request_from_dict(request_dict, spider=self.spider))
+        _fingerprints(self.df).update(state['seen'])
+
+class CheckpointExtension(object):
+    """
+    Saves a checkpoint of the crawl to CHECKPOINT_DIR every CHECKPOINT_INTERVAL seconds and when
+    the spider is stopped before it finished, and resumes the crawl from it when the spider opens again.
+
+    To take a checkpoint, the engine is paused until the requests in progress are processed. Then, the
+    item pipelines that have a checkpoint(spider) method are called from the last one to the first one,
+    so that items are persisted by later pipelines (e.g. sent to Solr) before earlier ones record them
+    as processed, and may return a Deferred to be waited for. The fetch_state of the spider is committed,
+    and the state of the CheckpointScheduler is saved.
+    """
+
+    def __init__(self, crawler, directory, interval):
+        self.crawler = crawler
+        self.directory = directory
+        self.interval = interval
+        self.path = None
+        self.scheduler = None
+        self.task = None
+        self.checkpointing = False
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        directory = crawler.settings.get('CHECKPOINT_DIR')
+        if not directory:
+            raise NotConfigured
+        # Scrapy 2 schedulers are checked by duck typing, so issubclass would accept any scheduler
+        if not hasattr(load_object(crawler.settings.get('SCHEDULER')), 'get_state'):
+            raise NotConfigured('CheckpointExtension needs SCHEDULER to be a CheckpointScheduler')
+        extension = cls(crawler, directory, crawler.settings.getfloat('CHECKPOINT_INTERVAL', 300))
+        crawler.signals.connect(extension.spider_opened, signal=signals.spider_opened)
+        crawler.signals.connect(extension.spider_closed, signal=signals.spider_closed)
+        return extension
+
+    def _engine_slot(self):
+        engine = self.crawler.engine
+        # The slot of the engine became private in Scrapy 2
+        return getattr(engine, 'slot', None) or engine._slot
+
+    def spider_opened(self, spider):
+        self.path = os.path.join(self.directory, '%s.checkpoint' % spider.name)
+        self.scheduler = self._engine_slot().scheduler
+        # Fetches are only recorded once their items are persisted by a checkpoint
+        if getattr(spider, 'fetch_state', None) is not None:
+            spider.fetch_state.commit_interval = None
+        if os.path.exists(self.path):
+            with open(self.path, 'rb') as f:
+                state = pickle.load(f)
+            self.scheduler.restore_state(state)
+            self.crawler.stats.set_value('checkpoint/restored_requests', len(state['requests']), spider=spider)
+            logger.info('Resumed from %s with %d pending requests and %d seen',
+                        self.path, len(state['requests']), len(state['seen']))
+        self.task = task.LoopingCall(self.checkpoint, spider)
+        self.task.start(self.interval, now=False)
+
+    def spider_closed(self, spider, reason):
+        if self.task is not None and self.task.running:
+            self.task.stop()
+        self.task = None
+        if reason == 'finished':
+            if os.path.exists(self.path):
+                os.remove(self.path)
+        else:
+            # The pipelines persist everything when they are closed, the spider commits its fetch_state,
+            # and the requests in progress were processed before the spider closed
+            self._save(spider, commit_fetch_state=False)
+
+    def checkpoint(self, spider):
+        """
+        Takes a checkpoint of the crawl. Returns a Deferred fired once it is saved.
+        """
+        if self.checkpointing:
+            return None
+        self.checkpointing = True
+        engine = self.crawler.engine
+        engine.pause()
+        d = self._wait_idle()
+        d.addCallback(lambda _: self._flush_pipelines(spider) if self.task is not None else None)
+        d.addCallback(lambda _: self._save(spider) if self.task is not None else None)
+
+        def resume(result):
+            self.checkpointing = False
+            engine.unpause()
+            # Otherwise the engine would only look for requests again at its next heartbeat
+            if self.task is not None:
+                self._engine_slot().nextcall.schedule()
+            return result
+        d.addBoth(resume)
+        d.addErrback(lambda failure: logger.error('Checkpoint failed: %s', failure.getTraceback()))
+        return d
+
+    @defer.inlineCallbacks
+    def _wait_idle(self):
+        from twisted.internet import reactor
+        while self.task is not None and self._engine_slot().inprogress:
+            yield task.deferLater(reactor, IDLE_POLL_INTERVAL, lambda: None)
+
+    @defer.inlineCallbacks
+    def _flush_pipelines(self, spider):
+        for pipeline in reversed(self.crawler.engine.scraper.itemproc.middlewares):
+            if hasattr(pipeline, 'checkpoint'):
+                yield pipeline.checkpoint(spider)
+
+    def _save(self, spider, commit_fetch_state=True):
+        if commit_fetch_state and getattr(spider, 'fetch_state', None) is not None:
+            spider.fetch_state.commit()
+        state = self.scheduler.get_state()
+        os.makedirs(self.directory, exist_ok=True)
+        temp_path = self.path + '.tmp'
+        with open(temp_path, 'wb') as f:
+            pickle.dump(state, f, protocol=pickle.HIGHEST_PROTOCOL)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(temp_path, self.path)
+        self.crawler.stats.inc_value('checkpoint/saved', spider=spider)
+        logger.info('Saved checkpoint to %s with %d pending requests', self.path, len(state['requests']))
@@ -0,0 +1,209 @@
+# -*- coding: utf-8 -*-
+"""
+Compact sets of keys seen by the crawler, which can be saved to disk and loaded in the next run.
+
+Keys are reduced to 64-bit hashes kept in an open-addressing table backed by an array, so that
+each key costs a fixed 16 to 32 bytes whatever its length. Two different keys get the same hash
+with a probability of about n / 2^64 for n keys, which is negligible for millions of theses.
+"""
+import array
+import hashlib
+import math
+import os
+import sys
+
+# Header of the files written by HashStore.save, followed by the number of hashes and the table
+FILE_MAGIC = b'UTDVNDD1'
+
+# Maximum ratio of used slots in the table of a HashStore before it is doubled
+MAX_LOAD_FACTOR = 0.5
+
+def hash_key(key):
+    """
+    Returns a non-zero 64-bit hash of a string, which is stable across runs unlike hash().
+    """
+    value = int.from_bytes(hashlib.blake2b(key.encode('utf-8'), digest_size=8).digest(), 'little')
+    # Zero marks the empty slots of the table
+    return value or 1
+
+class BloomFilter(object):
+    """
+    A Bloom filter of 64-bit hashes, sized to hold capacity hashes with a false positive rate of error_rate.
+    The bit positions are derived from the two halves of the hash, so no further hashing is needed.
+    """
+
+    def __init__(self, capacity, error_rate=0.01):
+        capacity = max(capacity, 1)
+        self.num_bits = max(int(-capacity * math.log(error_rate) / math.log(2) ** 2), 8)
+        self.num_hashes = max(int(round(self.num_bits / capacity * math.log(2))), 1)
+        self.bits = bytearray((self.num_bits + 7) // 8)
+
+    def add(self, value):
+        bits = self.bits
+        num_bits = self.num_bits
+        position = value & 0xFFFFFFFF
+        step = value >> 32
+        for _ in range(self.num_hashes):
+            position %= num_bits
+            bits[position >> 3] |= 1 << (position & 7)
+            position += step
+
+    def __contains__(self, value):
+        bits = self.bits
+        num_bits = self.num_bits
+        position = value & 0xFFFFFFFF
+        step = value >> 32
+        for _ in range(self.num_hashes):
+            position %= num_bits
+            if not bits[position >> 3] & (1 << (position & 7)):
+                return False
+            position += step
+        return True
+
+    def memory_bytes(self):
+        return len(self.bits)
+
+class HashStore(object):
+    """
+    A set of string keys stored as 64-bit hashes in an array-backed open-addressing table.
+
+    Parameters
+    ----------
+    path : str
+        File the hashes are loaded from if it exists, and saved to by save. The store is only kept in memory if None.
+    capacity : int
+        Number of keys the table initially holds before it grows.
+    bloom_error_rate : float
+        If set, a Bloom filter with this false positive rate is checked before the table,
+        so that most lookups of new keys do not probe the table.
+    """
+
+    def __init__(self, path=None, capacity=1024, bloom_error_rate=None):
+        self.path = path
+        self.bloom_error_rate = bloom_error_rate
+        self.count = 0
+        self.bloom = None
+        self._allocate(capacity)
+        if path is not None and os.path.exists(path):
+            self.load()
+
+    def _allocate(self, capacity):
+        # A power of 2 number of slots, so that the slot of a hash is its lowest bits
+        size = 1 << max(int(math.ceil(math.log2(max(capacity, 1) / MAX_LOAD_FACTOR))), 3)
+        self.table = array.array('Q', bytes(8 * size))
+        self.mask = size - 1
+        if self.bloom_error_rate is not None:
+            self.bloom = BloomFilter(int(size * MAX_LOAD_FACTOR), self.bloom_error_rate)
+
+    def _insert(self, value):
+        """
+        Puts value in the table. Returns False if it was already there.
+        """
+        table = self.table
+        mask = self.mask
+        slot = value & mask
+        while True:
+            current = table[slot]
+            if current == 0:
+                table[slot] = value
+                self.count += 1
+                if self.bloom is not None:
+                    self.bloom.add(value)
+                return True
+            if current == value:
+                return False
+            slot = (slot + 1) & mask
+
+    def _contains(self, value):
+        if self.bloom is not None and value not in self.bloom:
+            return False
+        table = self.table
+        mask = self.mask
+        slot = value & mask
+        while True:
+            current = table[slot]
+            if current == value:
+                return True
+            if current == 0:
+                return False
+            slot = (slot + 1) & mask
+
+    def _grow(self, capacity):
+        old_table = self.table
+        self.count = 0
+        self._allocate(capacity)
+        for value in old_table:
+            if value:
+                self._insert(value)
+
+    def add(self, key):
+        """
+        Adds a key to the store. Returns False if it was already there.
+        """
+        if self.count + 1 > (self.mask + 1) * MAX_LOAD_FACTOR:
+            self._grow(2 * (self.count + 1))
+        return self._insert(hash_key(key))
+
+    def __contains__(self, key):
+        return self._contains(hash_key(key))
+
+    def __len__(self):
+        return self.count
+
+    def memory_bytes(self):
+        """
+        Returns the number of bytes used by the table and the Bloom filter.
+        """
+        size = self.table.itemsize * len(self.table)
+        if self.bloom is not None:
+            size += self.bloom.memory_bytes()
+        return size
+
+    def load(self):
+        """
+        Replaces the content of the store with the hashes saved at path.
+        """
+        with open(self.path, 'rb') as f:
+            if f.read(len(FILE_MAGIC)) != FILE_MAGIC:
+                raise ValueError('%s is not a dedup store file' % self.path)
+            count = int.from_bytes(f.read(8), 'little')
+            size = (os.fstat(f.fileno()).st_size - f.tell()) // 8
+            table = array.array('Q')
+            table.fromfile(f, size)
+        if sys.byteorder != 'little':
+            table.byteswap()
+
+        if size > 0 and size & (size - 1) == 0 and count <= size * MAX_LOAD_FACTOR:
+            # The saved table can be used as is, only the Bloom filter has to be rebuilt
+            self.table = table
+            self.mask = size - 1
+            self.count = count
+            if self.bloom_error_rate is not None:
+                self.bloom = BloomFilter(int(size * MAX_LOAD_FACTOR), self.bloom_error_rate)
+                for value in table:
+                    if value:
+                        self.bloom.add(value)
+        else:
+            self.count = 0
+            self._allocate(count)
+            for value in table:
+                if value:
+                    self._insert(value)
+
+    def save(self):
+        """
+        Writes the hashes to path. The previous file is only replaced once the new one is complete.
+        """
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        table = self.table
+        if sys.byteorder != 'little':
+            table = array.array('Q', table)
+            table.byteswap()
+        temp_path = self.path + '.tmp'
+        with open(temp_path, 'wb') as f:
+            f.write(FILE_MAGIC)
+            f.write(self.count.to_bytes(8, 'little'))
+            table.tofile(f)
+        os.replace(temp_path, self.path)
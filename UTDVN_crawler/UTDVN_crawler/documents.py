@@ -0,0 +1,62 @@
+# -*- coding: utf-8 -*-
+"""
+Conversion of crawled theses to Solr documents and the Solr connection they are indexed through.
+
+Nothing here imports UTDVN_database.views, so that processes only indexing documents (e.g. the workers
+of bulk_loader) do not build the search executor, caches and logs of the backend.
+"""
+import datetime
+import threading
+from UTDVN_backend.settings import HAYSTACK_CONNECTIONS
+from UTDVN_database.solr.connection import SolrConnection
+from UTDVN_database.solr.models import SolrThesis
+
+# The connection shared by the pipelines of the process, see get_solr_connection
+_solr_connection = None
+_solr_connection_lock = threading.Lock()
+
+def get_time():
+    """
+    Make a UTC date string in format 'Y-m-d H:M:S'
+    """
+    style = '%Y-%m-%d %H:%M:%S'
+    return datetime.datetime.now().strftime(style)
+
+def make_solr_thesis(item, updated_at):
+    """
+    Converts a Thesis item, or a dictionary with the same fields, to a SolrThesis updated at updated_at.
+    """
+    return SolrThesis(
+        id=(item['author'].replace(',', '') + ' ' + item['title']).replace(' ', '_'),
+        type='thesis',
+        title=item['title'],
+        author=item['author'].replace(',', ''),
+        description=item['abstract'],
+        updatedAt=updated_at,
+        yearpub=item['yearpub'],
+        advisor=item['advisor'].replace(',', ''),
+        publisher=item['publisher'],
+        uri=item['uri'],
+        file_url=item['file_url'],
+        language=item['language'],
+        keywords=[kw.strip() for kw in item['keywords'].replace(';',',').replace('.',',').split(',')],
+    )
+
+def create_solr_connection(url=None):
+    """
+    Creates a SolrConnection configured by HAYSTACK_CONNECTIONS, to the given base Solr url if it is set.
+    """
+    config = dict(HAYSTACK_CONNECTIONS['default'])
+    if url is not None:
+        config['URL'] = url
+    return SolrConnection.from_config(config)
+
+def get_solr_connection():
+    """
+    Returns the SolrConnection shared by the process, created by create_solr_connection on first use.
+    """
+    global _solr_connection
+    with _solr_connection_lock:
+        if _solr_connection is None:
+            _solr_connection = create_solr_connection()
+        return _solr_connection
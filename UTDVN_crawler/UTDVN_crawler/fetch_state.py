@@ -0,0 +1,69 @@
+# -*- coding: utf-8 -*-
+"""
+The state of the last fetch of each page of an incremental crawl, kept in a SQLite database.
+"""
+import collections
+import hashlib
+import os
+import sqlite3
+
+# The validators of a page sent back in conditional requests, and the hash of its body
+FetchState = collections.namedtuple('FetchState', ['etag', 'last_modified', 'content_hash'])
+
+def content_hash(body):
+    """
+    Returns the hash of a response body that tells whether a page changed between fetches.
+    """
+    return hashlib.sha1(body).hexdigest()
+
+class FetchStateStore(object):
+    """
+    Fetch states by URL in a SQLite database at path.
+    Changes are committed every commit_interval updates and when the store is closed,
+    so that a crawl that dies only fetches again the pages of its last updates.
+    If commit_interval is None, changes are only committed by commit and close.
+    """
+
+    def __init__(self, path, commit_interval=100):
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self.connection = sqlite3.connect(path)
+        self.connection.execute(
+            'CREATE TABLE IF NOT EXISTS fetch_state ('
+            'url TEXT PRIMARY KEY, etag TEXT, last_modified TEXT, content_hash TEXT)')
+        self.commit_interval = commit_interval
+        self.pending = 0
+
+    def get(self, url):
+        """
+        Returns the FetchState of url, or None if it was never fetched.
+        """
+        row = self.connection.execute(
+            'SELECT etag, last_modified, content_hash FROM fetch_state WHERE url = ?', (url,)).fetchone()
+        return FetchState(*row) if row is not None else None
+
+    def __contains__(self, url):
+        return self.connection.execute('SELECT 1 FROM fetch_state WHERE url = ?', (url,)).fetchone() is not None
+
+    def __len__(self):
+        return self.connection.execute('SELECT COUNT(*) FROM fetch_state').fetchone()[0]
+
+    def set(self, url, state):
+        """
+        Records the FetchState of the last fetch of url.
+        """
+        self.connection.execute(
+            'INSERT OR REPLACE INTO fetch_state (url, etag, last_modified, content_hash) VALUES (?, ?, ?, ?)',
+            (url,) + tuple(state))
+        self.pending += 1
+        if self.commit_interval is not None and self.pending >= self.commit_interval:
+            self.commit()
+
+    def commit(self):
+        self.connection.commit()
+        self.pending = 0
+
+    def close(self):
+        self.commit()
+        self.connection.close()
@@ -6,6 +6,8 @@
 # https://docs.scrapy.org/en/latest/topics/spider-middleware.html
 
 from scrapy import signals
+from scrapy.exceptions import IgnoreRequest
+from .fetch_state import FetchState, content_hash
 
 
 class UtdvnCrawlerSpiderMiddleware(object):
@@ -101,3 +103,55 @@ class UtdvnCrawlerDownloaderMiddleware(object):
 
     def spider_opened(self, spider):
         spider.logger.info('Spider opened: %s' % spider.name)
+
+
+class ConditionalRequestMiddleware(object):
+    """
+    Sends requests with meta 'conditional' set as conditional requests, using the ETag and Last-Modified
+    of their last fetch recorded in the fetch_state of the spider, and records the state of their new fetch,
+    which the spider commits once the items of the page are persisted.
+    Pages that were not modified, or whose body has the same hash as last time, are dropped
+    before reaching the spider.
+    """
+
+    def __init__(self, stats):
+        self.stats = stats
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        return cls(crawler.stats)
+
+    def _applies(self, request, spider):
+        return request.meta.get('conditional') and getattr(spider, 'fetch_state', None) is not None
+
+    def process_request(self, request, spider):
+        if not self._applies(request, spider):
+            return None
+        state = spider.fetch_state.get(request.url)
+        if state is not None:
+            if state.etag:
+                request.headers['If-None-Match'] = state.etag
+            if state.last_modified:
+                request.headers['If-Modified-Since'] = state.last_modified
+        return None
+
+    def process_response(self, request, response, spider):
+        if not self._applies(request, spider):
+            return response
+        if response.status == 304:
+            self.stats.inc_value('fetch_state/not_modified', spider=spider)
+            raise IgnoreRequest('Not modified: %s' % request.url)
+        if response.status != 200:
+            return response
+
+        def header(name):
+            value = response.headers.get(name)
+            return value.decode('latin-1') if value is not None else None
+
+        previous = spider.fetch_state.get(request.url)
+        state = FetchState(header('ETag'), header('Last-Modified'), content_hash(response.body))
+        spider.fetch_state.set(request.url, state)
+        if previous is not None and previous.content_hash == state.content_hash:
+            self.stats.inc_value('fetch_state/unchanged', spider=spider)
+            raise IgnoreRequest('Unchanged: %s' % request.url)
+        return response
@@ -4,26 +4,84 @@
 #
 # Don't forget to add your pipeline to the ITEM_PIPELINES setting
 # See: https://docs.scrapy.org/en/latest/topics/item-pipeline.html
-import datetime
+import collections
+import json
+import logging
+import queue
+import threading
 from scrapy.exceptions import DropItem
+from twisted.internet import defer
+from twisted.python import failure
 from scrapy.exporters import JsonLinesItemExporter
+from .dedup import HashStore
+from .documents import get_solr_connection, get_time, make_solr_thesis
 from .items import Thesis
-from UTDVN_database.views import SOLR
-from UTDVN_database.solr.models import *
+
+logger = logging.getLogger(__name__)
+
+def _item_pipelines(crawler, pipeline):
+    """
+    Returns the item pipelines of a crawler before and after the given one, in the order items go through them,
+    or ([], []) outside of a crawl.
+    """
+    if crawler is None or crawler.engine is None:
+        return ([], [])
+    pipelines = list(crawler.engine.scraper.itemproc.middlewares)
+    if pipeline not in pipelines:
+        return ([], [])
+    index = pipelines.index(pipeline)
+    return (pipelines[:index], pipelines[index + 1:])
 
 class DuplicatesPipeline(object):
     """
-    Looks for duplicate items, and drop those items that were already processed
+    Looks for duplicate items, and drop those items that were already processed.
+    The items seen are kept as hashes in a HashStore, which is saved to path when the spider closes,
+    so that the next crawl also drops the items that were processed by the previous ones.
+    If a later pipeline persists the items (checkpoints_on_close), it is saved by that pipeline through
+    checkpoint once they are persisted instead, so that items which could not be persisted are not marked as seen.
+    Incremental crawls only yield the items whose page changed since they were last fetched,
+    so only the items seen during the same crawl are dropped for spiders with a fetch_state.
     """
     
-    def __init__(self):
-        self.ids_seen = set()
+    def __init__(self, path=None, bloom_error_rate=None, crawler=None):
+        self.ids_seen = HashStore(path, bloom_error_rate=bloom_error_rate)
+        # The items seen by the current crawl, if they are not all in ids_seen
+        self.ids_crawled = HashStore() if path is not None else self.ids_seen
+        self.crawler = crawler
+        
+    @classmethod
+    def from_crawler(cls, crawler):
+        return cls(
+            path=crawler.settings.get('DEDUP_STORE_PATH'),
+            bloom_error_rate=crawler.settings.getfloat('DEDUP_BLOOM_ERROR_RATE') or None,
+            crawler=crawler)
+        
+    def close_spider(self, spider=None):
+        """
+        Saves the items seen when spider closed, unless a later pipeline saves them once the items are persisted.
+        """
+        _, later_pipelines = _item_pipelines(self.crawler, self)
+        if not any(getattr(pipeline, 'checkpoints_on_close', False) for pipeline in later_pipelines):
+            self.checkpoint(spider)
+        
+    def checkpoint(self, spider=None):
+        """
+        Saves the items seen so far, see CheckpointExtension.
+        """
+        if self.ids_seen.path is not None:
+            self.ids_seen.save()
+            logger.info('Saved %d seen items (%d bytes in memory) to %s',
+                        len(self.ids_seen), self.ids_seen.memory_bytes(), self.ids_seen.path)
         
     def process_item(self, item, spider=None):
-        if item['author'] + '_' + item['title'] in self.ids_seen:
+        key = item['author'] + '_' + item['title']
+        seen = self.ids_crawled if getattr(spider, 'fetch_state', None) is not None else self.ids_seen
+        if key in seen:
             raise DropItem("Duplicate item found: %s" % item)
         else:
-            self.ids_seen.add(item['author'] + '_' + item['title'])
+            self.ids_seen.add(key)
+            if self.ids_crawled is not self.ids_seen:
+                self.ids_crawled.add(key)
             return item
 
 class JsonExporterPipeline(object):
@@ -50,50 +108,244 @@ class JsonExporterPipeline(object):
     
 class SolrPipeline(object):
     """
-    Stores items in Solr
+    Stores items in Solr.
+    While the spider runs, documents are indexed by a dedicated thread so that requests to Solr
+    never block the reactor. Items wait for room in its queue, of at most queue_size documents,
+    which holds back the crawl when Solr cannot keep up.
+    Batches Solr fails to insert stay queued in the Solr connection and are sent again with the next one,
+    after its retry interval. The documents the connection cannot keep queued (see MAX_QUEUED) and those
+    still queued when the spider closes are dumped to failed_path as JSON lines if it is set.
+    Once the documents are indexed when the spider closes, the checkpoint methods of the earlier pipelines
+    are called as CheckpointExtension does, so that DuplicatesPipeline saves the items seen. They are not
+    if any document failed to be indexed, so that its item is crawled again.
     """
     
-    def __init__(self, solr_connection=SOLR):
-        self.solr_connection = solr_connection
+    # Makes the earlier pipelines wait for close_spider to record the items processed, see DuplicatesPipeline
+    checkpoints_on_close = True
+    
+    def __init__(self, solr_connection=None, queue_size=1000, failed_path=None, crawler=None):
+        self.solr_connection = solr_connection if solr_connection is not None else get_solr_connection()
+        self.queue = queue.Queue(maxsize=queue_size)
+        # Documents waiting for room in the queue with the Deferreds holding back their items
+        self.waiting = collections.deque()
+        self.worker = None
+        # Fired by the indexing thread once it finished indexing, see close_spider
+        self.closed = None
+        self.failures = 0
+        self.failed_path = failed_path
+        self.crawler = crawler
+        
+    @classmethod
+    def from_crawler(cls, crawler):
+        return cls(
+            queue_size=crawler.settings.getint('SOLR_PIPELINE_QUEUE_SIZE', 1000),
+            failed_path=crawler.settings.get('SOLR_PIPELINE_FAILED_PATH'),
+            crawler=crawler)
+        
+    def open_spider(self, spider=None):
+        """
+        Indexes in bulk mode while the spider runs, so that batches are not hard committed one by one,
+        and starts the indexing thread.
+        """
+        self.solr_connection.start_bulk()
+        self.solr_connection.add_overflow_listener(self._dump_overflow)
+        self.worker = threading.Thread(target=self._index_queued, name='solr-pipeline', daemon=True)
+        self.worker.start()
         
     def close_spider(self, spider=None):
         """
-        Defragments Solr when spider closed.
+        Commits and defragments Solr once the queued documents are indexed, when spider closed.
+        While the spider runs, this is done by the indexing thread after the documents of its queue,
+        and the returned Deferred is fired once it is done, so that the reactor does not wait for Solr.
+        The earlier pipelines are checkpointed afterwards.
+        """
+        if self.worker is None:
+            self._finish()
+            return self._checkpoint_earlier_pipelines(spider)
+        logger.info('Waiting for %d documents to be indexed', self.queue.qsize() + len(self.waiting))
+        self.closed = defer.Deferred()
+        # The None sentinel waits for room in the queue like documents, behind them
+        self.waiting.append((None, defer.Deferred()))
+        self._queue_waiting()
+        return self.closed.addCallback(lambda _: self._checkpoint_earlier_pipelines(spider))
+    
+    @defer.inlineCallbacks
+    def _checkpoint_earlier_pipelines(self, spider):
+        """
+        Calls the checkpoint methods of the pipelines before this one, from the last one to the first one,
+        unless some documents failed to be indexed during the crawl.
+        """
+        if self.failures > 0:
+            logger.warning('Not checkpointing the earlier pipelines, as indexing failed %d times', self.failures)
+            return
+        earlier_pipelines, _ = _item_pipelines(self.crawler, self)
+        for pipeline in reversed(earlier_pipelines):
+            if hasattr(pipeline, 'checkpoint'):
+                yield pipeline.checkpoint(spider)
+    
+    def _finish(self):
+        """
+        Sends the documents still queued by the Solr connection, then commits and defragments Solr.
+        Documents that cannot be sent are dumped to failed_path.
         """
         print('Emptying all queued documents')
-        self.solr_connection.add_queued()
+        try:
+            self.solr_connection.add_queued()
+        except Exception:
+            self.failures += 1
+            logger.exception('Failed to index queued documents')
+            self._dump_queued()
+        print('Committing all Solr cores')
+        self.solr_connection.finish_bulk()
         print('Optimizing all Solr cores')
         self.solr_connection.optimize()
     
+    def _dump_queued(self):
+        """
+        Removes the documents still queued by the Solr connection and appends them to failed_path.
+        """
+        self._dump_documents(self.solr_connection.drop_queued())
+    
+    def _dump_overflow(self, core_name, docs):
+        """
+        Appends the documents the Solr connection removed from the full queue of a core to failed_path.
+        Runs on the indexing thread.
+        """
+        self.failures += 1
+        self._dump_documents({core_name: docs})
+    
+    def _dump_documents(self, dropped):
+        """
+        Appends the documents of each core of dropped to failed_path.
+        """
+        count = sum(len(docs) for docs in dropped.values())
+        if count == 0:
+            return
+        if self.failed_path is None:
+            logger.error('Dropped %d documents that could not be indexed', count)
+            return
+        with open(self.failed_path, 'a', encoding='utf-8') as f:
+            for docs in dropped.values():
+                for doc in docs:
+                    f.write(json.dumps(doc, ensure_ascii=False) + '\n')
+        logger.error('Dumped %d documents that could not be indexed to %s', count, self.failed_path)
+    
+    def checkpoint(self, spider=None):
+        """
+        Returns a Deferred fired once the documents of the items processed so far are sent to Solr,
+        see CheckpointExtension.
+        """
+        if self.worker is None:
+            self.solr_connection.add_queued()
+            return None
+        # The Deferred goes through the queue behind the documents, and is fired by the indexing thread
+        flushed = defer.Deferred()
+        self.waiting.append((flushed, defer.Deferred()))
+        self._queue_waiting()
+        return flushed
+    
+    def _index_queued(self):
+        """
+        Adds the documents of the queue to Solr until the None sentinel is received.
+        Runs on the indexing thread.
+        """
+        # Imported here so that importing this module does not install the default reactor
+        from twisted.internet import reactor
+        while True:
+            solr_doc = self.queue.get()
+            if solr_doc is None:
+                self._close_worker(reactor)
+                return
+            reactor.callFromThread(self._queue_waiting)
+            if isinstance(solr_doc, defer.Deferred):
+                self._flush_queued(reactor, solr_doc)
+                continue
+            try:
+                solr_doc.add_to_solr(self.solr_connection)
+            except Exception:
+                self.failures += 1
+                logger.exception('Failed to index document %s, %d documents stay queued to be sent again',
+                                 solr_doc.doc['id'], self._queued_count())
+    
+    def _close_worker(self, reactor):
+        """
+        Finishes indexing and fires the Deferred returned by close_spider on the reactor thread.
+        Runs on the indexing thread.
+        """
+        try:
+            self._finish()
+        except Exception:
+            reactor.callFromThread(self.closed.errback, failure.Failure())
+        else:
+            reactor.callFromThread(self.closed.callback, None)
+        finally:
+            self.worker = None
+    
+    def _queued_count(self):
+        """
+        Returns the number of documents queued by the Solr connection.
+        """
+        return sum(len(docs) for docs in self.solr_connection.queues.values())
+    
+    def _flush_queued(self, reactor, flushed):
+        """
+        Sends the documents queued by the Solr connection and fires flushed on the reactor thread,
+        or fails it if they cannot be sent so that the checkpoint does not record their items as processed.
+        Runs on the indexing thread.
+        """
+        try:
+            self.solr_connection.add_queued()
+        except Exception:
+            self.failures += 1
+            logger.exception('Failed to index queued documents, %d documents stay queued to be sent again',
+                             self._queued_count())
+            reactor.callFromThread(flushed.errback, failure.Failure())
+            return
+        reactor.callFromThread(flushed.callback, None)
+    
+    def _queue_waiting(self):
+        """
+        Moves waiting documents to the queue while it has room and releases their items.
+        Runs on the reactor thread.
+        """
+        while len(self.waiting) > 0:
+            try:
+                self.queue.put_nowait(self.waiting[0][0])
+            except queue.Full:
+                return
+            self.waiting.popleft()[1].callback(None)
+    
     def process_item(self, item, spider=None):
         if isinstance(item, Thesis):
-            self._process_thesis(item)
+            queued = self._process_thesis(item)
+            if queued is not None:
+                return queued.addCallback(lambda _: item)
         return item
     
     def _process_thesis(self, item):
         """
-        Converts Thesis item to SolrThesis and commits it to Solr.
-        """
-        solr_doc = SolrThesis(
-            id=(item['author'].replace(',', '') + ' ' + item['title']).replace(' ', '_'),
-            type='thesis',
-            title=item['title'],
-            author=item['author'].replace(',', ''),
-            description=item['abstract'],
-            updatedAt=self._get_time(),
-            yearpub=item['yearpub'],
-            advisor=item['advisor'].replace(',', ''),
-            publisher=item['publisher'],
-            uri=item['uri'],
-            file_url=item['file_url'],
-            language=item['language'],
-            keywords=[kw.strip() for kw in item['keywords'].replace(';',',').replace('.',',').split(',')],
-        )
-        solr_doc.add_to_solr(self.solr_connection)
+        Converts Thesis item to SolrThesis and hands it to the indexing thread.
+        Returns a Deferred fired once the document is queued if the queue is full, None otherwise.
+        Without an indexing thread, e.g. outside of a crawl, the document is added right away.
+        """
+        solr_doc = make_solr_thesis(item, self._get_time())
+        if self.worker is None:
+            solr_doc.add_to_solr(self.solr_connection)
+            return None
+        
+        if len(self.waiting) == 0:
+            try:
+                self.queue.put_nowait(solr_doc)
+                return None
+            except queue.Full:
+                pass
+        # Scrapy stops scraping new responses while too many items are held back
+        queued = defer.Deferred()
+        self.waiting.append((solr_doc, queued))
+        return queued
         
     def _get_time(self):
         """
         Make a UTC date string in format 'Y-m-d H:M:S'
         """
-        style = '%Y-%m-%d %H:%M:%S'
-        return datetime.datetime.now().strftime(style)
\ No newline at end of file
+        return get_time()
\ No newline at end of file
@@ -63,15 +63,29 @@ COOKIES_ENABLED = False
 
 # Enable or disable downloader middlewares
 # See https://docs.scrapy.org/en/latest/topics/downloader-middleware.html
-#DOWNLOADER_MIDDLEWARES = {
+DOWNLOADER_MIDDLEWARES = {
 #    'UTDVN_crawler.middlewares.UtdvnCrawlerDownloaderMiddleware': 543,
-#}
+    # Runs on responses after HttpCompressionMiddleware (590), so that decompressed bodies are hashed
+    'UTDVN_crawler.middlewares.ConditionalRequestMiddleware': 560,
+}
+# Skip the theses that did not change since the previous crawl, see VNUSpider
+INCREMENTAL_CRAWL = True
+# SQLite database where the state of the fetch of each page is kept for incremental crawls
+FETCH_STATE_PATH = BASE_DIR + '/UTDVN_crawler/crawled_data/fetch_state.sqlite'
 
 # Enable or disable extensions
 # See https://docs.scrapy.org/en/latest/topics/extensions.html
-#EXTENSIONS = {
+EXTENSIONS = {
 #    'scrapy.extensions.telnet.TelnetConsole': None,
-#}
+    'UTDVN_crawler.checkpoint.CheckpointExtension': 500,
+}
+# Keeps track of the pending requests for CheckpointExtension
+SCHEDULER = 'UTDVN_crawler.checkpoint.CheckpointScheduler'
+# Directory where crawls save checkpoints to resume from when they are stopped before they finish.
+# Delete the checkpoint of a spider to start its crawl over
+CHECKPOINT_DIR = BASE_DIR + '/UTDVN_crawler/crawled_data/checkpoints'
+# Seconds between checkpoints
+CHECKPOINT_INTERVAL = 300
 
 # Configure item pipelines
 # See https://docs.scrapy.org/en/latest/topics/item-pipeline.html
@@ -80,6 +94,14 @@ ITEM_PIPELINES = {
     #'UTDVN_crawler.pipelines.JsonExporterPipeline': 600,
     'UTDVN_crawler.pipelines.SolrPipeline': 800,
 }
+# Maximum number of documents waiting for the Solr indexing thread of SolrPipeline
+# before items are held back
+SOLR_PIPELINE_QUEUE_SIZE = 1000
+# JSON lines file SolrPipeline appends the documents Solr could not index by the end of a crawl to
+SOLR_PIPELINE_FAILED_PATH = BASE_DIR + '/UTDVN_crawler/crawled_data/failed_documents.json'
+# DuplicatesPipeline only keeps the items seen across crawls for the spiders setting DEDUP_STORE_PATH, see VNUSpider
+# False positive rate of the Bloom filter checked before the seen items, or 0 to disable it
+DEDUP_BLOOM_ERROR_RATE = 0
 
 # Enable and configure the AutoThrottle extension (disabled by default)
 # See https://docs.scrapy.org/en/latest/topics/autothrottle.html
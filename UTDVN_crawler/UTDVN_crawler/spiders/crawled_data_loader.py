@@ -1,21 +1,58 @@
 # -*- coding: utf-8 -*-
 import scrapy
 from UTDVN_crawler.items import Thesis
-import json, os
+import io, json, mmap, os
 
 import logging
 
+# Number of bytes read from a memory-mapped file after which the pages read are released
+RELEASE_INTERVAL = 16 * 1024 * 1024
+
+def read_lines(path):
+    """
+    Yields the lines of the file at path one by one from a memory map.
+    Pages that were read are released as it goes, so that memory use does not grow with the size of the file.
+    """
+    with open(path, 'rb') as f:
+        # Empty files cannot be mapped
+        if os.fstat(f.fileno()).st_size == 0:
+            return
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            # madvise is only available on Python 3.8+ and Unix
+            can_release = hasattr(mm, 'madvise') and hasattr(mmap, 'MADV_DONTNEED')
+            if can_release:
+                mm.madvise(mmap.MADV_SEQUENTIAL)
+            released = 0
+            for line in iter(mm.readline, b''):
+                yield line
+                position = mm.tell()
+                if can_release and position - released >= RELEASE_INTERVAL:
+                    end = position - position % mmap.PAGESIZE
+                    mm.madvise(mmap.MADV_DONTNEED, released, end - released)
+                    released = end
+
 class CrawledDataLoader(scrapy.Spider):
     name = 'crawled_data_loader'
     
     def start_requests(self):
-        crawled_data_dir = "file:////" + os.path.dirname(os.path.dirname(os.path.abspath(__file__))) + "/crawled_data/"
-        vnu_request = scrapy.Request(url=crawled_data_dir + "vnu.json",cb_kwargs=dict(item_type='thesis'))
+        crawled_data_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__))) + "/crawled_data/"
+        # Downloading a file:// URL would read the whole dump into memory,
+        # so parse reads it from disk and the request only schedules it
+        vnu_request = scrapy.Request(
+            url="data:,",
+            cb_kwargs=dict(item_type='thesis', path=crawled_data_dir + "vnu.json"),
+            dont_filter=True)
         return [vnu_request]
     
-    def parse(self, response, item_type):
-        item_list = [json.loads(item) for item in response.text.split('\n') if item != '']
-        for item in item_list:
+    def parse(self, response, item_type, path=None):
+        """
+        Yields an item for each JSON line of the file at path, or of the response body if no path is given.
+        """
+        lines = read_lines(path) if path is not None else io.BytesIO(response.body)
+        for line in lines:
+            if line.strip() == b'':
+                continue
+            item = json.loads(line)
             if item_type == 'thesis':
                 thesis = Thesis()
             for key in item.keys():
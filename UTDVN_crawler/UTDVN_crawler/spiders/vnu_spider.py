@@ -1,13 +1,42 @@
 # -*- coding: utf-8 -*-
+import os
 import scrapy
+from UTDVN_crawler.fetch_state import FetchStateStore
 from UTDVN_crawler.items import Thesis
 
 class VNUSpider(scrapy.Spider):
+    """
+    Crawls the undergraduate theses of repository.vnu.edu.vn.
+    In incremental mode (INCREMENTAL_CRAWL setting), the state of the fetch of each thesis is kept in
+    fetch_state: theses that were fetched before are requested directly at their detail page,
+    conditionally, and those that did not change since are skipped by ConditionalRequestMiddleware.
+    The fetch states are only committed when the spider closes, once the pipelines indexed the items of
+    the fetched theses, or at checkpoints (see CheckpointExtension), so that a crawl that dies fetches
+    every thesis it did not persist again.
+    """
     name = "vnu"
     allowed_domains = ['repository.vnu.edu.vn']
     start_urls = [
         'https://repository.vnu.edu.vn/community-list',
     ]
+    custom_settings = {
+        # File where DuplicatesPipeline keeps the hashes of the items seen across crawls of this spider only,
+        # so that loading crawled data again, e.g. after clearing Solr, adds every item.
+        # Delete it to index every item again
+        'DEDUP_STORE_PATH': os.path.dirname(os.path.dirname(os.path.abspath(__file__))) + '/crawled_data/seen_items.dedup',
+    }
+    fetch_state = None
+    
+    @classmethod
+    def from_crawler(cls, crawler, *args, **kwargs):
+        spider = super(VNUSpider, cls).from_crawler(crawler, *args, **kwargs)
+        if crawler.settings.getbool('INCREMENTAL_CRAWL'):
+            spider.fetch_state = FetchStateStore(crawler.settings.get('FETCH_STATE_PATH'), commit_interval=None)
+        return spider
+    
+    def closed(self, reason):
+        if self.fetch_state is not None:
+            self.fetch_state.close()
             
     def parse(self, response):
         # follows links to member units' undergraduate theses
@@ -20,13 +49,20 @@ class VNUSpider(scrapy.Spider):
             yield scrapy.Request(response.url + '?offset=%s' % offset, callback=self.parse_member_unit_offset)
             
     def parse_member_unit_offset(self, response):
-        # follows links to thesis pages
+        # follows links to thesis pages, or to the detail pages of theses fetched by previous crawls
         for a in response.xpath('//div[re:test(@class,".*browse-titles$")]//a'):
-            yield response.follow(a, callback=self.parse_thesis)
+            detail_url = response.urljoin(a.attrib['href']) + '?mode=full'
+            if self.fetch_state is not None and detail_url in self.fetch_state:
+                yield self.thesis_metadata_request(detail_url)
+            else:
+                yield response.follow(a, callback=self.parse_thesis)
             
     def parse_thesis(self, response):
         # follows links to detail page
-        yield scrapy.Request(response.url + '?mode=full', callback=self.parse_thesis_metadata)
+        yield self.thesis_metadata_request(response.url + '?mode=full')
+        
+    def thesis_metadata_request(self, url):
+        return scrapy.Request(url, callback=self.parse_thesis_metadata, meta={'conditional': True})
 
     def parse_thesis_metadata(self, response):        
         def extract_meta(name):
@@ -1,12 +1,25 @@
+import json
 import os
+import pickle
+import subprocess
+import sys
 import scrapy
+import tempfile
 from django.test import TestCase 
 from UTDVN_crawler.spiders.vnu_spider import VNUSpider
-from UTDVN_crawler.spiders.crawled_data_loader import CrawledDataLoader
+from UTDVN_crawler.spiders.crawled_data_loader import CrawledDataLoader, read_lines
 from UTDVN_crawler import mocks
 from UTDVN_crawler.pipelines import DuplicatesPipeline, JsonExporterPipeline, SolrPipeline
+from UTDVN_crawler import bulk_loader
+from UTDVN_crawler.checkpoint import CheckpointExtension, CheckpointScheduler
+from UTDVN_crawler.dedup import BloomFilter, HashStore, hash_key
+from UTDVN_crawler.fetch_state import FetchState, FetchStateStore, content_hash
+from UTDVN_crawler.middlewares import ConditionalRequestMiddleware
 from UTDVN_crawler.items import Thesis
-from scrapy.exceptions import DropItem
+from scrapy.exceptions import DropItem, IgnoreRequest, NotConfigured
+from scrapy.http import HtmlResponse
+from scrapy.utils.test import get_crawler
+from twisted.internet import defer
 from unittest.mock import MagicMock, patch, mock_open, call
 
 class VNUSpiderTests(TestCase):
@@ -47,6 +60,115 @@ class VNUSpiderTests(TestCase):
             self.assertEqual(item['language'], 'vi')
             self.assertTrue('keywords' in item.keys())
             
+    def test_fetch_state_is_committed_when_spider_closes(self):
+        with tempfile.TemporaryDirectory() as state_dir:
+            path = os.path.join(state_dir, 'fetch_state.sqlite')
+            spider = VNUSpider.from_crawler(get_crawler(VNUSpider, {'INCREMENTAL_CRAWL': True, 'FETCH_STATE_PATH': path}))
+            for i in range(200):
+                spider.fetch_state.set('https://repository.vnu.edu.vn/handle/VNU_123/%d?mode=full' % i,
+                                       FetchState(None, None, 'hash'))
+            store = FetchStateStore(path)
+            self.assertEqual(len(store), 0)
+            spider.closed('finished')
+            self.assertEqual(len(store), 200)
+            store.close()
+            
+    def test_parse_member_unit_offset_with_fetched_theses(self):
+        with tempfile.TemporaryDirectory() as state_dir:
+            self.spider.fetch_state = FetchStateStore(os.path.join(state_dir, 'fetch_state.sqlite'))
+            self.spider.fetch_state.set('https://repository.vnu.edu.vn/handle/VNU_123/63050?mode=full',
+                                        FetchState('"1"', None, 'hash'))
+            response = mocks.mock_response('/test_data/33317.html', 'https://repository.vnu.edu.vn/handle/VNU_123/33317?offset=0')
+            requests = list(self.spider.parse_member_unit_offset(response))
+            self.spider.closed('finished')
+            
+        for request in requests:
+            if '63050' in request.url:
+                self.assertEqual(request.url, 'https://repository.vnu.edu.vn/handle/VNU_123/63050?mode=full')
+                self.assertEqual(request.callback, self.spider.parse_thesis_metadata)
+                self.assertTrue(request.meta['conditional'])
+            else:
+                self.assertRegex(request.url, '^https:\/\/repository.vnu.edu.vn\/handle\/VNU_123\/\d+$')
+            
+class FetchStateTests(TestCase):
+    def setUp(self):
+        self.state_dir = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.state_dir.name, 'fetch_state.sqlite')
+        self.store = FetchStateStore(self.path, commit_interval=2)
+        self.spider = MagicMock(fetch_state=self.store)
+        self.stats = MagicMock()
+        self.middleware = ConditionalRequestMiddleware(self.stats)
+        self.url = 'https://repository.vnu.edu.vn/handle/VNU_123/63050?mode=full'
+        
+    def tearDown(self):
+        self.store.close()
+        self.state_dir.cleanup()
+        
+    def response(self, status=200, body=b'<html></html>', headers=None):
+        return HtmlResponse(self.url, status=status, body=body, headers=headers)
+        
+    def test_store(self):
+        self.assertIsNone(self.store.get(self.url))
+        self.store.set(self.url, FetchState('"1"', None, 'hash'))
+        self.store.close()
+        
+        self.store = FetchStateStore(self.path)
+        self.assertIn(self.url, self.store)
+        self.assertEqual(self.store.get(self.url), FetchState('"1"', None, 'hash'))
+        self.assertEqual(len(self.store), 1)
+        
+    def test_process_request_without_state(self):
+        request = scrapy.Request(self.url, meta={'conditional': True})
+        
+        self.assertIsNone(self.middleware.process_request(request, self.spider))
+        self.assertNotIn('If-None-Match', request.headers)
+        self.assertNotIn('If-Modified-Since', request.headers)
+        
+    def test_process_request_with_state(self):
+        self.store.set(self.url, FetchState('"1"', 'Mon, 10 Feb 2020 18:10:00 GMT', 'hash'))
+        request = scrapy.Request(self.url, meta={'conditional': True})
+        self.middleware.process_request(request, self.spider)
+        
+        self.assertEqual(request.headers['If-None-Match'], b'"1"')
+        self.assertEqual(request.headers['If-Modified-Since'], b'Mon, 10 Feb 2020 18:10:00 GMT')
+        
+    def test_process_request_not_conditional(self):
+        self.store.set(self.url, FetchState('"1"', None, 'hash'))
+        request = scrapy.Request(self.url)
+        self.middleware.process_request(request, self.spider)
+        
+        self.assertNotIn('If-None-Match', request.headers)
+        
+    def test_process_response_records_state(self):
+        request = scrapy.Request(self.url, meta={'conditional': True})
+        response = self.response(headers={'ETag': '"1"'})
+        
+        self.assertIs(self.middleware.process_response(request, response, self.spider), response)
+        self.assertEqual(self.store.get(self.url), FetchState('"1"', None, content_hash(response.body)))
+        
+    def test_process_response_not_modified(self):
+        request = scrapy.Request(self.url, meta={'conditional': True})
+        
+        with self.assertRaises(IgnoreRequest):
+            self.middleware.process_response(request, self.response(304, b''), self.spider)
+        self.stats.inc_value.assert_called_with('fetch_state/not_modified', spider=self.spider)
+        
+    def test_process_response_unchanged(self):
+        request = scrapy.Request(self.url, meta={'conditional': True})
+        self.middleware.process_response(request, self.response(), self.spider)
+        
+        with self.assertRaises(IgnoreRequest):
+            self.middleware.process_response(request, self.response(), self.spider)
+        self.stats.inc_value.assert_called_with('fetch_state/unchanged', spider=self.spider)
+        response = self.response(body=b'<html>changed</html>')
+        self.assertIs(self.middleware.process_response(request, response, self.spider), response)
+        
+    def test_process_response_without_fetch_state(self):
+        request = scrapy.Request(self.url, meta={'conditional': True})
+        response = self.response(304, b'')
+        
+        self.assertIs(self.middleware.process_response(request, response, mocks.MockSpider('vnu')), response)
+        
 class CrawledDataLoaderTests(TestCase):
     def setUp(self):
         self.spider = CrawledDataLoader()
@@ -59,6 +181,29 @@ class CrawledDataLoaderTests(TestCase):
         response = mocks.mock_response('/test_data/test.json')
         item_list = [item for item in self.spider.parse(response, 'thesis')]
         self.assertEqual(item_list, [{'author': 'a1', 'title': 't1'}, {'author': 'a2', 'title': 't2'}])
+        
+    def test_start_requests_reads_crawled_data_from_disk(self):
+        request = self.spider.start_requests()[0]
+        self.assertEqual(request.url, 'data:,')
+        self.assertTrue(request.cb_kwargs['path'].endswith('/crawled_data/vnu.json'))
+        
+    def test_parse_with_path(self):
+        item_list = [item for item in self.spider.parse(None, 'thesis', 'UTDVN_crawler/UTDVN_crawler/test_data/test.json')]
+        self.assertEqual(item_list, [{'author': 'a1', 'title': 't1'}, {'author': 'a2', 'title': 't2'}])
+        
+    @patch('UTDVN_crawler.spiders.crawled_data_loader.RELEASE_INTERVAL', 16)
+    def test_read_lines(self):
+        lines = [('{"title": "t%d"}\n' % i).encode('utf-8') for i in range(2000)]
+        with tempfile.NamedTemporaryFile(delete=False) as f:
+            f.write(b''.join(lines) + b'{"title": "no line break"}')
+        self.addCleanup(os.remove, f.name)
+        self.assertEqual(list(read_lines(f.name)), lines + [b'{"title": "no line break"}'])
+        
+    def test_read_lines_with_empty_file(self):
+        with tempfile.NamedTemporaryFile(delete=False) as f:
+            pass
+        self.addCleanup(os.remove, f.name)
+        self.assertEqual(list(read_lines(f.name)), [])
             
 class DuplicatesPipelineTests(TestCase):
     def setUp(self):
@@ -138,6 +283,222 @@ class DuplicatesPipelineTests(TestCase):
         
         self.assertEqual(self.pipeline.process_item(different_item), different_item)
         
+    def test_close_spider_without_path(self):
+        self.pipeline.close_spider()
+        
+        self.assertEqual(DuplicatesPipeline().process_item(self.item), self.item)
+        
+    def test_process_item_seen_in_previous_crawl(self):
+        with tempfile.TemporaryDirectory() as store_dir:
+            path = os.path.join(store_dir, 'seen_items.dedup')
+            pipeline = DuplicatesPipeline(path)
+            pipeline.process_item(self.item)
+            pipeline.close_spider()
+            
+            with self.assertRaises(DropItem):
+                DuplicatesPipeline(path).process_item(self.item)
+        
+    def test_process_item_seen_in_previous_crawl_with_incremental_crawl(self):
+        spider = MagicMock()
+        with tempfile.TemporaryDirectory() as store_dir:
+            path = os.path.join(store_dir, 'seen_items.dedup')
+            pipeline = DuplicatesPipeline(path)
+            pipeline.process_item(self.item)
+            pipeline.close_spider()
+            
+            pipeline = DuplicatesPipeline(path)
+            self.assertEqual(pipeline.process_item(self.item, spider), self.item)
+            with self.assertRaises(DropItem):
+                pipeline.process_item(self.item, spider)
+        
+    def test_only_vnu_spider_keeps_seen_items_across_crawls(self):
+        crawler = get_crawler(VNUSpider)
+        self.assertTrue(crawler.settings.get('DEDUP_STORE_PATH').endswith('/crawled_data/seen_items.dedup'))
+        crawler = get_crawler(CrawledDataLoader)
+        self.assertIsNone(DuplicatesPipeline.from_crawler(crawler).ids_seen.path)
+        
+    def _crawl_pipelines(self, path, mock_solr):
+        crawler = MagicMock()
+        pipeline = DuplicatesPipeline(path, crawler=crawler)
+        solr_pipeline = SolrPipeline(mock_solr, crawler=crawler)
+        crawler.engine.scraper.itemproc.middlewares = [pipeline, solr_pipeline]
+        return pipeline, solr_pipeline
+        
+    def test_seen_items_are_saved_once_indexed(self):
+        with tempfile.TemporaryDirectory() as store_dir:
+            path = os.path.join(store_dir, 'seen_items.dedup')
+            pipeline, solr_pipeline = self._crawl_pipelines(path, MagicMock())
+            pipeline.process_item(self.item)
+            pipeline.close_spider()
+            self.assertNotIn('a_t', HashStore(path))
+            
+            solr_pipeline.close_spider()
+            self.assertIn('a_t', HashStore(path))
+        
+    def test_seen_items_are_not_saved_when_indexing_failed(self):
+        mock_solr = MagicMock()
+        mock_solr.add_queued.side_effect = ValueError('Solr is down')
+        mock_solr.drop_queued.return_value = {}
+        with tempfile.TemporaryDirectory() as store_dir:
+            path = os.path.join(store_dir, 'seen_items.dedup')
+            pipeline, solr_pipeline = self._crawl_pipelines(path, mock_solr)
+            pipeline.process_item(self.item)
+            with self.assertLogs('UTDVN_crawler.pipelines', 'WARNING'):
+                pipeline.close_spider()
+                solr_pipeline.close_spider()
+            self.assertNotIn('a_t', HashStore(path))
+        
+    def test_checkpoint(self):
+        with tempfile.TemporaryDirectory() as store_dir:
+            path = os.path.join(store_dir, 'seen_items.dedup')
+            pipeline = DuplicatesPipeline(path)
+            pipeline.process_item(self.item)
+            pipeline.checkpoint()
+            
+            self.assertIn('a_t', HashStore(path))
+        
+class HashStoreTests(TestCase):
+    def setUp(self):
+        self.store_dir = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.store_dir.name, 'store.dedup')
+        self.keys = ['Nguyễn Văn A_Luận văn %d' % i for i in range(2000)]
+        
+    def tearDown(self):
+        self.store_dir.cleanup()
+        
+    def test_hash_key(self):
+        self.assertEqual(hash_key('a_t'), hash_key('a_t'))
+        self.assertNotEqual(hash_key('a_t'), hash_key('t_a'))
+        self.assertLess(hash_key('a_t'), 2 ** 64)
+        
+    def test_add(self):
+        store = HashStore(capacity=8)
+        
+        self.assertTrue(store.add('a_t'))
+        self.assertFalse(store.add('a_t'))
+        self.assertIn('a_t', store)
+        self.assertNotIn('t_a', store)
+        self.assertEqual(len(store), 1)
+        
+    def test_add_grows_table(self):
+        store = HashStore(capacity=8)
+        for key in self.keys:
+            store.add(key)
+        
+        self.assertEqual(len(store), len(self.keys))
+        self.assertTrue(all(key in store for key in self.keys))
+        self.assertGreaterEqual(store.memory_bytes(), 8 * 2 * len(self.keys))
+        
+    def test_save_and_load(self):
+        store = HashStore(self.path)
+        for key in self.keys:
+            store.add(key)
+        store.save()
+        
+        loaded = HashStore(self.path)
+        self.assertEqual(len(loaded), len(self.keys))
+        self.assertTrue(all(key in loaded for key in self.keys))
+        self.assertNotIn('a_t', loaded)
+        self.assertTrue(loaded.add('a_t'))
+        
+    def test_load_with_invalid_file(self):
+        with open(self.path, 'wb') as f:
+            f.write(b'{}')
+        
+        with self.assertRaises(ValueError):
+            HashStore(self.path)
+        
+    def test_bloom_filter(self):
+        store = HashStore(self.path, capacity=8, bloom_error_rate=0.01)
+        for key in self.keys:
+            store.add(key)
+        store.save()
+        
+        loaded = HashStore(self.path, bloom_error_rate=0.01)
+        self.assertTrue(all(key in store for key in self.keys))
+        self.assertTrue(all(key in loaded for key in self.keys))
+        self.assertNotIn('a_t', loaded)
+        self.assertGreater(loaded.memory_bytes(), HashStore(self.path).memory_bytes())
+        
+    def test_bloom_filter_false_positive_rate(self):
+        bloom = BloomFilter(1000, 0.01)
+        for key in self.keys[:1000]:
+            bloom.add(hash_key(key))
+        
+        self.assertTrue(all(hash_key(key) in bloom for key in self.keys[:1000]))
+        false_positives = sum(1 for key in self.keys[1000:] if hash_key(key) in bloom)
+        self.assertLess(false_positives, 50)
+        
+class CheckpointTests(TestCase):
+    def setUp(self):
+        self.checkpoint_dir = tempfile.TemporaryDirectory()
+        self.crawler = get_crawler(VNUSpider, {
+            'SCHEDULER': 'UTDVN_crawler.checkpoint.CheckpointScheduler',
+            'SCHEDULER_PRIORITY_QUEUE': 'scrapy.pqueues.ScrapyPriorityQueue',
+            'CHECKPOINT_DIR': self.checkpoint_dir.name,
+        })
+        self.spider = VNUSpider.from_crawler(self.crawler)
+        
+    def tearDown(self):
+        self.checkpoint_dir.cleanup()
+        
+    def open_scheduler(self):
+        scheduler = CheckpointScheduler.from_crawler(self.crawler)
+        scheduler.open(self.spider)
+        return scheduler
+        
+    def test_get_state(self):
+        scheduler = self.open_scheduler()
+        for url in ['https://repository.vnu.edu.vn/handle/VNU_123/1', 'https://repository.vnu.edu.vn/handle/VNU_123/2']:
+            scheduler.enqueue_request(scrapy.Request(url, callback=self.spider.parse_thesis))
+        scheduler.next_request()
+        state = scheduler.get_state()
+        
+        self.assertEqual(len(state['requests']), 1)
+        self.assertEqual(len(state['seen']), 2)
+        
+    def test_restore_state(self):
+        scheduler = self.open_scheduler()
+        first = scrapy.Request('https://repository.vnu.edu.vn/handle/VNU_123/1', callback=self.spider.parse_thesis)
+        second = scrapy.Request('https://repository.vnu.edu.vn/handle/VNU_123/2', callback=self.spider.parse_thesis)
+        scheduler.enqueue_request(first)
+        scheduler.enqueue_request(second)
+        popped = scheduler.next_request()
+        state = pickle.loads(pickle.dumps(scheduler.get_state()))
+        
+        restored = self.open_scheduler()
+        restored.restore_state(state)
+        request = restored.next_request()
+        self.assertIn(request.url, [first.url, second.url])
+        self.assertNotEqual(request.url, popped.url)
+        self.assertEqual(request.callback, self.spider.parse_thesis)
+        self.assertIsNone(restored.next_request())
+        self.assertFalse(restored.enqueue_request(scrapy.Request(popped.url)))
+        
+    def test_extension_not_configured(self):
+        with self.assertRaises(NotConfigured):
+            CheckpointExtension.from_crawler(get_crawler(VNUSpider))
+        with self.assertRaises(NotConfigured):
+            CheckpointExtension.from_crawler(get_crawler(VNUSpider, {'CHECKPOINT_DIR': self.checkpoint_dir.name}))
+        
+    def test_extension_removes_checkpoint_when_finished(self):
+        extension = CheckpointExtension.from_crawler(self.crawler)
+        extension.path = os.path.join(self.checkpoint_dir.name, 'vnu.checkpoint')
+        open(extension.path, 'wb').close()
+        extension.spider_closed(self.spider, 'finished')
+        
+        self.assertFalse(os.path.exists(extension.path))
+        
+    def test_extension_saves_checkpoint_when_stopped(self):
+        extension = CheckpointExtension.from_crawler(self.crawler)
+        extension.path = os.path.join(self.checkpoint_dir.name, 'vnu.checkpoint')
+        extension.scheduler = self.open_scheduler()
+        extension.scheduler.enqueue_request(scrapy.Request('https://repository.vnu.edu.vn/community-list'))
+        extension.spider_closed(self.spider, 'shutdown')
+        
+        with open(extension.path, 'rb') as f:
+            self.assertEqual(len(pickle.load(f)['requests']), 1)
+        
 class JsonExporterPipelineTests(TestCase):
     def setUp(self):
         self.pipeline = JsonExporterPipeline()
@@ -204,7 +565,194 @@ class SolrPipelineTests(TestCase):
         self.assertEqual(doc['language'], item['language'])
         self.assertEqual(doc['keywords'], ['keyword1', 'keyword2', 'keyword3', 'keyword4'])
         
+    def _thesis(self, title):
+        item = Thesis()
+        for field in ['author', 'advisor', 'publisher', 'abstract', 'uri', 'file_url', 'language', 'keywords']:
+            item[field] = 'some ' + field
+        item['title'] = title
+        item['yearpub'] = 2020
+        return item
+        
+    def _close_spider(self):
+        """
+        Closes the spider and waits for the indexing thread to finish, without running the reactor.
+        """
+        worker = self.pipeline.worker
+        closed = self.pipeline.close_spider()
+        worker.join(5)
+        self.assertFalse(worker.is_alive())
+        return closed
+        
+    def test_open_spider(self):
+        self.pipeline.open_spider()
+        self.assertTrue(self.mock_solr.start_bulk.called)
+        self._close_spider()
+        
+    def test_process_item_indexes_on_worker(self):
+        self.pipeline.open_spider()
+        for title in ['t1', 't2', 't3']:
+            item = self._thesis(title)
+            self.assertIs(self.pipeline.process_item(item), item)
+        self._close_spider()
+        
+        self.assertEqual([c[0][1]['title'] for c in self.mock_solr.add_document.call_args_list], ['t1', 't2', 't3'])
+        self.assertTrue(self.mock_solr.finish_bulk.called)
+        
+    def test_process_item_holds_back_item_when_queue_is_full(self):
+        self.pipeline = SolrPipeline(self.mock_solr, queue_size=1)
+        # A worker that does not take anything from the queue
+        self.pipeline.worker = MagicMock()
+        first = self._thesis('t1')
+        second = self._thesis('t2')
+        self.assertIs(self.pipeline.process_item(first), first)
+        held_back = self.pipeline.process_item(second)
+        results = []
+        held_back.addCallback(results.append)
+        self.assertEqual(results, [])
+        
+        self.assertEqual(self.pipeline.queue.get().doc['title'], 't1')
+        self.pipeline._queue_waiting()
+        self.assertEqual(results, [second])
+        self.assertEqual(self.pipeline.queue.get().doc['title'], 't2')
+        
+    def test_worker_keeps_indexing_after_failure(self):
+        self.mock_solr.add_document.side_effect = [ValueError('Solr is down'), None]
+        self.pipeline.open_spider()
+        with self.assertLogs('UTDVN_crawler.pipelines', 'ERROR'):
+            self.pipeline.process_item(self._thesis('t1'))
+            self.pipeline.process_item(self._thesis('t2'))
+            self._close_spider()
+        self.assertEqual(self.pipeline.failures, 1)
+        self.assertEqual(self.mock_solr.add_document.call_count, 2)
+        
+    @patch('twisted.internet.reactor.callFromThread')
+    def test_close_spider_does_not_wait_for_worker(self, mock_call_from_thread):
+        mock_call_from_thread.side_effect = lambda f, *args: f(*args)
+        # A worker that does not take anything from the queue
+        self.pipeline.worker = MagicMock()
+        closed = self.pipeline.close_spider()
+        results = []
+        closed.addCallback(results.append)
+        self.assertFalse(self.mock_solr.finish_bulk.called)
+        
+        self.assertIsNone(self.pipeline.queue.get())
+        self.pipeline._close_worker(MagicMock(callFromThread=mock_call_from_thread))
+        self.assertEqual(results, [None])
+        self.assertTrue(self.mock_solr.finish_bulk.called)
+        self.assertTrue(self.mock_solr.optimize.called)
+        
+    def test_failed_documents_are_dumped_on_close(self):
+        with tempfile.TemporaryDirectory() as directory:
+            self.pipeline.failed_path = os.path.join(directory, 'failed.json')
+            self.mock_solr.add_queued.side_effect = ValueError('Solr is down')
+            self.mock_solr.drop_queued.return_value = {'thesis': [{'id': 'a'}, {'id': 'b'}], 'other': []}
+            with self.assertLogs('UTDVN_crawler.pipelines', 'ERROR') as logs:
+                self.pipeline.close_spider()
+            with open(self.pipeline.failed_path, encoding='utf-8') as f:
+                self.assertEqual([json.loads(line) for line in f], [{'id': 'a'}, {'id': 'b'}])
+        self.assertIn('Dumped 2 documents', logs.output[-1])
+        self.assertTrue(self.mock_solr.finish_bulk.called)
+        
+    def test_queue_overflow_is_dumped(self):
+        self.pipeline.open_spider()
+        self._close_spider()
+        listener = self.mock_solr.add_overflow_listener.call_args[0][0]
+        with tempfile.TemporaryDirectory() as directory:
+            self.pipeline.failed_path = os.path.join(directory, 'failed.json')
+            with self.assertLogs('UTDVN_crawler.pipelines', 'ERROR'):
+                listener('thesis', [{'id': 'a'}])
+            with open(self.pipeline.failed_path, encoding='utf-8') as f:
+                self.assertEqual([json.loads(line) for line in f], [{'id': 'a'}])
+        self.assertEqual(self.pipeline.failures, 1)
+        
     def test_close_spider(self):
         self.pipeline.close_spider()
         self.assertTrue(self.mock_solr.add_queued.called)
-        self.assertTrue(self.mock_solr.optimize.called)
\ No newline at end of file
+        self.assertTrue(self.mock_solr.finish_bulk.called)
+        self.assertTrue(self.mock_solr.optimize.called)
+        
+    def test_checkpoint_without_worker(self):
+        self.assertIsNone(self.pipeline.checkpoint())
+        self.assertTrue(self.mock_solr.add_queued.called)
+        
+    def test_checkpoint_flushes_queued_documents(self):
+        # A worker that does not take anything from the queue
+        self.pipeline.worker = MagicMock()
+        self.pipeline.process_item(self._thesis('t1'))
+        flushed = self.pipeline.checkpoint()
+        results = []
+        flushed.addCallback(results.append)
+        
+        self.assertEqual(self.pipeline.queue.get().doc['title'], 't1')
+        reactor = MagicMock()
+        reactor.callFromThread.side_effect = lambda f, *args: f(*args)
+        self.pipeline._flush_queued(reactor, self.pipeline.queue.get())
+        self.assertEqual(results, [None])
+        self.assertTrue(self.mock_solr.add_queued.called)
+        
+    def test_checkpoint_fails_when_documents_cannot_be_sent(self):
+        self.mock_solr.add_queued.side_effect = ValueError('Solr is down')
+        flushed = defer.Deferred()
+        errors = []
+        flushed.addErrback(errors.append)
+        reactor = MagicMock()
+        reactor.callFromThread.side_effect = lambda f, *args: f(*args)
+        with self.assertLogs('UTDVN_crawler.pipelines', 'ERROR'):
+            self.pipeline._flush_queued(reactor, flushed)
+        self.assertEqual(len(errors), 1)
+        
+class BulkLoaderTests(TestCase):
+    def _write_lines(self, lines):
+        f = tempfile.NamedTemporaryFile('w', suffix='.json', delete=False, encoding='utf-8')
+        f.write(''.join(line + '\n' for line in lines))
+        f.close()
+        self.addCleanup(os.remove, f.name)
+        return f.name
+        
+    def _thesis_line(self, title, author='Nguyễn, Văn A'):
+        return json.dumps({
+            'title': title, 'author': author, 'advisor': 'Trần, Thị B', 'yearpub': '2020', 
+            'publisher': 'tester', 'abstract': 'An example thesis.', 'uri': 'http://u.r.i', 
+            'file_url': 'http://file.url', 'language': 'vi', 'keywords': 'kw1; kw2'})
+        
+    def test_shard_ranges(self):
+        lines = ['x' * (i % 7 + 1) for i in range(50)]
+        path = self._write_lines(lines)
+        ranges = bulk_loader.shard_ranges(path, 8)
+        self.assertEqual(len(ranges), 8)
+        self.assertEqual(ranges[0][0], 0)
+        self.assertEqual(ranges[-1][1], os.path.getsize(path))
+        for (_, end), (next_start, _) in zip(ranges, ranges[1:]):
+            self.assertEqual(end, next_start)
+        
+        shard_lines = [
+            line.decode('utf-8').rstrip('\n') 
+            for (start, end) in ranges for line in bulk_loader.read_shard(path, start, end)]
+        self.assertEqual(shard_lines, lines)
+        
+    def test_import_does_not_load_views(self):
+        script = 'import sys, UTDVN_crawler.bulk_loader; print("UTDVN_database.views" in sys.modules)'
+        output = subprocess.check_output([sys.executable, '-c', script], env=os.environ.copy())
+        self.assertEqual(output.strip(), b'False')
+
+    def test_shard_ranges_with_more_shards_than_lines(self):
+        path = self._write_lines(['first line', 'second line'])
+        ranges = bulk_loader.shard_ranges(path, 16)
+        self.assertEqual(len(ranges), 2)
+        self.assertEqual([list(bulk_loader.read_shard(path, *r)) for r in ranges], [[b'first line\n'], [b'second line\n']])
+        
+    def test_load_shard(self):
+        path = self._write_lines([
+            self._thesis_line('t1'), self._thesis_line('t2'), '', self._thesis_line('t1'), 
+            'not json', self._thesis_line('t3')])
+        mock_solr = MagicMock()
+        stats = bulk_loader.load_shard(mock_solr, path, 0, os.path.getsize(path), 2, '2020-02-10 18:10:00')
+        
+        self.assertEqual(stats, {'docs': 3, 'duplicates': 1, 'errors': 1})
+        self.assertEqual(mock_solr.post_documents.call_count, 2)
+        for c in mock_solr.post_documents.call_args_list:
+            self.assertEqual(c[0][0], 'thesis')
+        docs = [doc for c in mock_solr.post_documents.call_args_list for doc in c[0][1]]
+        self.assertEqual([doc['title'] for doc in docs], ['t1', 't2', 't3'])
+        self.assertEqual(docs[0]['author'], 'Nguyễn Văn A')
+        self.assertEqual(docs[0]['updatedAt'], '2020-02-10 18:10:00')
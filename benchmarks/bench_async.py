@@ -0,0 +1,91 @@
+"""
+Compares the throughput of the sync and async search views for one worker.
+
+The sync view is called from a pool of --threads threads, like a WSGI worker with that many threads,
+while the async view is awaited --concurrency times at once on a single event loop, like an ASGI worker.
+Every core of the fake Solr answers after --latency seconds, so throughput is bounded by how many
+searches a worker can keep waiting on Solr at once.
+
+Usage:
+    python benchmarks/bench_async.py [--cores 4] [--latency 0.05] [--threads 8] [--concurrency 8,64,256]
+"""
+import argparse
+import asyncio
+import time
+from concurrent import futures
+from common import setup_django, summarize, timed, write_results
+from fake_solr import FakeSolr
+
+def run_sync(views, factory, query, requests, threads):
+    """
+    Calls the sync search view from a pool of threads and returns the summary of the run.
+    """
+    def search(_):
+        return timed(views.search, factory.get('/api/search/', {'q': query, 'rows': 10}))
+
+    start = time.perf_counter()
+    with futures.ThreadPoolExecutor(max_workers=threads) as pool:
+        results = list(pool.map(search, range(requests)))
+    elapsed = time.perf_counter() - start
+
+    for _, response in results:
+        assert response.status_code == 200, response.content
+    return summarize([latency for latency, _ in results], elapsed)
+
+async def run_async(views, factory, query, requests, concurrency):
+    """
+    Awaits the async search view with at most concurrency searches in flight
+    and returns the summary of the run.
+    """
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def search():
+        async with semaphore:
+            start = time.perf_counter()
+            response = await views.async_search(factory.get('/api/search/', {'q': query, 'rows': 10}))
+            assert response.status_code == 200, response.content
+            return time.perf_counter() - start
+
+    start = time.perf_counter()
+    latencies = await asyncio.gather(*[search() for _ in range(requests)])
+    elapsed = time.perf_counter() - start
+    await views.SOLR.aclose()
+    return summarize(latencies, elapsed)
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--cores', type=int, default=4, help='Number of cores searched by every request.')
+    parser.add_argument('--latency', type=float, default=0.05, help='Seconds the fake Solr takes per request.')
+    parser.add_argument('--requests', type=int, default=1000, help='Number of searches per run.')
+    parser.add_argument('--threads', default='8', help='Comma-separated thread counts of the sync runs.')
+    parser.add_argument('--concurrency', default='8,64,256', help='Comma-separated concurrencies of the async runs.')
+    parser.add_argument('--query', default='*', help='The "q" parameter of each search.')
+    parser.add_argument('--output', help='Write the results as JSON to this file.')
+    args = parser.parse_args()
+
+    cores = ['thesis'] + ['core%d' % i for i in range(1, args.cores)]
+    with FakeSolr(cores=cores, latency=args.latency) as solr:
+        setup_django(solr.url)
+        from django.test import RequestFactory
+        from UTDVN_database import views
+        from UTDVN_database.solr.cache import SearchCache
+
+        # Every search is identical, so the response cache would answer all but the first one
+        views.SEARCH_CACHE = SearchCache(views.SOLR, 0)
+        factory = RequestFactory()
+        results = {'cores': args.cores, 'latency_s': args.latency, 'runs': []}
+
+        for threads in [int(n) for n in args.threads.split(',')]:
+            run = run_sync(views, factory, args.query, args.requests, threads)
+            run.update({'view': 'sync', 'threads': threads})
+            results['runs'].append(run)
+
+        for concurrency in [int(n) for n in args.concurrency.split(',')]:
+            run = asyncio.run(run_async(views, factory, args.query, args.requests, concurrency))
+            run.update({'view': 'async', 'concurrency': concurrency})
+            results['runs'].append(run)
+
+    write_results(results, args.output)
+
+if __name__ == '__main__':
+    main()
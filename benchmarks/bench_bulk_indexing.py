@@ -0,0 +1,85 @@
+"""
+Measures indexing throughput of SolrThesis documents through SolrConnection.add_document.
+
+Documents are indexed with a hard commit per batch of 100 as before bulk mode ('commit'),
+then in bulk mode with soft commits per batch ('bulk-soft') and with commitWithin ('bulk'),
+both finished by a single hard commit. The fake Solr does not index anything, it only waits
+--hard-commit-cost or --soft-commit-cost seconds per commit, so the numbers show the cost of
+committing and of building and sending the update requests.
+
+Usage:
+    python benchmarks/bench_bulk_indexing.py [--docs 100000] [--hard-commit-cost 0.05]
+"""
+import argparse
+import time
+from common import write_results
+from fake_solr import FakeSolr
+
+MODES = ['commit', 'bulk-soft', 'bulk']
+
+def make_thesis(i):
+    from UTDVN_database.solr.models import SolrThesis
+    return SolrThesis(
+        id='Nguyen_Van_A_%d_Nghien_cuu_ung_thu_phoi' % i,
+        title='Nghiên cứu một số đặc điểm lâm sàng của ung thư phổi %d' % i,
+        author='Nguyễn Văn A',
+        description='Luận văn nghiên cứu đặc điểm lâm sàng, cận lâm sàng và kết quả điều trị. ' * 8,
+        updatedAt='2020-02-10 18:10:00',
+        yearpub=str(2000 + i % 20),
+        advisor='Trần Thị B',
+        publisher='H. : Trường Đại học Y Dược',
+        uri='http://repository.vnu.edu.vn/handle/VNU_123/%d' % i,
+        file_url='http://repository.vnu.edu.vn/bitstream/VNU_123/%d/1/file.pdf' % i,
+        language='vi',
+        keywords=['ung thư', 'phổi', 'lâm sàng'],
+    )
+
+def index(solr_url, mode, args):
+    """
+    Indexes args.docs documents in the given mode and returns the number of seconds it took.
+    """
+    from UTDVN_database.solr.connection import SolrConnection
+    if mode == 'commit':
+        connection = SolrConnection(solr_url, queue_threshold=100)
+    else:
+        connection = SolrConnection(
+            solr_url, queue_threshold=args.queue_threshold, queue_max_bytes=args.queue_max_bytes,
+            bulk_commit_within=args.commit_within if mode == 'bulk' else None)
+        connection.start_bulk()
+    
+    start = time.perf_counter()
+    for i in range(args.docs):
+        make_thesis(i).add_to_solr(connection)
+    connection.add_queued()
+    if mode != 'commit':
+        connection.finish_bulk()
+    return time.perf_counter() - start
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--docs', type=int, default=100000, help='Number of documents to index per mode.')
+    parser.add_argument('--modes', default=','.join(MODES), help='Comma-separated modes to benchmark.')
+    parser.add_argument('--queue-threshold', type=int, default=500, help='Documents per batch in bulk mode.')
+    parser.add_argument('--queue-max-bytes', type=int, default=5 * 1024 * 1024, help='Bytes per batch in bulk mode.')
+    parser.add_argument('--commit-within', type=int, default=10000, help='commitWithin in milliseconds in bulk mode.')
+    parser.add_argument('--hard-commit-cost', type=float, default=0.05, help='Seconds the fake Solr takes per hard commit.')
+    parser.add_argument('--soft-commit-cost', type=float, default=0.005, help='Seconds the fake Solr takes per soft commit.')
+    parser.add_argument('--output', help='Write the results as JSON to this file.')
+    args = parser.parse_args()
+
+    results = {
+        'docs': args.docs, 'hard_commit_cost_s': args.hard_commit_cost, 
+        'soft_commit_cost_s': args.soft_commit_cost, 'runs': []}
+    for mode in args.modes.split(','):
+        with FakeSolr(hard_commit_cost=args.hard_commit_cost, soft_commit_cost=args.soft_commit_cost) as solr:
+            elapsed = index(solr.url, mode, args)
+            run = dict(solr.server.update_stats)
+            run['mode'] = mode
+            run['elapsed_s'] = round(elapsed, 3)
+            run['docs_per_s'] = round(args.docs / elapsed, 1)
+            results['runs'].append(run)
+
+    write_results(results, args.output)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,134 @@
+"""
+Measures the time to reload crawled JSON lines data into Solr, through a Scrapy crawl of the file
+with the crawled_data_loader spider ('crawl') and with the bulk loader ('bulk-N' with N processes).
+
+The data are the theses of crawled_data/vnu.json repeated with distinct titles up to --docs lines.
+The fake Solr takes --solr-latency seconds per request plus --index-cost seconds per document,
+and indexes concurrent requests in parallel like Solr does. Each mode runs in its own process
+since the Twisted reactor cannot be restarted.
+
+Usage:
+    python benchmarks/bench_bulk_load.py [--docs 50000] [--processes 1,2,4]
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+from common import CRAWLER_DIR, setup_django, write_results
+from fake_solr import FakeSolr
+
+VNU_DATA = os.path.join(CRAWLER_DIR, 'UTDVN_crawler', 'crawled_data', 'vnu.json')
+
+def make_data(path, num_docs):
+    """
+    Writes num_docs theses of vnu.json to path, with a suffix making every title distinct.
+    """
+    with open(VNU_DATA, encoding='utf-8') as f:
+        theses = [json.loads(line) for line in f if line.strip()]
+    with open(path, 'w', encoding='utf-8') as f:
+        for i in range(num_docs):
+            thesis = dict(theses[i % len(theses)])
+            thesis['title'] = '%s (%d)' % (thesis['title'], i)
+            f.write(json.dumps(thesis) + '\n')
+
+def crawl(solr_url, path, args):
+    """
+    Loads the file like scripts/add-crawled-data.sh, through DuplicatesPipeline and SolrPipeline.
+    """
+    import scrapy
+    from scrapy.crawler import CrawlerProcess
+    from UTDVN_crawler.pipelines import SolrPipeline
+    from UTDVN_crawler.spiders.crawled_data_loader import CrawledDataLoader
+    from UTDVN_database.solr.connection import SolrConnection
+
+    connection = SolrConnection(solr_url)
+
+    class BenchSolrPipeline(SolrPipeline):
+        @classmethod
+        def from_crawler(cls, crawler):
+            return cls(connection)
+
+    class BenchDataLoader(CrawledDataLoader):
+        def start_requests(self):
+            return [scrapy.Request(url='data:,', cb_kwargs=dict(item_type='thesis', path=path), dont_filter=True)]
+
+        async def start(self):
+            # Scrapy 2.13+ starts crawls from start() instead of start_requests()
+            for request in self.start_requests():
+                yield request
+
+    # Referenced by its path in ITEM_PIPELINES
+    sys.modules[__name__].BenchSolrPipeline = BenchSolrPipeline
+    process = CrawlerProcess({
+        'LOG_LEVEL': 'ERROR',
+        'TELNETCONSOLE_ENABLED': False,
+        'ITEM_PIPELINES': {
+            'UTDVN_crawler.pipelines.DuplicatesPipeline': 300,
+            __name__ + '.BenchSolrPipeline': 800,
+        },
+    })
+    process.crawl(BenchDataLoader)
+    process.start()
+
+def run(mode, args):
+    """
+    Loads a generated file into a fake Solr in the given mode and returns the results.
+    """
+    # Imports the backend, which takes seconds, before timing anything
+    from UTDVN_crawler.bulk_loader import bulk_load
+    with tempfile.TemporaryDirectory() as data_dir, \
+            FakeSolr(latency=args.solr_latency, index_cost=args.index_cost) as solr:
+        path = os.path.join(data_dir, 'theses.json')
+        make_data(path, args.docs)
+        start = time.perf_counter()
+        if mode == 'crawl':
+            crawl(solr.url, path, args)
+        else:
+            bulk_load(path, solr.url, int(mode.split('-')[1]), args.batch_size)
+        elapsed = time.perf_counter() - start
+        stats = dict(solr.server.update_stats)
+
+    return {
+        'mode': mode,
+        'elapsed_s': round(elapsed, 3),
+        'docs_per_s': round(stats['docs'] / elapsed, 1),
+        'solr_docs': stats['docs'],
+        'solr_requests': stats['requests'],
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--docs', type=int, default=50000, help='Number of theses to load.')
+    parser.add_argument('--processes', default='1,2,4', help='Comma-separated numbers of bulk loader processes.')
+    parser.add_argument('--batch-size', type=int, default=1000, help='Documents per request of the bulk loader.')
+    parser.add_argument('--solr-latency', type=float, default=0.01, help='Seconds the fake Solr takes per request.')
+    parser.add_argument('--index-cost', type=float, default=0.0001, help='Seconds the fake Solr takes per document.')
+    parser.add_argument('--mode', help=argparse.SUPPRESS)
+    parser.add_argument('--output', help='Write the results as JSON to this file.')
+    args = parser.parse_args()
+
+    if args.mode:
+        setup_django('http://127.0.0.1:1/solr')
+        with open(args.output, 'w') as output:
+            json.dump(run(args.mode, args), output)
+        return
+
+    results = {
+        'docs': args.docs, 'solr_latency_s': args.solr_latency, 
+        'index_cost_s': args.index_cost, 'runs': []}
+    modes = ['crawl'] + ['bulk-' + n for n in args.processes.split(',')]
+    for mode in modes:
+        with tempfile.NamedTemporaryFile(suffix='.json') as run_output:
+            command = [sys.executable, os.path.abspath(__file__), '--mode', mode, '--output', run_output.name]
+            for option in ['docs', 'batch_size', 'solr_latency', 'index_cost']:
+                command += ['--' + option.replace('_', '-'), str(getattr(args, option))]
+            subprocess.run(command, check=True, stdout=subprocess.DEVNULL)
+            results['runs'].append(json.load(open(run_output.name)))
+
+    write_results(results, args.output)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,151 @@
+"""
+Measures crawl throughput (items/sec) of SolrPipeline when Solr is slow to answer.
+
+A spider downloads --pages local pages, each taking --page-latency seconds and yielding one thesis,
+while the fake Solr takes --solr-latency seconds per request. Items are indexed either on the
+reactor thread as before ('blocking'), which stalls every download while Solr answers, or by the
+indexing thread of SolrPipeline ('worker'). Each mode runs in its own process since the Twisted
+reactor cannot be restarted.
+
+Usage:
+    python benchmarks/bench_crawl_indexing.py [--pages 2000] [--solr-latency 0.2]
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from common import setup_django, write_results
+from fake_solr import FakeSolr
+
+MODES = ['blocking', 'worker']
+
+class PageHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_GET(self):
+        time.sleep(self.server.latency)
+        body = ('<html><body><h1>Luận văn %s</h1></body></html>' % self.path).encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/html; charset=utf-8')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+def crawl(mode, args):
+    """
+    Crawls the local pages with SolrPipeline in the given mode and returns the results.
+    """
+    import scrapy
+    from scrapy.crawler import CrawlerProcess
+    from UTDVN_crawler.items import Thesis
+    from UTDVN_crawler.pipelines import SolrPipeline
+    from UTDVN_database.solr.connection import SolrConnection
+
+    pages = ThreadingHTTPServer(('127.0.0.1', 0), PageHandler)
+    pages.daemon_threads = True
+    pages.latency = args.page_latency
+    threading.Thread(target=pages.serve_forever, daemon=True).start()
+    pages_url = 'http://127.0.0.1:%d/' % pages.server_address[1]
+
+    class PageSpider(scrapy.Spider):
+        name = 'pages'
+
+        def start_requests(self):
+            for i in range(args.pages):
+                yield scrapy.Request(pages_url + str(i))
+
+        async def start(self):
+            # Scrapy 2.13+ starts crawls from start() instead of start_requests()
+            for request in self.start_requests():
+                yield request
+
+        def parse(self, response):
+            item = Thesis()
+            for field in ['author', 'advisor', 'publisher', 'abstract', 'language', 'keywords']:
+                item[field] = 'some ' + field
+            item['title'] = response.css('h1::text').get()
+            item['yearpub'] = 2020
+            item['uri'] = response.url
+            item['file_url'] = response.url + '/file.pdf'
+            yield item
+
+    with FakeSolr(latency=args.solr_latency) as solr:
+        connection = SolrConnection(solr.url, queue_threshold=args.queue_threshold)
+
+        class BenchSolrPipeline(SolrPipeline):
+            @classmethod
+            def from_crawler(cls, crawler):
+                return cls(connection, queue_size=args.queue_size)
+
+            def open_spider(self, spider=None):
+                if mode == 'worker':
+                    return super(BenchSolrPipeline, self).open_spider(spider)
+                # Without an indexing thread, documents are added from the reactor thread
+                self.solr_connection.start_bulk()
+
+        # Referenced by its path in ITEM_PIPELINES
+        sys.modules[__name__].BenchSolrPipeline = BenchSolrPipeline
+        process = CrawlerProcess({
+            'LOG_LEVEL': 'ERROR',
+            'CONCURRENT_REQUESTS': 32,
+            'CONCURRENT_REQUESTS_PER_DOMAIN': 32,
+            'TELNETCONSOLE_ENABLED': False,
+            'ITEM_PIPELINES': {__name__ + '.BenchSolrPipeline': 800},
+        })
+        crawler = process.create_crawler(PageSpider)
+        process.crawl(crawler)
+        start = time.perf_counter()
+        process.start()
+        elapsed = time.perf_counter() - start
+        stats = dict(solr.server.update_stats)
+
+    items = crawler.stats.get_value('item_scraped_count', 0)
+    return {
+        'mode': mode,
+        'items': items,
+        'elapsed_s': round(elapsed, 3),
+        'items_per_s': round(items / elapsed, 1),
+        'solr_docs': stats['docs'],
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--pages', type=int, default=2000, help='Number of pages to crawl.')
+    parser.add_argument('--page-latency', type=float, default=0.05, help='Seconds each page takes to download.')
+    parser.add_argument('--solr-latency', type=float, default=0.2, help='Seconds the fake Solr takes per request.')
+    parser.add_argument('--queue-threshold', type=int, default=100, help='Documents per update request.')
+    parser.add_argument('--queue-size', type=int, default=1000, help='Size of the queue of the indexing thread.')
+    parser.add_argument('--modes', default=','.join(MODES), help='Comma-separated modes to benchmark.')
+    parser.add_argument('--mode', help=argparse.SUPPRESS)
+    parser.add_argument('--output', help='Write the results as JSON to this file.')
+    args = parser.parse_args()
+
+    if args.mode:
+        setup_django('http://127.0.0.1:1/solr')
+        with open(args.output, 'w') as output:
+            json.dump(crawl(args.mode, args), output)
+        return
+
+    results = {
+        'pages': args.pages, 'page_latency_s': args.page_latency, 
+        'solr_latency_s': args.solr_latency, 'runs': []}
+    for mode in args.modes.split(','):
+        with tempfile.NamedTemporaryFile(suffix='.json') as run_output:
+            command = [sys.executable, os.path.abspath(__file__), '--mode', mode, '--output', run_output.name]
+            for option in ['pages', 'page_latency', 'solr_latency', 'queue_threshold', 'queue_size']:
+                command += ['--' + option.replace('_', '-'), str(getattr(args, option))]
+            subprocess.run(command, check=True, stdout=subprocess.DEVNULL)
+            results['runs'].append(json.load(open(run_output.name)))
+
+    write_results(results, args.output)
+
+if __name__ == '__main__':
+    main()
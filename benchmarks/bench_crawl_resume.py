@@ -0,0 +1,135 @@
+"""
+Measures the work redone by a crawl that is killed and run again, with and without checkpoints.
+
+VNUSpider crawls the fixture site of bench_incremental_crawl.py in incremental mode, indexing into a
+fake Solr through DuplicatesPipeline and SolrPipeline. Its process is killed with SIGKILL once it has
+sent --kill-at of the requests of a whole crawl, then the crawl is run again until it finishes.
+'restart' runs without checkpoints, so the second run starts over from the community list;
+'checkpoint' saves a checkpoint every --interval seconds with CheckpointExtension and resumes from it.
+The requests sent, the documents sent to Solr and the theses missing from Solr are counted.
+
+Usage:
+    python benchmarks/bench_crawl_resume.py [--units 10] [--theses-per-unit 500] [--kill-at 0.6]
+"""
+import argparse
+import json
+import os
+import signal
+import subprocess
+import sys
+import tempfile
+import time
+from common import setup_django, write_results
+from fake_solr import FakeSolr
+from bench_incremental_crawl import FixtureSite
+
+MODES = ['restart', 'checkpoint']
+
+def crawl(mode, args):
+    """
+    Crawls the fixture site with VNUSpider in the given mode.
+    """
+    from scrapy.crawler import CrawlerProcess
+    from UTDVN_crawler.pipelines import SolrPipeline
+    from UTDVN_crawler.spiders.vnu_spider import VNUSpider
+    from UTDVN_database.solr.connection import SolrConnection
+
+    class FixtureSpider(VNUSpider):
+        allowed_domains = ['127.0.0.1']
+        start_urls = [args.site_url + '/community-list']
+
+    class BenchSolrPipeline(SolrPipeline):
+        @classmethod
+        def from_crawler(cls, crawler):
+            return cls(SolrConnection(args.solr_url))
+
+    # Referenced by its path in ITEM_PIPELINES
+    sys.modules[__name__].BenchSolrPipeline = BenchSolrPipeline
+    settings = {
+        'LOG_LEVEL': 'ERROR',
+        'CONCURRENT_REQUESTS': 32,
+        'CONCURRENT_REQUESTS_PER_DOMAIN': 32,
+        'TELNETCONSOLE_ENABLED': False,
+        'DOWNLOADER_MIDDLEWARES': {'UTDVN_crawler.middlewares.ConditionalRequestMiddleware': 560},
+        'ITEM_PIPELINES': {
+            'UTDVN_crawler.pipelines.DuplicatesPipeline': 300,
+            __name__ + '.BenchSolrPipeline': 800,
+        },
+        'INCREMENTAL_CRAWL': True,
+        'FETCH_STATE_PATH': os.path.join(args.state_dir, 'fetch_state.sqlite'),
+        'DEDUP_STORE_PATH': os.path.join(args.state_dir, 'seen_items.dedup'),
+    }
+    if mode == 'checkpoint':
+        settings.update({
+            'EXTENSIONS': {'UTDVN_crawler.checkpoint.CheckpointExtension': 500},
+            'SCHEDULER': 'UTDVN_crawler.checkpoint.CheckpointScheduler',
+            'CHECKPOINT_DIR': os.path.join(args.state_dir, 'checkpoints'),
+            'CHECKPOINT_INTERVAL': args.interval,
+        })
+    process = CrawlerProcess(settings)
+    process.crawl(FixtureSpider)
+    process.start()
+
+def run(mode, args):
+    """
+    Runs a crawl that is killed, then a crawl that finishes, and returns the work done by each.
+    """
+    with FixtureSite(args.units, args.theses_per_unit, args.per_page, latency=args.latency) as site, \
+            FakeSolr() as solr, tempfile.TemporaryDirectory() as state_dir:
+        command = [sys.executable, os.path.abspath(__file__), '--mode', mode, '--site-url', site.url,
+                   '--solr-url', solr.url, '--state-dir', state_dir, '--interval', str(args.interval)]
+        theses = args.units * args.theses_per_unit
+        pages = 1 + args.units + args.units * -(-args.theses_per_unit // args.per_page) + 2 * theses
+        result = {'mode': mode, 'theses': theses, 'runs': []}
+        for killed in [True, False]:
+            start = time.perf_counter()
+            process = subprocess.Popen(command, stdout=subprocess.DEVNULL)
+            while killed and process.poll() is None:
+                if sum(site.server.requests.values()) >= pages * args.kill_at:
+                    process.send_signal(signal.SIGKILL)
+                    break
+                time.sleep(0.05)
+            process.wait()
+            with solr.server.stats_lock:
+                docs = solr.server.update_stats['docs']
+                solr.server.update_stats['docs'] = 0
+            result['runs'].append({
+                'killed': killed,
+                'elapsed_s': round(time.perf_counter() - start, 3),
+                'requests': sum(site.take_requests().values()),
+                'solr_docs': docs,
+            })
+        result['requests'] = sum(crawl_run['requests'] for crawl_run in result['runs'])
+        result['solr_docs'] = sum(crawl_run['solr_docs'] for crawl_run in result['runs'])
+        result['missing_theses'] = theses - len(solr.server.updated_ids)
+    return result
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--units', type=int, default=10, help='Number of member units.')
+    parser.add_argument('--theses-per-unit', type=int, default=500)
+    parser.add_argument('--per-page', type=int, default=20, help='Number of theses per offset page.')
+    parser.add_argument('--latency', type=float, default=0.01, help='Seconds the site takes per request.')
+    parser.add_argument('--kill-at', type=float, default=0.6, help='Fraction of the requests after which the first run is killed.')
+    parser.add_argument('--interval', type=float, default=5, help='Seconds between checkpoints.')
+    parser.add_argument('--modes', default=','.join(MODES), help='Comma-separated modes to benchmark.')
+    parser.add_argument('--mode', help=argparse.SUPPRESS)
+    parser.add_argument('--site-url', help=argparse.SUPPRESS)
+    parser.add_argument('--solr-url', help=argparse.SUPPRESS)
+    parser.add_argument('--state-dir', help=argparse.SUPPRESS)
+    parser.add_argument('--output', help='Write the results as JSON to this file.')
+    args = parser.parse_args()
+
+    if args.mode:
+        setup_django(args.solr_url)
+        crawl(args.mode, args)
+        return
+
+    results = {'kill_at': args.kill_at, 'interval_s': args.interval, 'runs': []}
+    for mode in args.modes.split(','):
+        results['runs'].append(run(mode, args))
+
+    write_results(results, args.output)
+
+if __name__ == '__main__':
+    main()
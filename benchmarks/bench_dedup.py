@@ -0,0 +1,110 @@
+"""
+Measures the memory footprint and lookup rate of the stores of seen items of DuplicatesPipeline.
+
+'set' keeps the author + '_' + title strings in a set, like DuplicatesPipeline used to.
+'hash' keeps their 64-bit hashes in a HashStore, and 'hash-bloom' puts a Bloom filter in front of it.
+Keys are made from the theses of crawled_data/vnu.json with distinct titles. Lookups are measured
+for keys that were added (as in a recrawl) and for new keys. The HashStores are also saved and loaded.
+
+Usage:
+    python benchmarks/bench_dedup.py [--keys 1000000] [--bloom-error-rate 0.01]
+"""
+import argparse
+import json
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+from common import CRAWLER_DIR, write_results
+from UTDVN_crawler.dedup import HashStore
+
+VNU_DATA = os.path.join(CRAWLER_DIR, 'UTDVN_crawler', 'crawled_data', 'vnu.json')
+
+def make_keys(count, offset=0):
+    """
+    Returns count distinct keys made from the authors and titles of vnu.json.
+    """
+    with open(VNU_DATA, encoding='utf-8') as f:
+        theses = [json.loads(line) for line in f if line.strip()]
+    return ['%s_%s (%d)' % (theses[i % len(theses)]['author'], theses[i % len(theses)]['title'], i)
+            for i in range(offset, offset + count)]
+
+def rate(count, elapsed):
+    return round(count / elapsed, 1)
+
+def run(mode, keys, new_keys, bloom_error_rate, store_dir):
+    """
+    Adds keys to a store of the given mode, then looks up keys and new_keys.
+    Returns the memory taken by the store and the rates of each operation.
+    """
+    tracemalloc.start()
+    start = time.perf_counter()
+    if mode == 'set':
+        store = set()
+        for key in keys:
+            store.add(key)
+    else:
+        store = HashStore(os.path.join(store_dir, mode + '.dedup'),
+                          bloom_error_rate=bloom_error_rate if mode == 'hash-bloom' else None)
+        for key in keys:
+            store.add(key)
+    add_elapsed = time.perf_counter() - start
+    memory = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    if mode == 'set':
+        # The keys were made before tracing, but the set keeps them alive
+        memory += sum(sys.getsizeof(key) for key in keys)
+
+    start = time.perf_counter()
+    hits = sum(1 for key in keys if key in store)
+    hit_elapsed = time.perf_counter() - start
+    start = time.perf_counter()
+    false_hits = sum(1 for key in new_keys if key in store)
+    miss_elapsed = time.perf_counter() - start
+
+    result = {
+        'mode': mode,
+        'keys': len(store),
+        'memory_mib': round(memory / 1024.0 / 1024.0, 1),
+        'bytes_per_key': round(memory / len(keys), 1),
+        'adds_per_s': rate(len(keys), add_elapsed),
+        'hit_lookups_per_s': rate(len(keys), hit_elapsed),
+        'miss_lookups_per_s': rate(len(new_keys), miss_elapsed),
+        'hits': hits,
+        'false_hits': false_hits,
+    }
+    if mode != 'set':
+        save_elapsed = time.perf_counter()
+        store.save()
+        save_elapsed = time.perf_counter() - save_elapsed
+        start = time.perf_counter()
+        loaded = HashStore(store.path, bloom_error_rate=store.bloom_error_rate)
+        load_elapsed = time.perf_counter() - start
+        assert len(loaded) == len(store)
+        result.update({
+            'file_mib': round(os.path.getsize(store.path) / 1024.0 / 1024.0, 1),
+            'save_s': round(save_elapsed, 3),
+            'load_s': round(load_elapsed, 3),
+        })
+    return result
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--keys', type=int, default=1000000, help='Number of keys added to each store.')
+    parser.add_argument('--lookups', type=int, default=200000, help='Number of new keys looked up.')
+    parser.add_argument('--bloom-error-rate', type=float, default=0.01)
+    parser.add_argument('--output', help='Write the results as JSON to this file.')
+    args = parser.parse_args()
+
+    keys = make_keys(args.keys)
+    new_keys = make_keys(args.lookups, offset=args.keys)
+    results = {'keys': args.keys, 'lookups': args.lookups, 'runs': []}
+    with tempfile.TemporaryDirectory() as store_dir:
+        for mode in ['set', 'hash', 'hash-bloom']:
+            results['runs'].append(run(mode, keys, new_keys, args.bloom_error_rate, store_dir))
+
+    write_results(results, args.output)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,68 @@
+"""
+Measures the time to page through a whole core with /api/search, using start/rows or a cursor.
+
+The fake Solr waits --collect-cost seconds per document it has to collect and sort, like Solr does for
+the first start + rows matches of a page, so paging with start gets slower with every page while
+paging with a cursor, which only collects rows matches, does not.
+
+Usage:
+    python benchmarks/bench_deep_paging.py [--docs 20000] [--rows 100] [--collect-cost 0.000002]
+"""
+import argparse
+import json
+from common import setup_django, summarize, timed, write_results
+from fake_solr import FakeSolr
+
+def page_with_start(views, factory, args):
+    latencies = []
+    for start in range(0, args.docs, args.rows):
+        request = factory.get('/api/search/', {'types': 'thesis', 'q': '*', 'start': start, 'rows': args.rows})
+        elapsed, response = timed(views.search, request)
+        assert response.status_code == 200, response.content
+        latencies.append(elapsed)
+    return latencies
+
+def page_with_cursor(views, factory, args):
+    latencies = []
+    cursor = '*'
+    while True:
+        request = factory.get('/api/search/', {'types': 'thesis', 'q': '*', 'cursor': cursor, 'rows': args.rows})
+        elapsed, response = timed(views.search, request)
+        assert response.status_code == 200, response.content
+        next_cursor = json.loads(response.content)['nextCursor']
+        if next_cursor == cursor:
+            break
+        latencies.append(elapsed)
+        cursor = next_cursor
+    return latencies
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--docs', type=int, default=20000, help='Number of documents in the core.')
+    parser.add_argument('--rows', type=int, default=100, help='Number of documents per page.')
+    parser.add_argument('--collect-cost', type=float, default=0.000002, help='Seconds the fake Solr takes per collected document.')
+    parser.add_argument('--output', help='Write the results as JSON to this file.')
+    args = parser.parse_args()
+
+    with FakeSolr(num_docs=args.docs, collect_cost=args.collect_cost) as solr:
+        setup_django(solr.url)
+        from django.test import RequestFactory
+        from UTDVN_database import views
+        from UTDVN_database.solr.cache import SearchCache
+
+        # Every page is requested once, caching would only add the cost of storing it
+        views.SEARCH_CACHE = SearchCache(views.SOLR, 0)
+        factory = RequestFactory()
+        results = {'docs': args.docs, 'rows': args.rows, 'collect_cost_s': args.collect_cost, 'runs': []}
+        for mode, page in [('start', page_with_start), ('cursor', page_with_cursor)]:
+            latencies = page(views, factory, args)
+            run = summarize(latencies)
+            run['mode'] = mode
+            run['total_s'] = round(sum(latencies), 3)
+            run['last_page_ms'] = round(latencies[-1] * 1000, 3)
+            results['runs'].append(run)
+
+    write_results(results, args.output)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,51 @@
+"""
+Measures the time to fetch the documents of a results page from /api/document.
+
+A page of --page documents is fetched either with one request per id (as the frontend does with 'id')
+or with a single batch request ('ids'). Every core of the fake Solr answers after --latency seconds.
+
+Usage:
+    python benchmarks/bench_documents.py [--cores 4] [--page 10] [--latency 0.02]
+"""
+import argparse
+from common import setup_django, summarize, timed, write_results
+from fake_solr import FakeSolr, make_thesis
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--cores', type=int, default=4, help='Number of cores looked up by every request.')
+    parser.add_argument('--page', type=int, default=10, help='Number of documents per page.')
+    parser.add_argument('--latency', type=float, default=0.02, help='Seconds the fake Solr takes per request.')
+    parser.add_argument('--pages', type=int, default=50, help='Number of pages fetched per mode.')
+    parser.add_argument('--output', help='Write the results as JSON to this file.')
+    args = parser.parse_args()
+
+    cores = ['thesis'] + ['core%d' % i for i in range(1, args.cores)]
+    with FakeSolr(cores=cores, latency=args.latency) as solr:
+        setup_django(solr.url)
+        from django.test import RequestFactory
+        from UTDVN_database import views
+
+        factory = RequestFactory()
+        ids = [make_thesis(i)['id'] for i in range(args.page)]
+        results = {'cores': args.cores, 'page': args.page, 'latency_s': args.latency, 'runs': []}
+
+        def fetch_one_by_one():
+            for doc_id in ids:
+                response = views.document(factory.get('/api/document/', {'id': doc_id}))
+                assert response.status_code == 200, response.content
+
+        def fetch_batch():
+            response = views.document(factory.get('/api/document/', {'ids': ','.join(ids)}))
+            assert response.status_code == 200, response.content
+
+        for mode, fetch in [('id', fetch_one_by_one), ('ids', fetch_batch)]:
+            latencies = [timed(fetch)[0] for _ in range(args.pages)]
+            run = summarize(latencies)
+            run['mode'] = mode
+            results['runs'].append(run)
+
+    write_results(results, args.output)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,232 @@
+"""
+Microbenchmarks of the functions run by every search request, from parsing its parameters to flattening its documents.
+
+Times builder.build_cores, builder.build_return_fields and its memoized version in SchemaRegistry (with the schema
+of fake_solr), builder.build_search_query on English, Vietnamese,
+single-term and '*' queries in both query modes, Query._sanitize with its memo filled, Query.sanitize_str
+(what a memo miss costs), Query._escape_special_chars, and builder.flatten_doc and builder.flatten_docs
+(with the plan SchemaRegistry compiles from the schema of fake_solr) on small, medium and large thesis documents.
+No Solr is needed.
+
+Each case is called --number times per round (by default, enough times for a round to take --min-time seconds),
+and the time per call of --repeat rounds is reported in microseconds. The minimum is the most stable figure
+to compare between commits. A case that fails, e.g. when the NLTK data is not downloaded, reports its error.
+
+Results are written as JSON along with the commit they were measured at. Given the results of another commit
+with --compare, the change of each case is reported, and the exit status is 1 if a case is slower than
+--max-regression times its time in those results.
+
+Usage:
+    python benchmarks/bench_hot_path.py [--output results.json] [--compare baseline.json] [--filter flatten_doc]
+"""
+import argparse
+import datetime
+import json
+import platform
+import subprocess
+import sys
+import time
+from common import BASE_DIR, percentile, write_results
+from fake_solr import make_schema, make_thesis
+
+QUERIES = {
+    'en': 'a study of English teaching methods for high school students',
+    'vi': 'nghiên cứu đặc điểm lâm sàng của ung thư phổi',
+    'term': 'ung-thư',
+    'star': '*',
+}
+
+# Queries with the special characters escaped from single-term queries
+ESCAPE_QUERIES = {
+    'plain': 'Nguyen_Van_A_2019_Nghien_cuu_ung_thu_phoi',
+    'special': 'C++ (lập trình): "hướng đối tượng" [2019] ~ a/b?',
+}
+
+def make_doc(size, i=0):
+    """
+    Returns a thesis document as returned by Solr: 'small' with a short abstract, 'medium' like
+    fake_solr.make_thesis, or 'large' with a long abstract, several authors and many keywords.
+    """
+    doc = make_thesis(i)
+    if size == 'small':
+        doc['description'] = ['Luận văn nghiên cứu đặc điểm lâm sàng.']
+        doc['keywords'] = ['ung thư']
+    elif size == 'large':
+        doc['description'] = ['Luận văn nghiên cứu đặc điểm lâm sàng, cận lâm sàng và kết quả điều trị. ' * 80]
+        doc['author'] = ['Nguyễn Văn A', 'Trần Thị B', 'Lê Văn C']
+        doc['keywords'] = ['từ khóa %d' % k for k in range(30)]
+    return doc
+
+class SchemaConnection(object):
+    """
+    Stands in for the SolrConnection of a SchemaRegistry, serving the schema of fake_solr.
+    """
+
+    def fetch_schema(self, core_name):
+        return make_schema()
+
+    def add_change_listener(self, listener):
+        pass
+
+def make_cases(builder, solr_query):
+    """
+    Returns the cases to time as (name, function, setup) tuples.
+    setup(n) returns the arguments of n calls of function, so that their preparation is not timed.
+    """
+    from UTDVN_database.solr.schema import SchemaRegistry
+    registry = SchemaRegistry(SchemaConnection(), 300, 1024, 256)
+    registry.load('thesis')
+
+    no_setup = lambda n: [()] * n
+    cores = ['thesis', 'test']
+    cases = [
+        ('build_cores[all]', lambda: builder.build_cores('', cores), no_setup),
+        ('build_cores[thesis]', lambda: builder.build_cores('thesis', cores), no_setup),
+        ('build_return_fields[default]', lambda: builder.build_return_fields('', ['thesis']), no_setup),
+        ('build_return_fields[title,author]', lambda: builder.build_return_fields('title,author', ['thesis']), no_setup),
+        ('SchemaRegistry.build_return_fields[default]', lambda: registry.build_return_fields('', ['thesis']), no_setup),
+        ('SchemaRegistry.build_return_fields[title,author]',
+         lambda: registry.build_return_fields('title,author', ['thesis']), no_setup),
+    ]
+    for mode in ['standard', 'edismax']:
+        for (lang, query) in QUERIES.items():
+            cases.append(('build_search_query[%s,%s]' % (mode, lang),
+                          lambda query=query, mode=mode: builder.build_search_query(
+                              'thesis', query, {'sort': 'title asc'}, mode=mode),
+                          no_setup))
+
+    for lang in ['en', 'vi']:
+        query = QUERIES[lang]
+        queries = lambda n, query=query: [(solr_query.Query(query, as_phrase=False),) for _ in range(n)]
+        cases.append(('Query._sanitize[%s,cached]' % lang, lambda q: q._sanitize(), queries))
+        cases.append(('Query.sanitize_str[%s]' % lang, lambda query=query: solr_query.Query.sanitize_str(query), no_setup))
+    for (name, query) in ESCAPE_QUERIES.items():
+        queries = lambda n, query=query: [(solr_query.Query(query, as_phrase=False),) for _ in range(n)]
+        cases.append(('Query._escape_special_chars[%s]' % name, lambda q: q._escape_special_chars(), queries))
+
+    return_fields = builder.build_return_fields('', ['thesis'])
+    for size in ['small', 'medium', 'large']:
+        doc = make_doc(size)
+        # flatten_doc replaces the fields of the document, so each call gets its own copy
+        docs = lambda n, doc=doc: [(dict(doc),) for _ in range(n)]
+        cases.append(('flatten_doc[%s]' % size, lambda d: builder.flatten_doc(d, return_fields, ['keywords']), docs))
+
+    plan = registry.flatten_plan('thesis', return_fields)
+    for size in ['small', 'medium', 'large']:
+        doc = make_doc(size)
+        pages = lambda n, doc=doc: [([dict(doc)],) for _ in range(n)]
+        cases.append(('flatten_docs[%s]' % size, lambda page: builder.flatten_docs(page, plan), pages))
+    return cases
+
+def time_round(function, setup, number):
+    """
+    Returns the seconds taken by number calls of function.
+    """
+    args_list = setup(number)
+    start = time.perf_counter()
+    for args in args_list:
+        function(*args)
+    return time.perf_counter() - start
+
+def calibrate(function, setup, min_time):
+    """
+    Returns a number of calls of function that takes at least min_time seconds.
+    """
+    number = 1
+    while True:
+        if time_round(function, setup, number) >= min_time or number >= 10 ** 7:
+            return number
+        number *= 10
+
+def run_case(name, function, setup, args):
+    """
+    Times a case and returns its result.
+    """
+    result = {'name': name}
+    try:
+        # The first call fills the memos and loads the models the case relies on
+        function(*setup(1)[0])
+        number = args.number or calibrate(function, setup, args.min_time)
+        times = [time_round(function, setup, number) / number for _ in range(args.repeat)]
+    except Exception as e:
+        # The first line of the message that is not a frame of asterisks, like the ones of NLTK LookupErrors
+        lines = [line.strip() for line in str(e).split('\n') if line.strip('* ')]
+        result['error'] = '%s: %s' % (type(e).__name__, lines[0] if lines else '')
+        return result
+    result.update({
+        'number': number,
+        'repeat': args.repeat,
+        'min_us': round(min(times) * 1e6, 3),
+        'median_us': round(percentile(times, 50) * 1e6, 3),
+        'max_us': round(max(times) * 1e6, 3),
+        'ops_per_s': round(1 / min(times), 1),
+    })
+    return result
+
+def git_commit():
+    """
+    Returns the commit of the working tree, suffixed with '-dirty' if it has uncommitted changes, or None.
+    """
+    try:
+        commit = subprocess.check_output(['git', 'rev-parse', 'HEAD'], cwd=BASE_DIR, stderr=subprocess.DEVNULL)
+        status = subprocess.check_output(['git', 'status', '--porcelain', '--untracked-files=no'], cwd=BASE_DIR)
+    except (OSError, subprocess.CalledProcessError):
+        return None
+    return commit.decode().strip() + ('-dirty' if status.strip() else '')
+
+def compare(results, baseline, max_regression):
+    """
+    Returns the ratio of the minimum time of each case to the one in baseline, and the names of the
+    cases slower than max_regression times their baseline.
+    """
+    baseline_cases = {case['name']: case for case in baseline['cases'] if 'min_us' in case}
+    ratios = {}
+    for case in results['cases']:
+        if 'min_us' in case and case['name'] in baseline_cases:
+            ratios[case['name']] = round(case['min_us'] / baseline_cases[case['name']]['min_us'], 3)
+    regressions = [name for (name, ratio) in ratios.items() if ratio > max_regression]
+    return ratios, regressions
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--repeat', type=int, default=7, help='Number of rounds of each case.')
+    parser.add_argument('--number', type=int, help='Number of calls per round. Calibrated with --min-time by default.')
+    parser.add_argument('--min-time', type=float, default=0.05, help='Minimum seconds of a calibrated round.')
+    parser.add_argument('--filter', help='Only run the cases whose name contains this string.')
+    parser.add_argument('--compare', help='Results of a previous run to compare with.')
+    parser.add_argument('--max-regression', type=float, default=1.25,
+                        help='Ratio to the compared time above which a case is reported as a regression.')
+    parser.add_argument('--output', help='Write the results as JSON to this file.')
+    args = parser.parse_args()
+
+    # Django is not set up, so the query models are not warmed up in the background while cases are timed
+    from UTDVN_database.solr import builder, query as solr_query
+
+    results = {
+        'commit': git_commit(),
+        'date': datetime.datetime.now(datetime.timezone.utc).isoformat(timespec='seconds'),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'cases': [],
+    }
+    for (name, function, setup) in make_cases(builder, solr_query):
+        if args.filter is None or args.filter in name:
+            results['cases'].append(run_case(name, function, setup, args))
+
+    regressions = []
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        ratios, regressions = compare(results, baseline, args.max_regression)
+        results['comparison'] = {
+            'baseline_commit': baseline.get('commit'),
+            'ratios': ratios,
+            'regressions': regressions,
+        }
+
+    write_results(results, args.output)
+    if regressions:
+        sys.exit(1)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,224 @@
+"""
+Counts the requests VNUSpider sends to recrawl a site, with and without incremental mode.
+
+A local fixture site is laid out like repository.vnu.edu.vn: a community list linking to --units
+member units, whose offset pages list --theses-per-unit theses of --per-page theses each, with a
+thesis page and a detail page ('?mode=full') per thesis. Detail pages send an ETag and a
+Last-Modified header and answer conditional requests, unless --no-validators is given, in which
+case unchanged pages can only be recognized by the hash of their body.
+
+Each mode crawls the site three times: a first crawl, a recrawl with no change, and a recrawl after
+--changed of the theses were revised. 'full' crawls like VNUSpider used to, 'incremental' keeps the
+fetch state between crawls. Each crawl runs in its own process since the Twisted reactor cannot be restarted.
+
+Usage:
+    python benchmarks/bench_incremental_crawl.py [--units 20] [--theses-per-unit 500] [--changed 0.05]
+"""
+import argparse
+import collections
+import email.utils
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse, parse_qs
+from common import write_results
+
+MODES = ['full', 'incremental']
+
+# Id of the first member unit, the theses have ids after the member units
+FIRST_UNIT = 33000
+
+class FixtureSiteHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_GET(self):
+        server = self.server
+        url = urlparse(self.path)
+        params = parse_qs(url.query)
+        time.sleep(server.latency)
+        if url.path == '/community-list':
+            return self._send('community-list', ''.join(
+                '<h4 class="media-heading"><a href="/handle/VNU_123/%d">Unit %d - Undergraduate Theses</a></h4>' % (unit, unit)
+                for unit in server.units))
+        handle = int(url.path.rsplit('/', 1)[-1])
+        if handle in server.units:
+            if 'offset' not in params:
+                return self._send('member-unit', ''.join(
+                    '<a name="%d" id="offset" href="#"></a>' % offset
+                    for offset in range(0, len(server.units[handle]), server.per_page)))
+            offset = int(params['offset'][0])
+            return self._send('offset', '<div class="ds-static-div browse-titles">%s</div>' % ''.join(
+                '<a href="/handle/VNU_123/%d">Luận văn %d</a>' % (thesis, thesis)
+                for thesis in server.units[handle][offset:offset + server.per_page]))
+        if params.get('mode') != ['full']:
+            return self._send('thesis', '<h1>Luận văn %d</h1>' % handle)
+
+        revision = server.revisions[handle]
+        etag = '"%d-%d"' % (handle, revision)
+        last_modified = email.utils.formatdate(1500000000 + revision * 86400, usegmt=True)
+        if server.validators and (self.headers.get('If-None-Match') == etag
+                                  or self.headers.get('If-Modified-Since') == last_modified):
+            return self._send('detail', None, 304)
+        meta = {
+            'DC.title': 'Nghiên cứu một số đặc điểm lâm sàng %d' % handle,
+            'DC.creator': 'Nguyễn Văn %d' % handle,
+            'DC.contributor': 'Trần Thị B',
+            'citation_date': '2019',
+            'DC.publisher': 'ĐHQGHN',
+            'DCTERMS.abstract': 'Tóm tắt, bản sửa đổi %d' % revision,
+            'DC.identifier': 'http://repository.vnu.edu.vn/handle/VNU_123/%d' % handle,
+            'citation_pdf_url': 'http://repository.vnu.edu.vn/bitstream/VNU_123/%d/1/file.pdf' % handle,
+            'DC.language': 'vi',
+            'citation_keywords': 'lâm sàng; ung thư',
+        }
+        headers = {'ETag': etag, 'Last-Modified': last_modified} if server.validators else {}
+        return self._send('detail', ''.join(
+            '<meta name="%s" content="%s">' % (name, content) for (name, content) in meta.items()), 200, headers)
+
+    def _send(self, kind, content, status=200, headers=None):
+        with self.server.stats_lock:
+            self.server.requests[kind if status == 200 else '%s-%d' % (kind, status)] += 1
+        body = ('<html><body>%s</body></html>' % content).encode('utf-8') if content is not None else b''
+        self.send_response(status)
+        for (name, value) in (headers or {}).items():
+            self.send_header(name, value)
+        if status == 200:
+            self.send_header('Content-Type', 'text/html; charset=utf-8')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+class FixtureSite(object):
+    """
+    Serves the fixture site from a background thread, counting the requests by kind of page.
+    """
+
+    def __init__(self, units, theses_per_unit, per_page, validators=True, latency=0.0):
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), FixtureSiteHandler)
+        self.server.daemon_threads = True
+        self.server.units = {
+            FIRST_UNIT + unit: list(range(FIRST_UNIT + units + unit * theses_per_unit,
+                                          FIRST_UNIT + units + (unit + 1) * theses_per_unit))
+            for unit in range(units)}
+        self.server.revisions = {thesis: 0 for theses in self.server.units.values() for thesis in theses}
+        self.server.per_page = per_page
+        self.server.validators = validators
+        self.server.latency = latency
+        self.server.stats_lock = threading.Lock()
+        self.server.requests = collections.Counter()
+        self.url = 'http://127.0.0.1:%d' % self.server.server_address[1]
+
+    def revise(self, fraction):
+        """
+        Revises every thesis in 1 / fraction and returns the number of revised theses.
+        """
+        step = max(int(round(1 / fraction)), 1) if fraction > 0 else 0
+        theses = sorted(self.server.revisions)[::step] if step else []
+        for thesis in theses:
+            self.server.revisions[thesis] += 1
+        return len(theses)
+
+    def take_requests(self):
+        """
+        Returns the requests counted since the last call.
+        """
+        with self.server.stats_lock:
+            requests = dict(self.server.requests)
+            self.server.requests.clear()
+        return requests
+
+    def __enter__(self):
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.server.shutdown()
+        self.server.server_close()
+
+def crawl(mode, site_url, state_path):
+    """
+    Crawls the fixture site with VNUSpider in the given mode and returns the number of items and the time taken.
+    """
+    from scrapy.crawler import CrawlerProcess
+    from UTDVN_crawler.spiders.vnu_spider import VNUSpider
+
+    class FixtureSpider(VNUSpider):
+        allowed_domains = ['127.0.0.1']
+        start_urls = [site_url + '/community-list']
+
+    process = CrawlerProcess({
+        'LOG_LEVEL': 'ERROR',
+        'CONCURRENT_REQUESTS': 32,
+        'CONCURRENT_REQUESTS_PER_DOMAIN': 32,
+        'TELNETCONSOLE_ENABLED': False,
+        'DOWNLOADER_MIDDLEWARES': {'UTDVN_crawler.middlewares.ConditionalRequestMiddleware': 560},
+        'INCREMENTAL_CRAWL': mode == 'incremental',
+        'FETCH_STATE_PATH': state_path,
+    })
+    crawler = process.create_crawler(FixtureSpider)
+    process.crawl(crawler)
+    start = time.perf_counter()
+    process.start()
+    elapsed = time.perf_counter() - start
+    return {
+        'items': crawler.stats.get_value('item_scraped_count', 0),
+        'elapsed_s': round(elapsed, 3),
+        'not_modified': crawler.stats.get_value('fetch_state/not_modified', 0),
+        'unchanged': crawler.stats.get_value('fetch_state/unchanged', 0),
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--units', type=int, default=20, help='Number of member units.')
+    parser.add_argument('--theses-per-unit', type=int, default=500)
+    parser.add_argument('--per-page', type=int, default=20, help='Number of theses per offset page.')
+    parser.add_argument('--changed', type=float, default=0.05, help='Fraction of the theses revised before the last crawl.')
+    parser.add_argument('--latency', type=float, default=0.0, help='Seconds the site takes per request.')
+    parser.add_argument('--no-validators', action='store_true', help='Do not send ETag and Last-Modified headers.')
+    parser.add_argument('--modes', default=','.join(MODES), help='Comma-separated modes to benchmark.')
+    parser.add_argument('--mode', help=argparse.SUPPRESS)
+    parser.add_argument('--site-url', help=argparse.SUPPRESS)
+    parser.add_argument('--state', help=argparse.SUPPRESS)
+    parser.add_argument('--output', help='Write the results as JSON to this file.')
+    args = parser.parse_args()
+
+    if args.mode:
+        with open(args.output, 'w') as output:
+            json.dump(crawl(args.mode, args.site_url, args.state), output)
+        return
+
+    results = {
+        'units': args.units, 'theses': args.units * args.theses_per_unit,
+        'validators': not args.no_validators, 'runs': []}
+    for mode in args.modes.split(','):
+        with FixtureSite(args.units, args.theses_per_unit, args.per_page, not args.no_validators, args.latency) as site, \
+                tempfile.TemporaryDirectory() as state_dir:
+            for crawl_name in ['first', 'unchanged', 'changed']:
+                revised = site.revise(args.changed) if crawl_name == 'changed' else 0
+                with tempfile.NamedTemporaryFile(suffix='.json') as run_output:
+                    command = [sys.executable, os.path.abspath(__file__), '--mode', mode, '--site-url', site.url,
+                               '--state', os.path.join(state_dir, 'fetch_state.sqlite'), '--output', run_output.name]
+                    subprocess.run(command, check=True)
+                    result = json.load(open(run_output.name))
+                requests = site.take_requests()
+                result.update({
+                    'mode': mode,
+                    'crawl': crawl_name,
+                    'revised': revised,
+                    'requests': sum(requests.values()),
+                    'requests_by_page': requests,
+                })
+                results['runs'].append(result)
+
+    write_results(results, args.output)
+
+if __name__ == '__main__':
+    main()
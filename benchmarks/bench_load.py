@@ -0,0 +1,126 @@
+"""
+Load test of /api/search and /api/document against a local fake Solr.
+
+The fake Solr serves canned theses from --cores cores, answering after --latency seconds, and fails
+a fraction --error-rate of its searches and document lookups with an --error-status error.
+Requests go through the URL routing and middleware of the Django project, from --concurrency threads
+that each send their next request as soon as the previous one is answered, for --duration seconds
+per endpoint and concurrency. Searches cycle through --queries, document requests through the ids
+of the canned theses. The search cache is disabled unless --cache is given, since it would answer
+every repeated search.
+
+For each endpoint and concurrency, reports the number of requests per second, the p50, p95 and p99
+latencies and the number of responses by status.
+
+Usage:
+    python benchmarks/bench_load.py [--endpoints search,document] [--concurrency 1,8,32] [--duration 10]
+                                    [--cores 4] [--latency 0.02] [--error-rate 0.01]
+"""
+import argparse
+import collections
+import itertools
+import threading
+import time
+from common import setup_django, summarize, write_results
+from fake_solr import FakeSolr, make_thesis
+
+ENDPOINTS = ['search', 'document']
+
+QUERIES = ['*', 'phổi', 'ung thư phổi', 'nghiên cứu đặc điểm lâm sàng', 'luận văn thạc sĩ kinh tế']
+
+def make_requests(endpoint, args):
+    """
+    Returns an endless iterator of the (path, parameters) of the requests to send to an endpoint.
+    """
+    if endpoint == 'search':
+        return itertools.cycle(('/api/search/', {'q': query, 'rows': 10}) for query in args.queries.split(','))
+    ids = [make_thesis(i)['id'] for i in range(args.docs)]
+    return itertools.cycle(('/api/document/', {'id': doc_id}) for doc_id in ids)
+
+def run(endpoint, concurrency, args):
+    """
+    Sends requests to an endpoint from concurrency threads for args.duration seconds and returns the summary of the run.
+    """
+    from django.test import Client
+
+    requests = make_requests(endpoint, args)
+    requests_lock = threading.Lock()
+    results_lock = threading.Lock()
+    latencies = []
+    statuses = collections.Counter()
+    start = time.perf_counter()
+    warm_up_end = start + args.warm_up
+    end = warm_up_end + args.duration
+
+    def worker():
+        client = Client(HTTP_HOST='localhost')
+        while True:
+            with requests_lock:
+                (path, params) = next(requests)
+            request_start = time.perf_counter()
+            if request_start >= end:
+                return
+            response = client.get(path, params)
+            request_end = time.perf_counter()
+            # Requests sent during the warm-up are not counted
+            if request_start >= warm_up_end and request_end <= end:
+                with results_lock:
+                    latencies.append(request_end - request_start)
+                    statuses[response.status_code] += 1
+
+    threads = [threading.Thread(target=worker) for _ in range(concurrency)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    run = {'endpoint': endpoint, 'concurrency': concurrency}
+    if latencies:
+        run.update(summarize(latencies, args.duration))
+    run['statuses'] = {str(status): count for (status, count) in sorted(statuses.items())}
+    run['errors'] = sum(count for (status, count) in statuses.items() if status >= 400)
+    return run
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--endpoints', default=','.join(ENDPOINTS), help='Comma-separated endpoints to load.')
+    parser.add_argument('--concurrency', default='1,8,32', help='Comma-separated numbers of concurrent clients.')
+    parser.add_argument('--duration', type=float, default=10, help='Seconds each endpoint is loaded for per concurrency.')
+    parser.add_argument('--warm-up', type=float, default=1, help='Seconds of requests not counted before each run.')
+    parser.add_argument('--cores', type=int, default=4, help='Number of cores of the fake Solr.')
+    parser.add_argument('--docs', type=int, default=1000, help='Number of documents in every core.')
+    parser.add_argument('--latency', type=float, default=0.02, help='Seconds the fake Solr takes per request.')
+    parser.add_argument('--error-rate', type=float, default=0.0, help='Fraction of Solr requests that fail.')
+    parser.add_argument('--error-status', type=int, default=500, help='HTTP status of the failed Solr requests.')
+    parser.add_argument('--queries', default=','.join(QUERIES), help='Comma-separated queries of the searches.')
+    parser.add_argument('--cache', action='store_true', help='Keep the search cache enabled.')
+    parser.add_argument('--output', help='Write the results as JSON to this file.')
+    args = parser.parse_args()
+
+    cores = ['thesis'] + ['core%d' % i for i in range(1, args.cores)]
+    with FakeSolr(cores=cores, latency=args.latency, num_docs=args.docs,
+                  error_rate=args.error_rate, error_status=args.error_status) as solr:
+        setup_django(solr.url)
+        from UTDVN_database import views
+        from UTDVN_database.solr.cache import SearchCache
+
+        if not args.cache:
+            views.SEARCH_CACHE = SearchCache(views.SOLR, 0)
+
+        results = {
+            'cores': args.cores,
+            'latency_s': args.latency,
+            'error_rate': args.error_rate,
+            'duration_s': args.duration,
+            'cache': args.cache,
+            'runs': [],
+        }
+        for endpoint in args.endpoints.split(','):
+            for concurrency in [int(n) for n in args.concurrency.split(',')]:
+                results['runs'].append(run(endpoint, concurrency, args))
+        results['solr_injected_errors'] = solr.server.injected_errors
+
+    write_results(results, args.output)
+
+if __name__ == '__main__':
+    main()
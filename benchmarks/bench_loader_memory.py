@@ -0,0 +1,117 @@
+"""
+Measures peak memory and throughput of CrawledDataLoader.parse as the crawled data dump grows.
+
+Dumps of each --sizes-mb are generated from the theses of crawled_data/vnu.json with distinct titles.
+'stream' parses a dump with CrawledDataLoader.parse reading it line by line from a memory map.
+'split' parses it like the loader used to, from the text of a response holding the whole dump,
+and is only run up to --split-max-mb since it needs several times the size of the dump in memory.
+Each run is a separate process so that its peak resident memory can be read.
+
+Usage:
+    python benchmarks/bench_loader_memory.py [--sizes-mb 256,2048] [--split-max-mb 512]
+"""
+import argparse
+import json
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+from common import CRAWLER_DIR, write_results
+
+VNU_DATA = os.path.join(CRAWLER_DIR, 'UTDVN_crawler', 'crawled_data', 'vnu.json')
+
+def make_dump(path, size_mb):
+    """
+    Writes theses of vnu.json to path until it holds size_mb MiB, and returns the number of theses.
+    """
+    with open(VNU_DATA, encoding='utf-8') as f:
+        theses = [json.loads(line) for line in f if line.strip()]
+    target = size_mb * 1024 * 1024
+    size = 0
+    count = 0
+    with open(path, 'w', encoding='utf-8') as f:
+        while size < target:
+            thesis = dict(theses[count % len(theses)])
+            thesis['title'] = '%s (%d)' % (thesis['title'], count)
+            line = json.dumps(thesis) + '\n'
+            f.write(line)
+            size += len(line)
+            count += 1
+    return count
+
+def split_parse(response):
+    """
+    The former CrawledDataLoader.parse, which decodes and parses the whole dump before yielding.
+    """
+    from UTDVN_crawler.items import Thesis
+    item_list = [json.loads(item) for item in response.text.split('\n') if item != '']
+    for item in item_list:
+        thesis = Thesis()
+        for key in item.keys():
+            thesis[key] = item[key]
+        yield thesis
+
+def run(mode, path):
+    """
+    Parses the dump at path in the given mode and returns the number of items, the seconds taken
+    and the peak resident memory in MiB, from before the dump is read.
+    """
+    from scrapy.http import Request, TextResponse
+    from UTDVN_crawler.spiders.crawled_data_loader import CrawledDataLoader
+
+    baseline_mib = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024.0
+    start = time.perf_counter()
+    if mode == 'stream':
+        items = CrawledDataLoader().parse(None, 'thesis', path)
+    else:
+        # What Scrapy hands to the callback after downloading a file:// URL
+        with open(path, 'rb') as f:
+            response = TextResponse(url='file://' + path, request=Request('file://' + path), body=f.read(), encoding='utf-8')
+        items = split_parse(response)
+    count = sum(1 for _ in items)
+    elapsed = time.perf_counter() - start
+    return {
+        'items': count,
+        'elapsed_s': round(elapsed, 3),
+        'items_per_s': round(count / elapsed, 1),
+        'baseline_rss_mib': round(baseline_mib, 1),
+        'peak_rss_mib': round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024.0, 1),
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--sizes-mb', default='256,2048', help='Comma-separated sizes of the dumps in MiB.')
+    parser.add_argument('--split-max-mb', type=int, default=512, help='Largest dump to parse in split mode.')
+    parser.add_argument('--mode', help=argparse.SUPPRESS)
+    parser.add_argument('--dump', help=argparse.SUPPRESS)
+    parser.add_argument('--output', help='Write the results as JSON to this file.')
+    args = parser.parse_args()
+
+    if args.mode:
+        with open(args.output, 'w') as output:
+            json.dump(run(args.mode, args.dump), output)
+        return
+
+    results = {'runs': []}
+    with tempfile.TemporaryDirectory() as dump_dir:
+        for size_mb in [int(size) for size in args.sizes_mb.split(',')]:
+            dump = os.path.join(dump_dir, 'vnu-%d.json' % size_mb)
+            make_dump(dump, size_mb)
+            modes = ['stream'] + (['split'] if size_mb <= args.split_max_mb else [])
+            for mode in modes:
+                with tempfile.NamedTemporaryFile(suffix='.json') as run_output:
+                    command = [sys.executable, os.path.abspath(__file__), '--mode', mode, 
+                               '--dump', dump, '--output', run_output.name]
+                    subprocess.run(command, check=True)
+                    result = json.load(open(run_output.name))
+                result['mode'] = mode
+                result['size_mb'] = size_mb
+                results['runs'].append(result)
+            os.remove(dump)
+
+    write_results(results, args.output)
+
+if __name__ == '__main__':
+    main()
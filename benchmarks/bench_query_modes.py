@@ -0,0 +1,103 @@
+"""
+Compares the 'standard' and 'edismax' search query modes of builder.build_search_query.
+
+For every query of a corpus of Vietnamese and English searches, measures the time Python takes to build
+the query, with the sanitization memo cleared (cold) and filled (warm).
+Given --solr-url, also runs every query against the 'thesis' core of that Solr and reports the QTime
+(milliseconds Solr spent parsing and running the query) from the response header.
+
+Usage:
+    python benchmarks/bench_query_modes.py [--solr-url http://localhost:8983/solr] [--lang vi,en]
+"""
+import argparse
+import time
+from common import setup_django, percentile, write_results
+
+QUERIES = {
+    'vi': [
+        'ung thư phổi',
+        'nghiên cứu đặc điểm lâm sàng',
+        'luận văn thạc sĩ kinh tế',
+        'quản lý giáo dục ở trường trung học phổ thông',
+        'ứng dụng học máy trong y tế',
+        'biến đổi khí hậu đồng bằng sông Cửu Long',
+        'pháp luật về hợp đồng lao động',
+        'định lượng flurbiprofen trong dược phẩm',
+        'Nguyễn Văn A',
+        'kế toán',
+        'vật lý',
+        '2019',
+    ],
+    'en': [
+        'lung cancer',
+        'machine learning in healthcare',
+        'the effects of climate change on the Mekong delta',
+        'a study of English teaching methods for high school students',
+        'labor law',
+        'economics',
+        '2019',
+    ],
+}
+
+def build_times(builder, solr_query, queries, mode, repeat, warm):
+    """
+    Returns the times in seconds taken to build each query in the given mode.
+    """
+    times = []
+    for query in queries:
+        for _ in range(repeat):
+            if not warm:
+                solr_query.SANITIZE_CACHE.clear()
+            start = time.perf_counter()
+            builder.build_search_query('thesis', query, {'sort': ''}, mode=mode)
+            times.append(time.perf_counter() - start)
+    return times
+
+def qtimes(builder, solr, queries, mode, repeat):
+    """
+    Returns the QTimes in milliseconds reported by Solr for each query in the given mode.
+    """
+    times = []
+    for query in queries:
+        new_query, kwargs = builder.build_search_query('thesis', query, {'sort': ''}, mode=mode)
+        for _ in range(repeat):
+            response = solr.query('thesis', new_query, omit_header=False, rows=10, **kwargs)
+            times.append(response['responseHeader']['QTime'])
+    return times
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--solr-url', help='Solr to measure QTimes against. QTimes are skipped without it.')
+    parser.add_argument('--lang', default='vi,en', help='Comma-separated languages of the corpus to use.')
+    parser.add_argument('--repeat', type=int, default=20, help='Number of times each query is built or run.')
+    parser.add_argument('--output', help='Write the results as JSON to this file.')
+    args = parser.parse_args()
+
+    setup_django(args.solr_url or 'http://localhost:8983/solr')
+    from UTDVN_database.solr import builder, query as solr_query
+    queries = [query for lang in args.lang.split(',') for query in QUERIES[lang]]
+
+    if args.solr_url:
+        from UTDVN_database.solr.connection import SolrConnection
+        solr = SolrConnection(args.solr_url)
+
+    results = {'queries': len(queries), 'runs': []}
+    for mode in ['standard', 'edismax']:
+        lengths = [len(builder.build_search_query('thesis', query, {'sort': ''}, mode=mode)[0]) for query in queries]
+        run = {'mode': mode, 'query_length_max': max(lengths)}
+        for warm in [False, True]:
+            times = build_times(builder, solr_query, queries, mode, args.repeat, warm)
+            name = 'build_warm' if warm else 'build_cold'
+            run[name + '_p50_us'] = round(percentile(times, 50) * 1e6, 1)
+            run[name + '_p95_us'] = round(percentile(times, 95) * 1e6, 1)
+
+        if args.solr_url:
+            times = qtimes(builder, solr, queries, mode, args.repeat)
+            run['qtime_p50_ms'] = percentile(times, 50)
+            run['qtime_p95_ms'] = percentile(times, 95)
+        results['runs'].append(run)
+
+    write_results(results, args.output)
+
+if __name__ == '__main__':
+    main()
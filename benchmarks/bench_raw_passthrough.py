@@ -0,0 +1,109 @@
+"""
+Compares the CPU time /api/search spends per request with and without raw=true.
+
+Without raw, the Solr response of every core is decoded, its documents flattened and the whole response
+re-encoded. With raw=true, the Solr bodies are copied into the response as they are.
+The fake Solr serving --cores cores runs in a separate process, so that the CPU time of this process
+(user and system, from time.process_time) is that of the backend alone, including the Django test client.
+Every search asks for --rows rows of every core, with the search cache disabled.
+
+Reports, for each number of rows and mode, the CPU milliseconds per request, the p50 and p95 latencies
+and the size of the response.
+
+Usage:
+    python benchmarks/bench_raw_passthrough.py [--rows 10,100,1000] [--requests 200] [--cores 4]
+"""
+import argparse
+import os
+import socket
+import subprocess
+import sys
+import time
+import requests
+from common import setup_django, summarize, write_results
+
+MODES = ['decoded', 'raw']
+
+def start_fake_solr(args):
+    """
+    Starts the fake Solr in a child process and returns (process, url) once it answers.
+    """
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        port = s.getsockname()[1]
+    process = subprocess.Popen(
+        [sys.executable, os.path.join(os.path.dirname(os.path.abspath(__file__)), 'fake_solr.py'),
+         '--port', str(port), '--cores', ','.join(['thesis'] + ['core%d' % i for i in range(1, args.cores)]),
+         '--docs', str(max(args.rows.split(','), key=int))],
+        stdout=subprocess.DEVNULL)
+    url = 'http://127.0.0.1:%d/solr' % port
+    deadline = time.monotonic() + 30
+    while True:
+        try:
+            requests.get(url + '/admin/cores', timeout=1)
+            return process, url
+        except requests.exceptions.ConnectionError:
+            if time.monotonic() > deadline:
+                process.kill()
+                raise
+            time.sleep(0.1)
+
+def run(client, rows, mode, args):
+    """
+    Sends args.requests searches of rows rows in the given mode and returns their CPU time and latencies.
+    """
+    params = {'q': '*', 'rows': rows}
+    if mode == 'raw':
+        params['raw'] = 'true'
+    for _ in range(args.warm_up):
+        client.get('/api/search/', params)
+
+    latencies = []
+    cpu_start = time.process_time()
+    start = time.perf_counter()
+    for _ in range(args.requests):
+        request_start = time.perf_counter()
+        response = client.get('/api/search/', params)
+        latencies.append(time.perf_counter() - request_start)
+        assert response.status_code == 200, response.content[:200]
+    cpu = time.process_time() - cpu_start
+    elapsed = time.perf_counter() - start
+
+    run = {'rows': rows, 'mode': mode}
+    run.update(summarize(latencies, elapsed))
+    run['cpu_ms_per_request'] = round(cpu / args.requests * 1000, 3)
+    run['response_bytes'] = len(response.content)
+    return run
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--rows', default='10,100,1000', help='Comma-separated numbers of rows per core.')
+    parser.add_argument('--requests', type=int, default=200, help='Number of measured searches per run.')
+    parser.add_argument('--warm-up', type=int, default=10, help='Number of searches not measured before each run.')
+    parser.add_argument('--cores', type=int, default=4, help='Number of cores of the fake Solr.')
+    parser.add_argument('--output', help='Write the results as JSON to this file.')
+    args = parser.parse_args()
+
+    process, url = start_fake_solr(args)
+    try:
+        setup_django(url)
+        from django.test import Client
+        from UTDVN_database import views
+        from UTDVN_database.solr.cache import SearchCache
+
+        views.SEARCH_CACHE = SearchCache(views.SOLR, 0)
+        client = Client(HTTP_HOST='localhost')
+        results = {'cores': args.cores, 'requests': args.requests, 'runs': []}
+        for rows in [int(n) for n in args.rows.split(',')]:
+            runs = {mode: run(client, rows, mode, args) for mode in MODES}
+            runs['raw']['cpu_ratio'] = round(
+                runs['raw']['cpu_ms_per_request'] / runs['decoded']['cpu_ms_per_request'], 3)
+            results['runs'].extend(runs[mode] for mode in MODES)
+    finally:
+        process.kill()
+        process.wait()
+
+    write_results(results, args.output)
+
+if __name__ == '__main__':
+    main()
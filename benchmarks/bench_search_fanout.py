@@ -0,0 +1,59 @@
+"""
+Measures /api/search latency as the number of Solr cores grows.
+
+Every core of the fake Solr answers after --latency seconds, so a search over all cores
+should take about one round trip when cores are queried concurrently and one round trip
+per core when they are queried one after another (--sequential).
+
+Usage:
+    python benchmarks/bench_search_fanout.py [--cores 1,4,16] [--latency 0.02] [--sequential]
+"""
+import argparse
+from concurrent import futures
+from common import setup_django, summarize, timed, write_results
+from fake_solr import FakeSolr
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--cores', default='1,4,16', help='Comma-separated numbers of cores to benchmark.')
+    parser.add_argument('--latency', type=float, default=0.02, help='Seconds the fake Solr takes per request.')
+    parser.add_argument('--requests', type=int, default=200, help='Number of searches per core count.')
+    parser.add_argument('--query', default='*', help='The "q" parameter of each search.')
+    parser.add_argument('--sequential', action='store_true', help='Query cores one after another.')
+    parser.add_argument('--output', help='Write the results as JSON to this file.')
+    args = parser.parse_args()
+
+    with FakeSolr(latency=args.latency) as solr:
+        setup_django(solr.url)
+        from django.test import RequestFactory
+        from UTDVN_database import views
+        from UTDVN_database.solr.cache import SearchCache
+        from UTDVN_database.solr.connection import SolrConnection
+        from UTDVN_backend.settings import HAYSTACK_CONNECTIONS
+
+        if args.sequential:
+            views.EXECUTOR = futures.ThreadPoolExecutor(max_workers=1)
+
+        factory = RequestFactory()
+        results = {'latency_s': args.latency, 'sequential': args.sequential, 'runs': []}
+        for num_cores in [int(n) for n in args.cores.split(',')]:
+            solr.server.cores = ['thesis'] + ['core%d' % i for i in range(1, num_cores)]
+            views.SOLR = SolrConnection.from_config(HAYSTACK_CONNECTIONS['default'])
+            # Every search is identical, so the response cache would answer all but the first one
+            views.SEARCH_CACHE = SearchCache(views.SOLR, 0)
+
+            latencies = []
+            for _ in range(args.requests):
+                request = factory.get('/api/search/', {'q': args.query, 'rows': 10})
+                elapsed, response = timed(views.search, request)
+                assert response.status_code == 200, response.content
+                latencies.append(elapsed)
+
+            run = summarize(latencies)
+            run['cores'] = num_cores
+            results['runs'].append(run)
+
+    write_results(results, args.output)
+
+if __name__ == '__main__':
+    main()
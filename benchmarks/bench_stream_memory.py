@@ -0,0 +1,83 @@
+"""
+Measures the peak Python memory of a search as the number of rows grows, with and without stream=true.
+
+The fake Solr runs in a separate process so that only the memory allocated by the backend is traced.
+Streamed responses are consumed piece by piece, as the server would write them to the client.
+
+Usage:
+    python benchmarks/bench_stream_memory.py [--rows 100,1000,10000]
+"""
+import argparse
+import subprocess
+import sys
+import time
+import tracemalloc
+import requests
+from common import setup_django, write_results
+
+def start_fake_solr(port, num_docs):
+    """
+    Starts the fake Solr in a subprocess and waits until it answers.
+    """
+    process = subprocess.Popen(
+        [sys.executable, 'fake_solr.py', '--port', str(port), '--docs', str(num_docs)],
+        cwd=sys.path[0], stdout=subprocess.DEVNULL)
+    url = 'http://127.0.0.1:%d/solr' % port
+    for _ in range(100):
+        try:
+            requests.get(url + '/admin/cores')
+            return process, url
+        except requests.exceptions.ConnectionError:
+            time.sleep(0.1)
+    process.kill()
+    raise RuntimeError('The fake Solr did not start')
+
+def peak_memory(views, factory, params):
+    """
+    Returns the peak traced memory in bytes of a search with the given parameters.
+    """
+    tracemalloc.start()
+    response = views.search(factory.get('/api/search/', params))
+    assert response.status_code == 200, response.content
+    if response.streaming:
+        for _ in response.streaming_content:
+            pass
+    else:
+        len(response.content)
+    del response
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return peak
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--rows', default='100,1000,10000', help='Comma-separated numbers of rows to request.')
+    parser.add_argument('--port', type=int, default=18984, help='Port of the fake Solr.')
+    parser.add_argument('--output', help='Write the results as JSON to this file.')
+    args = parser.parse_args()
+    rows_list = [int(n) for n in args.rows.split(',')]
+
+    process, url = start_fake_solr(args.port, max(rows_list))
+    try:
+        setup_django(url)
+        from django.test import RequestFactory
+        from UTDVN_database import views
+        from UTDVN_database.solr.cache import SearchCache
+
+        views.SEARCH_CACHE = SearchCache(views.SOLR, 0)
+        factory = RequestFactory()
+        results = {'runs': []}
+        for rows in rows_list:
+            for stream in [False, True]:
+                params = {'q': '*', 'rows': rows}
+                if stream:
+                    params['stream'] = 'true'
+                peak = peak_memory(views, factory, params)
+                results['runs'].append({'rows': rows, 'stream': stream, 'peak_kib': round(peak / 1024)})
+    finally:
+        process.kill()
+
+    write_results(results, args.output)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,66 @@
+"""
+Helpers shared by the benchmarks.
+"""
+import json
+import os
+import sys
+import time
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+BACKEND_DIR = os.path.join(BASE_DIR, 'UTDVN_backend')
+CRAWLER_DIR = os.path.join(BASE_DIR, 'UTDVN_crawler')
+
+# Include path to modules in UTDVN_backend and UTDVN_crawler so they can be imported
+sys.path.append(BACKEND_DIR)
+sys.path.append(CRAWLER_DIR)
+
+def setup_django(solr_url):
+    """
+    Configures Django to use the given Solr url.
+    Must be called before anything from UTDVN_database.views is imported.
+    """
+    os.environ['SOLR_URL'] = solr_url
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'UTDVN_backend.settings')
+    import django
+    django.setup()
+
+def percentile(values, p):
+    """
+    Returns the p-th percentile (0 < p <= 100) of values using the nearest-rank method.
+    """
+    ordered = sorted(values)
+    rank = max(1, int(round(p / 100.0 * len(ordered))))
+    return ordered[rank - 1]
+
+def summarize(latencies, elapsed=None):
+    """
+    Summarizes latencies given in seconds as milliseconds,
+    plus the number of requests per second if the total elapsed time is given.
+    """
+    summary = {
+        'count': len(latencies),
+        'p50_ms': round(percentile(latencies, 50) * 1000, 3),
+        'p95_ms': round(percentile(latencies, 95) * 1000, 3),
+        'p99_ms': round(percentile(latencies, 99) * 1000, 3),
+    }
+    if elapsed:
+        summary['rps'] = round(len(latencies) / elapsed, 1)
+    return summary
+
+def timed(func, *args, **kwargs):
+    """
+    Calls func and returns (seconds taken, result).
+    """
+    start = time.perf_counter()
+    result = func(*args, **kwargs)
+    return (time.perf_counter() - start, result)
+
+def write_results(results, output=None):
+    """
+    Prints results and writes them as JSON to the output path if given.
+    """
+    text = json.dumps(results, indent=2, ensure_ascii=False)
+    print(text)
+    if output:
+        with open(output, 'w') as f:
+            f.write(text + '\n')
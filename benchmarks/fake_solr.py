@@ -0,0 +1,256 @@
+"""
+A local stand-in for Solr used by the benchmarks.
+
+It serves canned thesis documents and their schema from the same endpoints the backend talks to,
+with a configurable latency per request, so that benchmarks can be run without a real Solr.
+A fraction of the searches, document lookups and schema requests can be answered with an error
+to see how the backend behaves when Solr fails.
+A cost per collected document can be added to mimic Solr sorting the first start + rows matches
+of a page, or only rows matches when paging with a cursor.
+Updates are counted and the ids of their documents recorded, but not indexed. A cost per updated
+document can be added to mimic Solr indexing it, and hard and soft commits can be given a cost to mimic Solr flushing segments and
+opening a new searcher.
+
+Run standalone with:
+    python benchmarks/fake_solr.py --port 8983 --cores thesis --latency 0.02
+"""
+import argparse
+import json
+import random
+import re
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse, parse_qs
+
+def make_thesis(i):
+    """
+    Returns a thesis document shaped like the ones returned by our schemaless Solr cores,
+    where every field but 'id' is multi-valued.
+    """
+    return {
+        'id': 'Nguyen_Van_A_%d_Nghien_cuu_ung_thu_phoi' % i,
+        'type': ['thesis'],
+        'title': ['Nghiên cứu một số đặc điểm lâm sàng của ung thư phổi %d' % i],
+        'author': ['Nguyễn Văn A'],
+        'description': ['Luận văn nghiên cứu đặc điểm lâm sàng, cận lâm sàng và kết quả điều trị. ' * 8],
+        'updatedAt': ['2020-02-10 18:10:00'],
+        'yearpub': [2000 + i % 20],
+        'advisor': ['Trần Thị B'],
+        'publisher': ['H. : Trường Đại học Y Dược'],
+        'uri': ['http://repository.vnu.edu.vn/handle/VNU_123/%d' % i],
+        'file_url': ['http://repository.vnu.edu.vn/bitstream/VNU_123/%d/1/file.pdf' % i],
+        'language': ['vi'],
+        'keywords': ['ung thư', 'phổi', 'lâm sàng'],
+    }
+
+def make_schema():
+    """
+    Returns the schema of the cores holding documents made by make_thesis, as returned by Solr's schema API.
+    Fields added by a schemaless core are multi-valued, except for the unique key.
+    """
+    types = {'id': 'string', 'yearpub': 'plongs'}
+    fields = [{'name': '_version_', 'type': 'plong', 'indexed': False, 'stored': False}]
+    for name in make_thesis(0):
+        field = {'name': name, 'type': types.get(name, 'text_general')}
+        if name == 'id':
+            field.update({'multiValued': False, 'indexed': True, 'required': True, 'stored': True})
+        fields.append(field)
+    return {
+        'name': 'default-config',
+        'version': 1.6,
+        'uniqueKey': 'id',
+        'fieldTypes': [
+            {'name': 'string', 'class': 'solr.StrField', 'sortMissingLast': True},
+            {'name': 'strings', 'class': 'solr.StrField', 'sortMissingLast': True, 'multiValued': True},
+            {'name': 'plong', 'class': 'solr.LongPointField', 'docValues': True},
+            {'name': 'plongs', 'class': 'solr.LongPointField', 'docValues': True, 'multiValued': True},
+            {'name': 'text_general', 'class': 'solr.TextField', 'multiValued': True, 'positionIncrementGap': '100'},
+        ],
+        'fields': fields,
+        'dynamicFields': [{'name': '*_str', 'type': 'strings', 'docValues': True, 'indexed': False, 'stored': False}],
+        'copyFields': [{'source': name, 'dest': name + '_str', 'maxChars': 256}
+                       for name in make_thesis(0) if name not in ['id', 'yearpub']],
+    }
+
+class FakeSolrHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    # Headers and body are written separately, which would otherwise stall keep-alive clients
+    disable_nagle_algorithm = True
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        params = parse_qs(url.query)
+        parts = [part for part in url.path.split('/') if part]
+        time.sleep(self.server.latency)
+
+        if parts[1:3] == ['admin', 'cores']:
+            status = {core: {'name': core, 'index': {'version': self.server.index_version}} for core in self.server.cores}
+            return self._send({'status': status})
+
+        if len(parts) == 3 and parts[1] in self.server.cores and parts[2] in ['select', 'get', 'schema']:
+            if self.server.inject_error():
+                return self._send({'error': {'msg': 'Injected error', 'code': self.server.error_status}},
+                                  self.server.error_status)
+            if parts[2] == 'select':
+                return self._select(params)
+            if parts[2] == 'get':
+                return self._get(params)
+            return self._send({'responseHeader': {'status': 0, 'QTime': 1}, 'schema': make_schema()})
+
+        self._send({'error': {'msg': 'Not found: ' + url.path, 'code': 404}}, 404)
+
+    def do_POST(self):
+        url = urlparse(self.path)
+        params = parse_qs(url.query)
+        parts = [part for part in url.path.split('/') if part]
+        body = self.rfile.read(int(self.headers.get('Content-Length', 0)))
+        time.sleep(self.server.latency)
+
+        if len(parts) == 3 and parts[1] in self.server.cores and parts[2] == 'update':
+            return self._update(params, body)
+
+        self._send({'error': {'msg': 'Not found: ' + url.path, 'code': 404}}, 404)
+
+    def _update(self, params, body):
+        # pysolr posts XML messages and SolrConnection.post_documents JSON, with commits requested as URL parameters
+        stats = self.server.update_stats
+        if params.get('commit', ['false'])[0] == 'true':
+            time.sleep(self.server.hard_commit_cost)
+            commit = 'hard_commits'
+        elif params.get('softCommit', ['false'])[0] == 'true':
+            time.sleep(self.server.soft_commit_cost)
+            commit = 'soft_commits'
+        else:
+            commit = None
+        if self.headers.get('Content-Type', '').startswith('application/json'):
+            ids = [doc['id'] for doc in json.loads(body)]
+        else:
+            ids = [doc_id.decode('utf-8') for doc_id in re.findall(rb'<field name="id">(.*?)</field>', body)]
+        num_docs = len(ids)
+        time.sleep(self.server.index_cost * num_docs)
+        with self.server.stats_lock:
+            self.server.updated_ids.update(ids)
+            stats['requests'] += 1
+            stats['docs'] += num_docs
+            stats['bytes'] += len(body)
+            if commit is not None:
+                stats[commit] += 1
+        self._send({'responseHeader': {'status': 0, 'QTime': 1}})
+
+    def _select(self, params):
+        rows = int(params.get('rows', ['10'])[0])
+        # Cursor marks are plain offsets here, Solr encodes the sort values of the last document instead
+        cursor_mark = params.get('cursorMark', [None])[0]
+        if cursor_mark is None:
+            start = int(params.get('start', ['0'])[0])
+            time.sleep(self.server.collect_cost * (start + rows))
+        else:
+            start = 0 if cursor_mark == '*' else int(cursor_mark)
+            time.sleep(self.server.collect_cost * rows)
+        
+        docs = self.server.docs[start:start + rows]
+        response = {
+            'response': {'numFound': len(self.server.docs), 'start': 0 if cursor_mark else start, 'docs': docs},
+            'highlighting': {doc['id']: {'title': doc['title']} for doc in docs},
+        }
+        if cursor_mark is not None:
+            response['nextCursorMark'] = str(start + len(docs)) if docs else cursor_mark
+        if params.get('omitHeader', ['false'])[0] != 'true':
+            response = dict({'responseHeader': {'status': 0, 'QTime': 1}}, **response)
+        self._send(response)
+
+    def _get(self, params):
+        # Ids are comma-separated with commas escaped, as in Solr's real-time get handler
+        ids = [doc_id.replace('\\,', ',') for doc_id in re.split(r'(?<!\\),', params.get('ids', [''])[0])]
+        docs = [self.server.docs_by_id[doc_id] for doc_id in ids if doc_id in self.server.docs_by_id]
+        self._send({'response': {'numFound': len(docs), 'start': 0, 'docs': docs}})
+
+    def _send(self, content, status=200):
+        body = json.dumps(content).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json;charset=utf-8')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+class FakeSolrServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def inject_error(self):
+        """
+        Returns whether the current request should fail, which happens for a fraction error_rate of them.
+        """
+        if self.error_rate <= 0:
+            return False
+        with self.stats_lock:
+            failed = self.random.random() < self.error_rate
+            if failed:
+                self.injected_errors += 1
+        return failed
+
+class FakeSolr(object):
+    """
+    Runs a FakeSolrHandler server on a background thread.
+    A fraction error_rate of the searches, document lookups and schema requests are answered
+    with an error_status error, drawn from a random generator seeded with seed.
+    -------
+    Example Usage:
+        with FakeSolr(cores=['thesis'], latency=0.02) as solr:
+            connection = SolrConnection(solr.url)
+    """
+
+    def __init__(self, cores=('thesis',), latency=0.0, num_docs=1000, port=0, collect_cost=0.0,
+                 hard_commit_cost=0.0, soft_commit_cost=0.0, index_cost=0.0, error_rate=0.0, error_status=500,
+                 seed=0):
+        self.server = FakeSolrServer(('127.0.0.1', port), FakeSolrHandler)
+        self.server.cores = list(cores)
+        self.server.latency = latency
+        self.server.collect_cost = collect_cost
+        self.server.hard_commit_cost = hard_commit_cost
+        self.server.soft_commit_cost = soft_commit_cost
+        self.server.index_cost = index_cost
+        self.server.error_rate = error_rate
+        self.server.error_status = error_status
+        self.server.random = random.Random(seed)
+        self.server.injected_errors = 0
+        self.server.update_stats = {'requests': 0, 'docs': 0, 'bytes': 0, 'hard_commits': 0, 'soft_commits': 0}
+        self.server.updated_ids = set()
+        self.server.stats_lock = threading.Lock()
+        self.server.docs = [make_thesis(i) for i in range(num_docs)]
+        self.server.docs_by_id = {doc['id']: doc for doc in self.server.docs}
+        self.server.index_version = 1
+        self.url = 'http://127.0.0.1:%d/solr' % self.server.server_address[1]
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+
+    def __enter__(self):
+        self.thread.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.server.shutdown()
+        self.server.server_close()
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Serve canned Solr responses.')
+    parser.add_argument('--port', type=int, default=8983)
+    parser.add_argument('--cores', default='thesis', help='Comma-separated core names.')
+    parser.add_argument('--latency', type=float, default=0.0, help='Seconds to wait before each response.')
+    parser.add_argument('--docs', type=int, default=1000, help='Number of documents in every core.')
+    parser.add_argument('--collect-cost', type=float, default=0.0, help='Seconds to wait per collected document.')
+    parser.add_argument('--hard-commit-cost', type=float, default=0.0, help='Seconds to wait per hard commit.')
+    parser.add_argument('--soft-commit-cost', type=float, default=0.0, help='Seconds to wait per soft commit.')
+    parser.add_argument('--index-cost', type=float, default=0.0, help='Seconds to wait per updated document.')
+    parser.add_argument('--error-rate', type=float, default=0.0,
+                        help='Fraction of searches, document lookups and schema requests answered with an error.')
+    parser.add_argument('--error-status', type=int, default=500, help='HTTP status of the injected errors.')
+    args = parser.parse_args()
+
+    with FakeSolr(args.cores.split(','), args.latency, args.docs, args.port, args.collect_cost,
+                  args.hard_commit_cost, args.soft_commit_cost, args.index_cost,
+                  args.error_rate, args.error_status) as solr:
+        print('Fake Solr listening on %s' % solr.url)
+        solr.thread.join()
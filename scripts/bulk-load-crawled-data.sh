@@ -0,0 +1,4 @@
+#!/bin/bash
+
+cd UTDVN_crawler
+python -m UTDVN_crawler.bulk_loader "$@"
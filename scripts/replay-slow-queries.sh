@@ -0,0 +1,4 @@
+#!/bin/bash
+
+cd UTDVN_backend
+python -m UTDVN_database.solr.replay "$@"